@@ -0,0 +1,161 @@
+"""
+Process-wide registry of chat agents, built once per model and tool configuration
+"""
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import httpx
+
+from rate_limits import AsyncRateLimitedTransport, GroqRateLimiter, RateLimitedTransport
+
+AgentKey = Tuple[str, Tuple[str, ...]]
+
+
+class AgentRegistry:
+    """Caches agent executors and shares pooled keep-alive HTTP clients between them"""
+
+    def __init__(
+        self,
+        factory: Callable[..., Any],
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 60.0,
+        rate_limiter: Optional[GroqRateLimiter] = None,
+    ):
+        """
+        Args:
+            factory: Builds an agent, called as factory(model_name, tools=..., http_client=..., http_async_client=...)
+            max_connections: Upper bound on open connections per pooled client
+            max_keepalive_connections: Idle connections kept open for reuse
+            keepalive_expiry: Seconds an idle connection stays in the pool
+            timeout: Request timeout for the pooled clients
+            rate_limiter: Pacing, retry and fallback policy applied to chat completions sent through the pooled clients
+        """
+        self._factory = factory
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._timeout = timeout
+        self._rate_limiter = rate_limiter
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+        self._agents: Dict[AgentKey, Any] = {}
+        self._building: Dict[AgentKey, threading.Event] = {}
+        # Bumped by invalidate(), so a build that was already running doesn't store its stale agent
+        self._generations: Dict[AgentKey, int] = {}
+        self._lock = threading.Lock()
+        # Guards creating the pooled clients, which is slow (SSL context) and happens during builds
+        self._clients_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def http_client(self) -> httpx.Client:
+        with self._clients_lock:
+            if self._http_client is None:
+                transport = httpx.HTTPTransport(limits=self._limits)
+                if self._rate_limiter is not None:
+                    transport = RateLimitedTransport(self._rate_limiter, transport)
+                self._http_client = httpx.Client(transport=transport, timeout=self._timeout)
+        return self._http_client
+
+    @property
+    def http_async_client(self) -> httpx.AsyncClient:
+        with self._clients_lock:
+            if self._http_async_client is None:
+                transport = httpx.AsyncHTTPTransport(limits=self._limits)
+                if self._rate_limiter is not None:
+                    transport = AsyncRateLimitedTransport(self._rate_limiter, transport)
+                self._http_async_client = httpx.AsyncClient(transport=transport, timeout=self._timeout)
+        return self._http_async_client
+
+    def cached(self, model_name: str, tools: Iterable[str] = ("knowledge", "tavily")) -> Optional[Any]:
+        """Return the agent if it is already built, without building it (safe on the event loop)"""
+        with self._lock:
+            agent = self._agents.get((model_name, tuple(tools)))
+            if agent is not None:
+                self.hits += 1
+            return agent
+
+    def get(self, model_name: str, tools: Iterable[str] = ("knowledge", "tavily")) -> Any:
+        """
+        Return the cached agent for this model and tool set, building it on first use
+
+        Building is slow and happens outside the registry lock; concurrent callers for the
+        same key wait for one build. Call through asyncio.to_thread from async code.
+        """
+        key = (model_name, tuple(tools))
+        while True:
+            with self._lock:
+                agent = self._agents.get(key)
+                if agent is not None:
+                    self.hits += 1
+                    return agent
+                building = self._building.get(key)
+                if building is None:
+                    building = self._building[key] = threading.Event()
+                    generation = self._generations.get(key, 0)
+                    self.misses += 1
+                    break
+            building.wait()
+            # The build failed if the agent still isn't there; try it ourselves
+
+        try:
+            agent = self._factory(
+                model_name,
+                tools=key[1],
+                http_client=self.http_client,
+                http_async_client=self.http_async_client,
+            )
+            with self._lock:
+                if self._generations.get(key, 0) == generation:
+                    self._agents[key] = agent
+            return agent
+        finally:
+            with self._lock:
+                self._building.pop(key, None)
+            building.set()
+
+    def warm_up(self, model_names: Iterable[str], tools: Iterable[str] = ("knowledge", "tavily")):
+        """Build agents ahead of the first request so it doesn't pay construction cost"""
+        for model_name in model_names:
+            self.get(model_name, tools)
+
+    def invalidate(self, model_name: Optional[str] = None) -> int:
+        """
+        Drop cached agents so they are rebuilt on next use
+
+        Args:
+            model_name: Only drop agents for this model; drops everything when None
+
+        Returns:
+            Number of agents removed
+        """
+        with self._lock:
+            keys = [key for key in self._agents if model_name is None or key[0] == model_name]
+            for key in keys:
+                del self._agents[key]
+            for key in self._building:
+                if model_name is None or key[0] == model_name:
+                    self._generations[key] = self._generations.get(key, 0) + 1
+            return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "agents": [{"model": model, "tools": list(tools)} for model, tools in self._agents],
+            }
+
+    async def aclose(self):
+        """Close the pooled HTTP clients (call on application shutdown)"""
+        if self._http_async_client is not None:
+            await self._http_async_client.aclose()
+            self._http_async_client = None
+        if self._http_client is not None:
+            self._http_client.close()
+            self._http_client = None
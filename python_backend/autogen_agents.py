@@ -1,8 +1,19 @@
 """
 Autogen Multi-Agent System for Doctor-Resident Medical Debate
 """
+import asyncio
+import contextvars
+import functools
 import os
-from typing import List, Dict, Any
+import re
+import time
+from concurrent.futures import Executor
+from typing import Callable, List, Dict, Any, Optional
+
+import telemetry
+from debate_llm import DebateLLMClient, register_llm_reply
+from debate_memory import CaseMemory, MemoryPolicy, attach_memory, llm_summarizer
+from debate_scheduler import DebateCancelled, DebateControl
 try:
     from autogen import AssistantAgent, UserProxyAgent, GroupChat, GroupChatManager
 except ImportError:
@@ -30,7 +41,7 @@ Debate progression:
 - Start with initial observations and ONE key question
 - Each turn: respond to Resident's answer + ask next question
 - Gradually narrow down the diagnosis through dialogue
-- After ~10-12 exchanges, provide final diagnosis
+- After ~10-12 exchanges, provide final diagnosis on a line starting with "FINAL DIAGNOSIS:"
 - End with: "This is a simulated medical discussion. Please consult a real doctor for confirmation."
 
 IMPORTANT:
@@ -72,28 +83,207 @@ IMPORTANT:
 - React to what the Doctor just said
 """
 
-def create_autogen_config(groq_api_key: str, model: str = "llama-3.3-70b-versatile"):
-    """Create Autogen LLM configuration for Groq"""
-    return {
+DEBATE_SPEAKERS = ["Doctor", "Resident", "Patient"]
+
+# The Doctor's closing line and final-diagnosis marker (see DOCTOR_SYSTEM_PROMPT)
+DISCLAIMER_MARKER = "this is a simulated medical discussion"
+FINAL_DIAGNOSIS_PATTERN = re.compile(r"^\W*final diagnosis\s*:", re.IGNORECASE | re.MULTILINE)
+
+# Speaker selection methods that never ask an LLM who speaks next
+DETERMINISTIC_SELECTION = {"round_robin", "random", "manual"}
+
+def is_debate_over(message: Dict[str, Any]) -> bool:
+    """
+    True once the Doctor gives the final diagnosis or the closing disclaimer
+
+    Only the Doctor's messages count: the Patient's opening message carries the user's
+    symptoms, which may contain either phrase.
+    """
+    if message.get("name") != "Doctor":
+        return False
+    content = message.get("content") or ""
+    if not isinstance(content, str):
+        return False
+    return DISCLAIMER_MARKER in content.lower() or bool(FINAL_DIAGNOSIS_PATTERN.search(content))
+
+def create_autogen_config(
+    groq_api_key: str,
+    model: str = "llama-3.3-70b-versatile",
+    seed: Optional[int] = None,
+    role: Optional[str] = None,
+    role_models: Optional[Dict[str, str]] = None,
+):
+    """
+    Create Autogen LLM configuration for Groq (seed requests reproducible sampling)
+
+    Args:
+        model: Default model
+        role: Agent the configuration is for ("Doctor", "Resident", "Patient")
+        role_models: Model by agent name, overriding model for that agent
+    """
+    if role is not None and role_models:
+        model = role_models.get(role, model)
+    config = {
         "config_list": [
             {
                 "model": model,
                 "api_key": groq_api_key,
                 "api_type": "groq",
-                "base_url": "https://api.groq.com",
+                "base_url": os.getenv("GROQ_API_BASE", "https://api.groq.com"),
             }
         ],
         "temperature": 0.8,
         "max_tokens": 200,  # Limit tokens to force shorter responses
     }
+    if seed is not None:
+        config["seed"] = seed
+    return config
+
+class ObservableGroupChat(GroupChat):
+    """
+    GroupChat that calls on_message for every message as it is appended, and stops
+    the chat between rounds once its DebateControl is cancelled
+    """
+
+    def __init__(
+        self,
+        *args,
+        on_message: Optional[Callable[[Dict[str, Any]], None]] = None,
+        control: Optional[DebateControl] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.on_message = on_message
+        self.control = control
+        self._last_append = time.perf_counter()
+        # Seconds each message took, aligned with self.messages
+        self.turn_seconds: List[float] = []
+
+    def speaker_turn_seconds(self) -> List[float]:
+        """turn_seconds for the Doctor, Resident and Patient messages only"""
+        return [
+            seconds for msg, seconds in zip(self.messages, self.turn_seconds)
+            if msg.get("name") in DEBATE_SPEAKERS
+        ]
+
+    def append(self, message: Dict[str, Any], speaker):
+        super().append(message, speaker)
+        # A turn lasts from the previous message to this one
+        now = time.perf_counter()
+        self.turn_seconds.append(now - self._last_append if len(self.messages) > 1 else 0.0)
+        if len(self.messages) > 1:
+            telemetry.record_debate_turn(speaker.name, now - self._last_append, len(self.messages) - 1)
+        self._last_append = now
+        if self.on_message is not None:
+            self.on_message(self.messages[-1])
+        if self.control is not None:
+            self.control.check()
 
 class MedicalDebateSystem:
     """Manages the Doctor-Resident debate system"""
     
-    def __init__(self, groq_api_key: str, model: str = "llama-3.3-70b-versatile"):
+    def __init__(
+        self,
+        groq_api_key: str,
+        model: str = "llama-3.3-70b-versatile",
+        executor: Optional[Executor] = None,
+        control: Optional[DebateControl] = None,
+        http_client=None,
+        seed: Optional[int] = None,
+        early_termination: bool = True,
+        memory: Optional[Dict[str, Dict[str, Any]]] = None,
+        summary_model: Optional[str] = None,
+        summary_every: int = 4,
+        role_models: Optional[Dict[str, str]] = None,
+    ):
+        """
+        Args:
+            groq_api_key: Groq API key
+            model: Model used by the agents without an entry in role_models (and the manager, if it needs one)
+            executor: Pool the blocking autogen chat runs on (default executor if None)
+            control: Cancellation/deadline signal checked between rounds
+            http_client: Shared (rate-limited) httpx.Client; when given, agents call Groq
+                through DebateLLMClient on it instead of autogen's own client
+            seed: Sampling seed passed to Groq for reproducible debates
+            early_termination: End the chat as soon as the final diagnosis is given
+                (see is_debate_over) instead of running to max_rounds
+            memory: Per-agent memory policy ({"window": 6, "summary": True} by agent name);
+                None sends every agent the whole history
+            summary_model: Model that updates the rolling case summary (default: model)
+            summary_every: Messages aged out of the window before the summary is updated
+            role_models: Model by agent name, e.g. {"Patient": "llama-3.1-8b-instant"} for
+                the short symptom replies
+        """
         self.groq_api_key = groq_api_key
         self.model = model
-        self.llm_config = create_autogen_config(groq_api_key, model)
+        self.executor = executor
+        self.control = control
+        self.http_client = http_client
+        self.early_termination = early_termination
+        self.memory_policies = {name: MemoryPolicy.from_dict(policy) for name, policy in (memory or {}).items()}
+        self.summary_model = summary_model or model
+        self.summary_every = summary_every
+        self.case_memory: Optional[CaseMemory] = None
+        # Why the debate ended early ("deadline", "client disconnected", ...), if it did
+        self.stopped_reason: Optional[str] = None
+        # Seconds each returned message took to generate
+        self.turn_seconds: List[float] = []
+        self.llm_config = create_autogen_config(groq_api_key, model, seed=seed)
+        self.role_models = dict(role_models or {})
+        self.role_configs = {
+            role: create_autogen_config(groq_api_key, model, seed=seed, role=role, role_models=self.role_models)
+            for role in DEBATE_SPEAKERS
+        }
+
+    def create_llm_client(self) -> DebateLLMClient:
+        return DebateLLMClient(
+            self.groq_api_key,
+            os.getenv("GROQ_API_BASE", "https://api.groq.com"),
+            http_client=self.http_client,
+        )
+
+    def attach_llm_client(self, agents, on_turn_start=None, on_delta=None):
+        """Generate the agents' replies through one DebateLLMClient (see register_llm_reply)"""
+        client = self.create_llm_client()
+        for agent in agents:
+            register_llm_reply(
+                agent, client, self.role_configs.get(agent.name, self.llm_config),
+                on_turn_start=on_turn_start, on_delta=on_delta,
+            )
+
+    def attach_memory(self, agents):
+        """Bound each agent's context to its memory policy (see debate_memory)"""
+        if not self.memory_policies:
+            return
+        windows = [policy.window for policy in self.memory_policies.values() if policy.summary]
+        self.case_memory = CaseMemory(
+            llm_summarizer(self.create_llm_client(), self.summary_model),
+            keep_recent=max(windows, default=6),
+            every=self.summary_every,
+            executor=self.executor,
+            control=self.control,
+        )
+        attach_memory(agents, self.case_memory, self.memory_policies)
+
+    def create_manager(self, groupchat: GroupChat) -> GroupChatManager:
+        """
+        Create the group chat manager
+
+        round_robin selection needs no LLM, so the manager only gets an llm_config
+        when the selection method actually asks the model who speaks next.
+        """
+        deterministic = groupchat.speaker_selection_method in DETERMINISTIC_SELECTION
+        return GroupChatManager(
+            groupchat=groupchat,
+            llm_config=False if deterministic else self.llm_config,
+            is_termination_msg=is_debate_over if self.early_termination else None,
+        )
+
+    async def run_blocking(self, fn, *args, **kwargs):
+        """Run a blocking autogen call off the event loop, keeping context variables"""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, functools.partial(context.run, fn, *args, **kwargs))
         
     def create_agents(self):
         """Create Doctor and Resident agents"""
@@ -102,7 +292,7 @@ class MedicalDebateSystem:
         doctor = AssistantAgent(
             name="Doctor",
             system_message=DOCTOR_SYSTEM_PROMPT,
-            llm_config=self.llm_config,
+            llm_config=self.role_configs["Doctor"],
             human_input_mode="NEVER",
         )
         
@@ -110,7 +300,7 @@ class MedicalDebateSystem:
         resident = AssistantAgent(
             name="Resident",
             system_message=RESIDENT_SYSTEM_PROMPT,
-            llm_config=self.llm_config,
+            llm_config=self.role_configs["Resident"],
             human_input_mode="NEVER",
         )
         
@@ -133,7 +323,7 @@ IMPORTANT:
         patient = AssistantAgent(
             name="Patient",
             system_message=patient_prompt,
-            llm_config=self.llm_config,
+            llm_config=self.role_configs["Patient"],
             human_input_mode="NEVER",
         )
         
@@ -151,20 +341,20 @@ IMPORTANT:
             List of messages in the debate
         """
         doctor, resident, patient = self.create_agents()
+        self.attach_memory([doctor, resident, patient])
+        if self.http_client is not None:
+            self.attach_llm_client([doctor, resident, patient])
         
         # Create group chat
-        groupchat = GroupChat(
+        groupchat = ObservableGroupChat(
             agents=[patient, doctor, resident],
             messages=[],
             max_round=max_rounds,
             speaker_selection_method="round_robin",
+            control=self.control,
         )
         
-        # Create group chat manager
-        manager = GroupChatManager(
-            groupchat=groupchat,
-            llm_config=self.llm_config,
-        )
+        manager = self.create_manager(groupchat)
         
         # Initial message from patient
         initial_message = f"""Patient presents with the following symptoms and concerns:
@@ -173,16 +363,28 @@ IMPORTANT:
 
 Doctor, please begin the consultation by analyzing these symptoms and engaging with the Resident to ensure a thorough diagnostic process."""
         
-        # Start the conversation
-        patient.initiate_chat(
-            manager,
-            message=initial_message,
-        )
+        # Start the conversation without blocking the event loop
+        try:
+            await self.run_blocking(
+                patient.initiate_chat,
+                manager,
+                message=initial_message,
+            )
+        except DebateCancelled as e:
+            # Keep the rounds that finished before the stop
+            self.stopped_reason = e.reason
+        finally:
+            if self.case_memory is not None:
+                pending = self.case_memory.close()
+                if pending is not None:
+                    await asyncio.wrap_future(pending)
+            record_autogen_usage([doctor, resident, patient, manager])
+        self.turn_seconds = groupchat.speaker_turn_seconds()
         
         # Extract messages
         debate_messages = []
         for msg in groupchat.messages:
-            if msg.get("name") in ["Doctor", "Resident", "Patient"]:
+            if msg.get("name") in DEBATE_SPEAKERS:
                 debate_messages.append({
                     "role": msg.get("name", "unknown").lower(),
                     "content": msg.get("content", ""),
@@ -191,6 +393,15 @@ Doctor, please begin the consultation by analyzing these symptoms and engaging w
         
         return debate_messages
 
+def record_autogen_usage(agents):
+    """Report token usage accumulated by autogen's own LLM clients to the metrics"""
+    for agent in agents:
+        client = getattr(agent, "client", None)
+        summary = getattr(client, "total_usage_summary", None) or {}
+        for model, usage in summary.items():
+            if isinstance(usage, dict):
+                telemetry.record_tokens(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), model)
+
 def format_debate_for_patient(messages: List[Dict[str, Any]]) -> str:
     """Format the debate messages for patient viewing"""
     formatted = "=== Medical Consultation Transcript ===\n\n"
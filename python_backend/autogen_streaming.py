@@ -3,8 +3,18 @@ Real-time streaming implementation for Autogen debates
 """
 import asyncio
 import re
-from typing import AsyncGenerator, Dict, Any, List
-from autogen_agents import MedicalDebateSystem
+import threading
+import time
+from typing import AsyncGenerator, Callable, Dict, Any, List, Optional
+from autogen_agents import (
+    DEBATE_SPEAKERS,
+    DebateCancelled,
+    DebateControl,
+    MedicalDebateSystem,
+    ObservableGroupChat,
+    record_autogen_usage,
+)
+from telemetry import logger
 
 def split_message_into_bubbles(content: str) -> List[str]:
     """
@@ -40,8 +50,170 @@ def split_message_into_bubbles(content: str) -> List[str]:
     
     return bubbles if bubbles else [content]
 
+class BubbleSplitter:
+    """
+    Incremental counterpart of split_message_into_bubbles: fed streamed text, it
+    returns each sentence as soon as the boundary after it has arrived.
+    """
+
+    _BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, delta: str) -> List[str]:
+        """Add streamed text and return any sentences it completed"""
+        self._buffer += delta
+        parts = self._BOUNDARY.split(self._buffer)
+        # The last part has no boundary after it yet, keep buffering it
+        self._buffer = parts.pop()
+        return [p.strip() for p in parts if p.strip()]
+
+    def flush(self) -> List[str]:
+        """Return whatever is left once the turn is over"""
+        rest, self._buffer = self._buffer.strip(), ""
+        return [rest] if rest else []
+
+class MessageBridge:
+    """
+    Hands messages from the debate worker thread to an asyncio consumer.
+
+    The producer thread never touches the queue directly: items are scheduled onto
+    the event loop with call_soon_threadsafe. A semaphore bounds the number of
+    undelivered items so a slow client applies backpressure to the debate.
+    """
+
+    _DONE = object()
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_pending: int = 32):
+        self._loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._closed = threading.Event()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.is_set()
+
+    def publish(self, item: Any) -> bool:
+        """
+        Called from the worker thread. Blocks while max_pending items are undelivered.
+
+        Returns:
+            False if the consumer has gone away and the item was dropped
+        """
+        while not self._slots.acquire(timeout=0.5):
+            if self.closed:
+                return False
+        if self.closed:
+            self._slots.release()
+            return False
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, (time.perf_counter(), item))
+        except RuntimeError:
+            # Event loop already closed, nobody is listening
+            self._closed.set()
+            return False
+        return True
+
+    def finish(self, error: Optional[BaseException] = None):
+        """Called by the producer once it is done (or failed); wakes the consumer"""
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, (self._DONE, error))
+        except RuntimeError:
+            # Event loop already closed, nobody is listening
+            pass
+
+    def close(self):
+        """Called by the consumer to stop receiving; unblocks a waiting producer"""
+        self._closed.set()
+
+    async def receive(self) -> AsyncGenerator[tuple, None]:
+        """Yield (seconds_since_publish, item) pairs until the producer finishes"""
+        while True:
+            published_at, item = await self._queue.get()
+            if published_at is self._DONE:
+                if item is not None:
+                    raise item
+                return
+            self._slots.release()
+            yield time.perf_counter() - published_at, item
+
+async def replay_debate(
+    messages: List[Dict[str, Any]],
+    turn_seconds: Optional[List[float]] = None,
+    speed: Optional[float] = None,
+    stream_tokens: bool = False,
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Replay a stored debate as the same events a live run would produce
+
+    Args:
+        messages: Stored debate messages
+        turn_seconds: Seconds each message originally took
+        speed: Replay pacing, 1.0 reproduces the original timing, 2.0 is twice as fast;
+            None sends everything immediately
+        stream_tokens: Emit turn_start/bubble/turn_end events instead of whole messages
+    """
+    turn_seconds = turn_seconds or []
+    for i, msg in enumerate(messages):
+        if speed and i < len(turn_seconds) and turn_seconds[i] > 0:
+            await asyncio.sleep(turn_seconds[i] / speed)
+        if not stream_tokens:
+            yield msg
+            continue
+        identity = {"role": msg["role"], "name": msg["name"]}
+        yield {"type": "turn_start", **identity}
+        for bubble in split_message_into_bubbles(msg["content"]):
+            yield {"type": "bubble", **identity, "content": bubble}
+        yield {"type": "turn_end", **identity, "content": msg["content"]}
+
 class StreamingDebateSystem(MedicalDebateSystem):
     """Extended debate system with real-time streaming support"""
+
+    def __init__(
+        self,
+        *args,
+        max_pending: int = 32,
+        stream_tokens: bool = False,
+        **kwargs,
+    ):
+        """
+        Args:
+            max_pending: Undelivered events allowed before the debate thread waits for the client
+            stream_tokens: Emit turn_start/delta/bubble/turn_end events instead of whole messages
+        """
+        super().__init__(*args, **kwargs)
+        self.max_pending = max_pending
+        self.stream_tokens = stream_tokens
+        # Seconds between a message being appended to the GroupChat and being yielded
+        self.delivery_latencies: List[float] = []
+        # Seconds from the start of each streamed turn to its first token
+        self.first_token_latencies: List[float] = []
+
+    def _attach_token_streaming(self, agents, publish: Callable[[Dict[str, Any]], bool]) -> Dict[str, Any]:
+        """
+        Route the agents' replies through a streaming completion.
+
+        Returns:
+            Per-turn state shared with the on_message hook
+        """
+        turn: Dict[str, Any] = {"name": None, "splitter": None, "started": 0.0, "first_token": False}
+
+        def on_turn_start(name: str):
+            turn.update(name=name, splitter=BubbleSplitter(), started=time.perf_counter(), first_token=False)
+            publish({"type": "turn_start", "role": name.lower(), "name": name})
+
+        def on_delta(name: str, delta: str):
+            if not turn["first_token"]:
+                turn["first_token"] = True
+                self.first_token_latencies.append(time.perf_counter() - turn["started"])
+            publish({"type": "delta", "role": name.lower(), "name": name, "content": delta})
+            for bubble in turn["splitter"].feed(delta):
+                publish({"type": "bubble", "role": name.lower(), "name": name, "content": bubble})
+
+        self.attach_llm_client(agents, on_turn_start=on_turn_start, on_delta=on_delta)
+        return turn
     
     async def run_debate_streaming(
         self, 
@@ -59,25 +231,52 @@ class StreamingDebateSystem(MedicalDebateSystem):
             Individual debate messages as they're generated
         """
         doctor, resident, user_proxy = self.create_agents()
+        self.attach_memory([doctor, resident, user_proxy])
+        bridge = MessageBridge(asyncio.get_running_loop(), self.max_pending)
+        if self.control is None:
+            # Lets a disconnecting client stop the debate between rounds
+            self.control = DebateControl()
+        turn = None
+        if self.stream_tokens:
+            turn = self._attach_token_streaming([doctor, resident, user_proxy], bridge.publish)
+        elif self.http_client is not None:
+            self.attach_llm_client([doctor, resident, user_proxy])
         
-        # Create group chat with custom message tracking
-        from autogen import GroupChat, GroupChatManager
+        def on_message(msg: Dict[str, Any]):
+            if msg.get("name") not in DEBATE_SPEAKERS:
+                return
+            name = msg.get("name", "Unknown")
+            content = msg.get("content", "")
+            if turn is None:
+                bridge.publish({
+                    "role": name.lower(),
+                    "content": content,
+                    "name": name
+                })
+                return
+            if turn["name"] == name and turn["splitter"] is not None:
+                # Streamed turn: its deltas and bubbles are out, flush the tail
+                bubbles = turn["splitter"].flush()
+            else:
+                # Not generated by the LLM (e.g. the opening case description)
+                bridge.publish({"type": "turn_start", "role": name.lower(), "name": name})
+                bubbles = split_message_into_bubbles(content)
+            for bubble in bubbles:
+                bridge.publish({"type": "bubble", "role": name.lower(), "name": name, "content": bubble})
+            bridge.publish({"type": "turn_end", "role": name.lower(), "name": name, "content": content})
+            turn.update(name=None, splitter=None)
         
-        groupchat = GroupChat(
+        # Group chat pushes each message to the bridge as soon as it is appended
+        groupchat = ObservableGroupChat(
             agents=[user_proxy, doctor, resident],
             messages=[],
             max_round=max_rounds,
             speaker_selection_method="round_robin",
+            on_message=on_message,
+            control=self.control,
         )
         
-        # Track message count to detect new messages
-        last_message_count = 0
-        
-        # Create manager
-        manager = GroupChatManager(
-            groupchat=groupchat,
-            llm_config=self.llm_config,
-        )
+        manager = self.create_manager(groupchat)
         
         # Initial message
         initial_message = f"""Patient presents with the following symptoms and concerns:
@@ -86,55 +285,48 @@ class StreamingDebateSystem(MedicalDebateSystem):
 
 Doctor, please begin the consultation by analyzing these symptoms and engaging with the Resident to ensure a thorough diagnostic process."""
         
-        # Start conversation in background task
-        async def run_chat():
-            await asyncio.to_thread(
-                user_proxy.initiate_chat,
-                manager,
-                message=initial_message,
-            )
+        def run_chat():
+            error = None
+            try:
+                user_proxy.initiate_chat(
+                    manager,
+                    message=initial_message,
+                )
+            except DebateCancelled as e:
+                self.stopped_reason = e.reason
+            except BaseException as e:
+                error = e
+            finally:
+                if self.case_memory is not None:
+                    # A summary update still running is charged before the usage is reported
+                    pending = self.case_memory.close()
+                    if pending is not None:
+                        pending.result()
+                record_autogen_usage([doctor, resident, user_proxy, manager])
+                self.turn_seconds = groupchat.speaker_turn_seconds()
+                bridge.finish(error)
         
-        # Start the chat task
-        chat_task = asyncio.create_task(run_chat())
+        # Start conversation in a worker thread; messages arrive through the bridge
+        chat_task = asyncio.ensure_future(self.run_blocking(run_chat))
         
-        # Stream messages as they appear
+        finished = False
         try:
-            while not chat_task.done():
-                await asyncio.sleep(0.3)  # Check for new messages frequently
-                
-                # Check for new messages
-                current_count = len(groupchat.messages)
-                if current_count > last_message_count:
-                    # New messages available
-                    for i in range(last_message_count, current_count):
-                        msg = groupchat.messages[i]
-                        if msg.get("name") in ["Doctor", "Resident", "Patient"]:
-                            # Stream complete message as single bubble
-                            content = msg.get("content", "")
-                            yield {
-                                "role": msg.get("name", "unknown").lower(),
-                                "content": content,
-                                "name": msg.get("name", "Unknown")
-                            }
-                    last_message_count = current_count
-            
-            # Wait for chat to complete
+            async for latency, msg in bridge.receive():
+                self.delivery_latencies.append(latency)
+                yield msg
             await chat_task
+            finished = True
             
-            # Stream any remaining messages
-            current_count = len(groupchat.messages)
-            if current_count > last_message_count:
-                for i in range(last_message_count, current_count):
-                    msg = groupchat.messages[i]
-                    if msg.get("name") in ["Doctor", "Resident", "Patient"]:
-                        # Stream complete message as single bubble
-                        content = msg.get("content", "")
-                        yield {
-                            "role": msg.get("name", "unknown").lower(),
-                            "content": content,
-                            "name": msg.get("name", "Unknown")
-                        }
+            if self.stopped_reason:
+                yield {"type": "stopped", "reason": self.stopped_reason}
         
-        except Exception as e:
-            print(f"Streaming error: {e}")
+        except Exception:
+            logger.exception("Streaming error")
             raise
+        
+        finally:
+            # Client went away or the debate ended: never leave the worker blocked on us,
+            # and stop paying for rounds nobody will read
+            if not finished:
+                self.control.cancel("client disconnected")
+            bridge.close()
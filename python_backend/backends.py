@@ -0,0 +1,87 @@
+"""
+Backend selection for the LLM and search providers.
+
+LLM_BACKEND / SEARCH_BACKEND choose between the real services ("groq", "tavily") and
+the deterministic local stand-ins in fake_backends ("fake"), so the app can be run
+and benchmarked without API keys.
+"""
+import os
+from typing import Optional
+
+from config import settings
+from prompts import SEARCH_TRIGGER_TERMS
+
+
+def use_fake_llm() -> bool:
+    return settings.LLM_BACKEND == "fake"
+
+
+def use_fake_search() -> bool:
+    return settings.SEARCH_BACKEND == "fake"
+
+
+def create_chat_model(
+    model_name: str,
+    temperature: float,
+    http_client=None,
+    http_async_client=None,
+    max_retries: int = 2,
+):
+    """
+    ChatGroq, or a FakeChatModel with the configured latency profile
+
+    Pass max_retries=0 with rate-limited http clients, which already retry and fail over.
+    """
+    if use_fake_llm():
+        from fake_backends import FakeChatModel
+
+        return FakeChatModel(
+            model_name=model_name,
+            temperature=temperature,
+            latency=settings.FAKE_LLM_LATENCY,
+            tokens_per_second=settings.FAKE_LLM_TOKENS_PER_SECOND,
+            search_triggers=SEARCH_TRIGGER_TERMS,
+            unsafe_terms=settings.FAKE_GUARD_UNSAFE_TERMS,
+        )
+    # Deferred: langchain_groq is slow to import and only needed once a model is built
+    from langchain_groq import ChatGroq
+
+    return ChatGroq(
+        api_key=os.getenv("GROQ_API_KEY"),
+        model=model_name,
+        temperature=temperature,
+        http_client=http_client,
+        http_async_client=http_async_client,
+        max_retries=max_retries,
+    )
+
+
+def create_search_api_wrapper():
+    """A FakeTavilyAPIWrapper when SEARCH_BACKEND is fake, otherwise None (Tavily's default)"""
+    if not use_fake_search():
+        return None
+    from fake_backends import FakeTavilyAPIWrapper
+
+    return FakeTavilyAPIWrapper(tavily_api_key="fake", latency=settings.FAKE_SEARCH_LATENCY)
+
+
+def start_fake_groq_endpoint() -> Optional[object]:
+    """
+    Serve the autogen debate agents from a local FakeGroqServer when LLM_BACKEND is fake.
+
+    Returns:
+        The running server (stop it on shutdown), or None for the real backend
+    """
+    if not use_fake_llm():
+        return None
+    from fake_backends import FakeGroqServer
+
+    server = FakeGroqServer(
+        latency=settings.FAKE_LLM_LATENCY,
+        tokens_per_second=settings.FAKE_LLM_TOKENS_PER_SECOND,
+        final_after=settings.FAKE_DEBATE_FINAL_AFTER,
+        model_profiles=settings.FAKE_LLM_MODEL_PROFILES,
+    ).start()
+    os.environ["GROQ_API_BASE"] = server.base_url
+    os.environ.setdefault("GROQ_API_KEY", "fake")
+    return server
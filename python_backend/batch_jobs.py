@@ -0,0 +1,295 @@
+"""
+Batch case-simulation jobs: many symptom vignettes run through the debate system in parallel
+
+Each job lives in its own directory:
+- job.json: the cases and settings, rewritten when the job's status changes
+- transcripts.jsonl: one compact line per finished case (completed or failed)
+
+A case counts as done once a "completed" line for it exists, so a job that was cancelled,
+partially failed or interrupted by a restart can be resumed without re-running those cases.
+
+Every case runs under its own token budget, charged to the tenant that submitted the job.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import token_budget
+from debate_scheduler import DebateCancelled, DebateControl
+from telemetry import logger
+from token_budget import RequestBudget, TenantQuotaExceeded
+
+# run_case(symptoms, model, max_rounds, control) -> (messages, stopped_reason)
+CaseRunner = Callable[[str, str, int, DebateControl], Awaitable[Tuple[List[Dict[str, Any]], Optional[str]]]]
+
+# start_budget(tenant) -> the budget one case runs under; raises to refuse the case
+BudgetStarter = Callable[[str], RequestBudget]
+
+FINISHED = {"completed", "completed_with_errors", "cancelled", "interrupted"}
+
+# Debates stopped for these reasons are kept; any other stop runs again on resume
+KEPT_STOPS = {None, "deadline", "prompt token budget", "completion token budget"}
+
+
+class BatchJob:
+    """Progress of one batch; case results themselves are only kept on disk"""
+
+    def __init__(
+        self, job_id: str, directory: str, cases: List[str], model: str, max_rounds: int, tenant: str = "anonymous"
+    ):
+        self.id = job_id
+        self.directory = directory
+        self.cases = cases
+        self.model = model
+        self.max_rounds = max_rounds
+        self.tenant = tenant
+        self.created_at = time.time()
+        self.status = "queued"
+        # Case index -> "running" / "completed" / "failed"
+        self.case_status: Dict[int, str] = {}
+        self.events: List[Dict[str, Any]] = []
+        self.controls: Dict[int, DebateControl] = {}
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+        # Appends come from worker threads; a long transcript line may take several writes
+        self._append_lock = threading.Lock()
+
+    @property
+    def transcript_path(self) -> str:
+        return os.path.join(self.directory, "transcripts.jsonl")
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.directory, "job.json")
+
+    def counts(self) -> Dict[str, int]:
+        statuses = list(self.case_status.values())
+        return {
+            "total": len(self.cases),
+            "completed": statuses.count("completed"),
+            "failed": statuses.count("failed"),
+            "running": statuses.count("running"),
+        }
+
+    def pending(self) -> List[int]:
+        return [i for i in range(len(self.cases)) if self.case_status.get(i) != "completed"]
+
+    def emit(self, event: Dict[str, Any]):
+        self.events.append(event)
+        self._changed.set()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "model": self.model,
+            "max_rounds": self.max_rounds,
+            "tenant": self.tenant,
+            "created_at": self.created_at,
+            **self.counts(),
+        }
+
+    def save(self):
+        with open(self.meta_path, "w") as meta:
+            json.dump({
+                "job_id": self.id,
+                "cases": self.cases,
+                "model": self.model,
+                "max_rounds": self.max_rounds,
+                "tenant": self.tenant,
+                "created_at": self.created_at,
+                "status": self.status,
+            }, meta)
+
+    def append_transcript(self, record: Dict[str, Any]):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._append_lock, open(self.transcript_path, "a") as out:
+            out.write(line)
+
+    async def watch(self) -> AsyncGenerator[Dict[str, Any], None]:
+        """Yield every event (past ones first) until the job finishes"""
+        seen = 0
+        while True:
+            while seen < len(self.events):
+                seen += 1
+                yield self.events[seen - 1]
+            if self.status in FINISHED and (self.task is None or self.task.done()):
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+
+class BatchJobManager:
+    """Creates, runs, resumes and cancels batch jobs stored under one directory"""
+
+    def __init__(
+        self,
+        directory: str,
+        run_case: CaseRunner,
+        start_budget: BudgetStarter,
+        max_parallel: int = 2,
+        deadline_seconds: Optional[float] = None,
+    ):
+        """
+        Args:
+            directory: Where job directories are kept
+            run_case: Runs one debate (see CaseRunner); the rate budget is enforced there
+            start_budget: Admits the job's tenant and returns a new budget for one case
+            max_parallel: Cases of one job running at the same time
+            deadline_seconds: Per-case limit, including time waiting for a debate slot
+        """
+        self.directory = directory
+        self.run_case = run_case
+        self.start_budget = start_budget
+        self.max_parallel = max_parallel
+        self.deadline_seconds = deadline_seconds
+        self.jobs: Dict[str, BatchJob] = {}
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Pick up jobs from earlier runs; unfinished ones are marked interrupted"""
+        for job_id in sorted(os.listdir(self.directory)):
+            meta_path = os.path.join(self.directory, job_id, "job.json")
+            if not os.path.exists(meta_path):
+                continue
+            try:
+                with open(meta_path) as meta:
+                    data = json.load(meta)
+            except (OSError, ValueError):
+                logger.warning("Skipping unreadable batch job", extra={"job_id": job_id})
+                continue
+            job = BatchJob(
+                job_id, os.path.dirname(meta_path), data["cases"], data["model"], data["max_rounds"],
+                data.get("tenant", "anonymous"),
+            )
+            job.created_at = data.get("created_at", job.created_at)
+            job.case_status = self._read_statuses(job)
+            job.status = data.get("status", "interrupted")
+            if job.status not in FINISHED:
+                job.status = "interrupted"
+            self.jobs[job_id] = job
+
+    @staticmethod
+    def _read_statuses(job: BatchJob) -> Dict[int, str]:
+        statuses: Dict[int, str] = {}
+        if not os.path.exists(job.transcript_path):
+            return statuses
+        with open(job.transcript_path) as transcripts:
+            for line in transcripts:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash; that case simply runs again
+                    continue
+                if statuses.get(record["index"]) != "completed":
+                    statuses[record["index"]] = record["status"]
+        return statuses
+
+    def create(self, cases: List[str], model: str, max_rounds: int, tenant: str = "anonymous") -> BatchJob:
+        job_id = uuid.uuid4().hex
+        directory = os.path.join(self.directory, job_id)
+        os.makedirs(directory)
+        job = BatchJob(job_id, directory, cases, model, max_rounds, tenant)
+        job.save()
+        self.jobs[job_id] = job
+        self._start(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        return self.jobs.get(job_id)
+
+    def resume(self, job: BatchJob) -> int:
+        """Run the cases that have not completed yet; returns how many"""
+        if job.task is not None and not job.task.done():
+            return 0
+        pending = len(job.pending())
+        if pending:
+            self._start(job)
+        return pending
+
+    def cancel(self, job: BatchJob):
+        """Stop the job: queued cases are skipped, running debates stop between rounds"""
+        if job.task is None or job.task.done():
+            return
+        job.status = "cancelled"
+        for control in job.controls.values():
+            control.cancel("job cancelled")
+        job.save()
+        job.emit({"type": "job", **job.summary()})
+
+    def _start(self, job: BatchJob):
+        job.status = "running"
+        job.save()
+        job.emit({"type": "job", **job.summary()})
+        job.task = asyncio.create_task(self._run(job))
+
+    async def _run(self, job: BatchJob):
+        slots = asyncio.Semaphore(self.max_parallel)
+
+        async def run_one(index: int):
+            async with slots:
+                if job.status == "cancelled":
+                    return
+                await self._run_case(job, index)
+
+        await asyncio.gather(*(run_one(i) for i in job.pending()))
+        if job.status != "cancelled":
+            job.status = "completed" if not job.pending() else "completed_with_errors"
+        await asyncio.to_thread(job.save)
+        job.emit({"type": "job", **job.summary()})
+
+    async def _run_case(self, job: BatchJob, index: int):
+        job.case_status[index] = "running"
+        job.emit({"type": "case", "index": index, "status": "running"})
+        started = time.perf_counter()
+        record: Dict[str, Any] = {"index": index, "symptoms": job.cases[index]}
+        budget = None
+        try:
+            # Each case runs in its own task (see _run), so the budget is this case's only
+            budget = self.start_budget(job.tenant)
+            token_budget.use(budget)
+            control = DebateControl(self.deadline_seconds, budget=budget)
+            job.controls[index] = control
+            messages, stopped_reason = await self.run_case(job.cases[index], job.model, job.max_rounds, control)
+            # A debate cut off by its deadline or budget is kept; one stopped by a cancel runs again on resume
+            status = "completed" if stopped_reason in KEPT_STOPS else "failed"
+            record.update(status=status, stopped_reason=stopped_reason, messages=messages)
+            if status == "failed":
+                record["error"] = f"stopped: {stopped_reason}"
+        except DebateCancelled as e:
+            record.update(status="failed", error=f"not started: {e.reason}")
+        except TenantQuotaExceeded as e:
+            record.update(status="failed", error=e.detail)
+        except Exception as e:
+            logger.exception("Batch case failed", extra={"job_id": job.id, "index": index})
+            record.update(status="failed", error=str(e))
+        finally:
+            job.controls.pop(index, None)
+        record["seconds"] = round(time.perf_counter() - started, 2)
+        if budget is not None:
+            record["usage"] = budget.usage()
+        await asyncio.to_thread(job.append_transcript, record)
+        job.case_status[index] = record["status"]
+        job.emit({
+            "type": "case",
+            "index": index,
+            "status": record["status"],
+            "seconds": record["seconds"],
+            **({"error": record["error"]} if "error" in record else {}),
+            **job.counts(),
+        })
+
+    async def shutdown(self):
+        """Stop running jobs on application shutdown; they can be resumed after a restart"""
+        for job in self.jobs.values():
+            if job.task is not None and not job.task.done():
+                for control in job.controls.values():
+                    control.cancel("shutdown")
+                job.task.cancel()
+                job.status = "interrupted"
+                job.save()
@@ -0,0 +1,65 @@
+"""
+Per-request overhead of building the /chat agent vs reusing it from the registry.
+
+Runs against the local fake Groq endpoint, so no API keys or network are needed:
+
+    cd python_backend
+    python benchmarks/bench_agent_registry.py --requests 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fake_backends import FakeGroqServer
+
+
+async def run(label, get_agent, requests):
+    from langchain.agents import AgentExecutor
+
+    timings = []
+    for i in range(requests):
+        started = time.perf_counter()
+        executor = get_agent()
+        if isinstance(executor, AgentExecutor):
+            await executor.ainvoke({"input": f"Define tachycardia ({i})", "chat_history": []})
+        else:
+            await executor.ainvoke(f"Define tachycardia ({i})")
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    print(
+        f"{label:<10} mean={statistics.mean(timings):7.2f} ms  "
+        f"p50={timings[len(timings) // 2]:7.2f} ms  "
+        f"p95={timings[int(len(timings) * 0.95) - 1]:7.2f} ms"
+    )
+    return statistics.mean(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--model", default="llama-3.3-70b-versatile")
+    args = parser.parse_args()
+
+    with FakeGroqServer() as server:
+        os.environ["GROQ_API_BASE"] = server.base_url
+        os.environ.setdefault("GROQ_API_KEY", "fake-key")
+        os.environ.setdefault("TAVILY_API_KEY", "fake-key")
+
+        import main as backend
+
+        async def compare():
+            before = await run("per-call", lambda: backend.create_medical_agent(args.model), args.requests)
+            after = await run("registry", lambda: backend.agent_registry.get(args.model), args.requests)
+            print(f"saved {before - after:.2f} ms per request; registry stats: {backend.agent_registry.stats()}")
+            await backend.agent_registry.aclose()
+
+        asyncio.run(compare())
+
+
+if __name__ == "__main__":
+    main()
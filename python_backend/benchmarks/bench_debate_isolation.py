@@ -0,0 +1,89 @@
+"""
+/models and /chat latency while N /arena/debate requests are running.
+
+Before debates went through the scheduler, /arena/debate ran initiate_chat on the
+event loop and every other request stalled for the length of the debate. Runs the
+app in-process against the local fake Groq endpoint:
+
+    cd python_backend
+    python benchmarks/bench_debate_isolation.py --debates 4 --probes 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fake_backends import FakeGroqServer
+
+
+async def probe(client, count: int):
+    """Latency (ms) of alternating /models and /chat requests"""
+    timings = {"/models": [], "/chat": []}
+    for i in range(count):
+        started = time.perf_counter()
+        await client.get("/models")
+        timings["/models"].append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await client.post("/chat", json={
+            "messages": [{"role": "user", "content": f"Define bradycardia ({i})"}],
+            "cache": False,
+        })
+        timings["/chat"].append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(label, timings):
+    for path, samples in timings.items():
+        samples.sort()
+        print(
+            f"{label:<15} {path:<8} p50={samples[len(samples) // 2]:8.1f} ms  "
+            f"p95={samples[int(len(samples) * 0.95) - 1]:8.1f} ms  max={samples[-1]:8.1f} ms"
+        )
+
+
+async def run(debates: int, probes: int, rounds: int):
+    import httpx
+    import main as backend
+
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=600) as client:
+        report("idle", await probe(client, probes))
+
+        started = time.perf_counter()
+        running = [
+            asyncio.create_task(client.post("/arena/debate", json={
+                "symptoms": "Productive cough, fever and pleuritic chest pain",
+                "max_rounds": rounds,
+            }))
+            for _ in range(debates)
+        ]
+        await asyncio.sleep(0.2)
+        report(f"{debates} debates", await probe(client, probes))
+        responses = await asyncio.gather(*running)
+        print(
+            f"debates: {[r.status_code for r in responses]} in {time.perf_counter() - started:.1f} s; "
+            f"scheduler {backend.debate_scheduler.stats()}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--debates", type=int, default=4)
+    parser.add_argument("--probes", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake LLM latency per call (s)")
+    args = parser.parse_args()
+
+    with FakeGroqServer(latency=args.latency) as server:
+        os.environ["GROQ_API_BASE"] = server.base_url
+        os.environ.setdefault("GROQ_API_KEY", "fake-key")
+        os.environ.setdefault("TAVILY_API_KEY", "fake-key")
+        asyncio.run(run(args.debates, args.probes, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Prompt tokens and turn latency by round, whole history vs bounded debate memory.
+
+The fake Groq endpoint charges prefill time per prompt token (--prompt-tps), so a prompt
+that grows every round also makes late turns slower. Early termination is off so every
+debate runs the full --rounds. Summary updates go to a separate model and are reported
+on their own:
+
+    cd python_backend
+    python benchmarks/bench_debate_memory.py --rounds 25 --prompt-tps 20000
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fake_backends import FakeGroqServer
+
+MODEL = "llama-3.3-70b-versatile"
+SYMPTOMS = "Fever, productive cough and right-sided pleuritic chest pain for four days"
+
+
+async def run(server: FakeGroqServer, rounds: int, memory):
+    from autogen_agents import MedicalDebateSystem
+    from config import settings
+
+    server.prompt_log.clear()
+    debate = MedicalDebateSystem(
+        "fake-key",
+        MODEL,
+        early_termination=False,
+        memory=memory,
+        summary_model=settings.DEBATE_SUMMARY_MODEL,
+        summary_every=settings.DEBATE_SUMMARY_EVERY,
+    )
+    await debate.run_debate(SYMPTOMS, rounds)
+    turns = [tokens for model, tokens in server.prompt_log if model == MODEL]
+    summaries = [tokens for model, tokens in server.prompt_log if model != MODEL]
+    # The opening message is not generated, so turn i is the i-th LLM call
+    return turns, debate.turn_seconds[1:], summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=25)
+    parser.add_argument("--latency", type=float, default=0.02, help="fake time before the first token (s)")
+    parser.add_argument("--prompt-tps", type=float, default=20000, help="fake prefill speed (prompt tokens/s)")
+    args = parser.parse_args()
+
+    with FakeGroqServer(latency=args.latency, prompt_tokens_per_second=args.prompt_tps) as server:
+        os.environ["GROQ_API_BASE"] = server.base_url
+        os.environ.setdefault("GROQ_API_KEY", "fake-key")
+        os.environ.setdefault("TAVILY_API_KEY", "fake-key")
+        from config import settings
+        full_tokens, full_seconds, _ = asyncio.run(run(server, args.rounds, None))
+        bounded_tokens, bounded_seconds, summaries = asyncio.run(run(server, args.rounds, settings.DEBATE_MEMORY))
+
+    print(f"{'turn':>4}  {'full tokens':>11}  {'bounded tokens':>14}  {'full ms':>8}  {'bounded ms':>10}")
+    for i in range(min(len(full_tokens), len(bounded_tokens))):
+        print(
+            f"{i + 1:>4}  {full_tokens[i]:>11}  {bounded_tokens[i]:>14}  "
+            f"{full_seconds[i] * 1000:>8.1f}  {bounded_seconds[i] * 1000:>10.1f}"
+        )
+    print(
+        f"total prompt tokens: full={sum(full_tokens)}  bounded={sum(bounded_tokens)} "
+        f"(+{sum(summaries)} in {len(summaries)} summary updates on {settings.DEBATE_SUMMARY_MODEL})"
+    )
+    print(f"total turn time:     full={sum(full_seconds):.2f} s  bounded={sum(bounded_seconds):.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Wall time per debate and per speaker turn for different per-role model assignments.
+
+The fake Groq endpoint gets a latency profile per model: the large model starts later and
+streams slower than llama-3.1-8b-instant, roughly like Groq. Each assignment runs the
+same debates; calls per model show how much load moves off the large model:
+
+    cd python_backend
+    python benchmarks/bench_debate_role_models.py --rounds 12 --debates 3
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fake_backends import FakeGroqServer
+
+SYMPTOMS = "Crushing chest pain radiating to the left arm for two hours, sweating"
+LARGE = "llama-3.3-70b-versatile"
+SMALL = "llama-3.1-8b-instant"
+
+ASSIGNMENTS = {
+    "all large": {},
+    "patient small": {"Patient": SMALL},
+    "patient+resident small": {"Patient": SMALL, "Resident": SMALL},
+}
+
+
+async def run(label: str, role_models, server: FakeGroqServer, args):
+    from autogen_agents import MedicalDebateSystem
+
+    walls, turns = [], defaultdict(list)
+    calls_before = dict(server.calls_by_model)
+    for _ in range(args.debates):
+        debate = MedicalDebateSystem("fake-key", LARGE, role_models=role_models, early_termination=False)
+        started = time.perf_counter()
+        messages = await debate.run_debate(SYMPTOMS, args.rounds)
+        walls.append(time.perf_counter() - started)
+        for msg, seconds in zip(messages[1:], debate.turn_seconds[1:]):
+            turns[msg["name"]].append(seconds)
+    calls = {model: count - calls_before.get(model, 0) for model, count in server.calls_by_model.items()}
+    per_turn = "  ".join(f"{name}={statistics.mean(s) * 1000:4.0f}ms" for name, s in sorted(turns.items()))
+    print(
+        f"{label:<24} wall/debate={statistics.mean(walls):6.2f} s  {per_turn}  "
+        f"calls: large={calls.get(LARGE, 0)} small={calls.get(SMALL, 0)}"
+    )
+    return statistics.mean(walls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=12, help="max_round of the group chat")
+    parser.add_argument("--debates", type=int, default=3)
+    parser.add_argument("--large-latency", type=float, default=0.35, help="large model: time before the first token (s)")
+    parser.add_argument("--large-tps", type=float, default=250, help="large model: tokens per second")
+    parser.add_argument("--small-latency", type=float, default=0.08)
+    parser.add_argument("--small-tps", type=float, default=750)
+    args = parser.parse_args()
+
+    profiles = {
+        LARGE: {"latency": args.large_latency, "tokens_per_second": args.large_tps},
+        SMALL: {"latency": args.small_latency, "tokens_per_second": args.small_tps},
+    }
+    with FakeGroqServer(model_profiles=profiles) as server:
+        os.environ["GROQ_API_BASE"] = server.base_url
+        baseline = None
+        for label, role_models in ASSIGNMENTS.items():
+            wall = asyncio.run(run(label, role_models, server, args))
+            baseline = baseline or wall
+            if wall != baseline:
+                print(f"{'':<24} {1 - wall / baseline:.0%} less wall time than all large")
+
+
+if __name__ == "__main__":
+    main()
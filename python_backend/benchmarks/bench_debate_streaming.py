@@ -0,0 +1,55 @@
+"""
+Time from a debate message being appended to the GroupChat to it being emitted as SSE.
+
+The previous implementation polled every 0.3 s, so each message waited 0-300 ms
+(150 ms on average) before it was emitted. Runs against the local fake Groq endpoint:
+
+    cd python_backend
+    python benchmarks/bench_debate_streaming.py --rounds 12 --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fake_backends import FakeGroqServer
+
+
+async def run(rounds: int):
+    from autogen_streaming import StreamingDebateSystem
+
+    debate = StreamingDebateSystem("fake-key", "llama-3.3-70b-versatile")
+    emitted = 0
+    started = time.perf_counter()
+    async for msg in debate.run_debate_streaming("Fever and stiff neck for two days", rounds):
+        # Same serialization the endpoint does before writing the frame
+        f"data: {json.dumps(msg)}\n\n"
+        emitted += 1
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency * 1000 for latency in debate.delivery_latencies)
+    print(f"messages={emitted} wall={elapsed:.2f} s")
+    print(
+        f"append->emit mean={statistics.mean(latencies):.3f} ms  "
+        f"p50={latencies[len(latencies) // 2]:.3f} ms  max={latencies[-1]:.3f} ms"
+    )
+    print("polling baseline: mean ~150 ms, max 300 ms per message")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake LLM latency per call (s)")
+    args = parser.parse_args()
+
+    with FakeGroqServer(latency=args.latency) as server:
+        os.environ["GROQ_API_BASE"] = server.base_url
+        asyncio.run(run(args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+LLM calls and wall time per debate with and without early termination.
+
+The fake Groq endpoint gives the final diagnosis (with the closing disclaimer) once the
+conversation reaches --final-after messages, like the Doctor prompt asks for. Before: the
+chat runs on to max_rounds and the manager is built with a full llm_config. After: the chat
+stops at the final diagnosis and the round_robin manager has no LLM at all:
+
+    cd python_backend
+    python benchmarks/bench_debate_termination.py --rounds 25 --final-after 12
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fake_backends import FakeGroqServer
+
+SYMPTOMS = "Crushing chest pain radiating to the left arm for two hours, sweating"
+
+
+def legacy_system_class():
+    from autogen_agents import GroupChatManager, MedicalDebateSystem
+
+    class LegacyDebateSystem(MedicalDebateSystem):
+        """Previous behaviour: no termination check, manager with an LLM it never uses"""
+
+        def create_manager(self, groupchat):
+            return GroupChatManager(groupchat=groupchat, llm_config=self.llm_config)
+
+    return LegacyDebateSystem
+
+
+async def run(label: str, system_class, server: FakeGroqServer, args):
+    calls, seconds, messages = [], [], []
+    for _ in range(args.debates):
+        before = server.calls
+        debate = system_class("fake-key", "llama-3.3-70b-versatile")
+        started = time.perf_counter()
+        result = await debate.run_debate(SYMPTOMS, args.rounds)
+        seconds.append(time.perf_counter() - started)
+        calls.append(server.calls - before)
+        messages.append(len(result))
+    print(
+        f"{label:<8} llm_calls/debate={sum(calls) / len(calls):5.1f}  "
+        f"messages/debate={sum(messages) / len(messages):5.1f}  "
+        f"wall/debate={sum(seconds) / len(seconds):6.2f} s"
+    )
+    return sum(calls) / len(calls), sum(seconds) / len(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=25, help="max_round of the group chat")
+    parser.add_argument("--final-after", type=int, default=12, help="messages before the final diagnosis")
+    parser.add_argument("--debates", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake LLM latency per call (s)")
+    args = parser.parse_args()
+
+    from autogen_agents import MedicalDebateSystem
+
+    with FakeGroqServer(latency=args.latency, final_after=args.final_after) as server:
+        os.environ["GROQ_API_BASE"] = server.base_url
+        before_calls, before_wall = asyncio.run(run("before", legacy_system_class(), server, args))
+        after_calls, after_wall = asyncio.run(run("after", MedicalDebateSystem, server, args))
+    print(
+        f"saved {before_calls - after_calls:.1f} LLM calls "
+        f"({1 - after_calls / before_calls:.0%}) and {before_wall - after_wall:.2f} s per debate"
+    )
+
+
+if __name__ == "__main__":
+    main()
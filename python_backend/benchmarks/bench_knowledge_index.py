@@ -0,0 +1,131 @@
+"""
+Build time, query latency and memory footprint of the offline reference index.
+
+A synthetic corpus (Zipf-distributed medical-style vocabulary) is indexed, then:
+1. full build: documents/s, passages, index size on disk
+2. incremental add of new documents, and a re-add of unchanged ones (skipped by digest)
+3. a fresh process opens the index and runs queries, with and without mmap: time to open,
+   fastest, p50 and p95 query latency, and RSS growth split into private memory and mapped
+   file pages (shared by every worker through the page cache, and reclaimable)
+
+For scale, a Tavily advanced search is a network round trip of roughly a second or more.
+
+    cd python_backend
+    python benchmarks/bench_knowledge_index.py --docs 20000 --queries 500
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from knowledge_index import KnowledgeIndex  # noqa: E402
+
+SYLLABLES = ["car", "dio", "neph", "ro", "hep", "at", "gast", "ric", "pul", "mon", "neu", "lol", "pril",
+             "sar", "tan", "mab", "cil", "lin", "my", "cin", "osis", "itis", "emia", "algia", "derm", "oma"]
+
+
+def vocabulary(size: int, rng: random.Random):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def corpus(count: int, words, rng: random.Random, start: int = 0, doc_words: int = 400):
+    # Zipf-like weights so a few terms are common and most are rare, as in real text
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(words))))
+    for i in range(start, start + count):
+        text = " ".join(rng.choices(words, cum_weights=cum_weights, k=doc_words))
+        yield {"source": f"doc-{i}.md", "title": " ".join(rng.choices(words, k=3)), "text": text}
+
+
+def rss_kb(field: str) -> int:
+    """RssAnon (private heap) or RssFile (file pages, shared through the page cache), in kB"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def probe(path: str, mmap_mb: int, queries: int, seed: int):
+    """Runs in a fresh process: open the index and query it"""
+    rng = random.Random(seed)
+    words = vocabulary(20000, random.Random(0))
+    anon, file = rss_kb("RssAnon"), rss_kb("RssFile")
+    started = time.perf_counter()
+    index = KnowledgeIndex(path, mmap_bytes=mmap_mb * 1024 * 1024)
+    opened = time.perf_counter() - started
+    latencies = []
+    for _ in range(queries):
+        query = " ".join(rng.choices(words[:5000], k=rng.randint(2, 6)))
+        started = time.perf_counter()
+        index.search(query, 4)
+        latencies.append(time.perf_counter() - started)
+    latencies_ms = sorted(1000 * s for s in latencies)
+    print(
+        f"{opened * 1000:.1f} {latencies_ms[0]:.2f} {statistics.median(latencies_ms):.2f} "
+        f"{latencies_ms[int(0.95 * (len(latencies_ms) - 1))]:.2f} "
+        f"{(rss_kb('RssAnon') - anon) / 1024:.1f} {(rss_kb('RssFile') - file) / 1024:.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--add", type=int, default=500, help="documents added incrementally afterwards")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--probe", nargs=2, metavar=("PATH", "MMAP_MB"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.probe:
+        probe(args.probe[0], int(args.probe[1]), args.queries, seed=1)
+        return
+
+    words = vocabulary(20000, random.Random(0))
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "knowledge.db")
+        index = KnowledgeIndex(path)
+
+        started = time.perf_counter()
+        counts = index.add_documents(corpus(args.docs, words, rng))
+        built = time.perf_counter() - started
+        started = time.perf_counter()
+        index.optimize()
+        optimized = time.perf_counter() - started
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        print(f"build        docs={args.docs}  passages={counts['passages']}  {built:.2f} s  "
+              f"({args.docs / built:.0f} docs/s)  optimize {optimized:.2f} s  size={size_mb:.1f} MB")
+
+        started = time.perf_counter()
+        counts = index.add_documents(corpus(args.add, words, rng, start=args.docs))
+        added = time.perf_counter() - started
+        started = time.perf_counter()
+        unchanged = index.add_documents(corpus(args.add, words, random.Random(1), start=0))
+        readded = time.perf_counter() - started
+        print(f"incremental  +{counts['indexed']} docs in {added * 1000:.0f} ms  "
+              f"({added / max(1, args.add) * 1000:.2f} ms/doc)  re-add of {args.add}: "
+              f"{unchanged['unchanged']} unchanged in {readded * 1000:.0f} ms")
+        index.close()
+
+        print(f"query ({args.queries} queries, fresh process, ms)")
+        for mmap_mb in (0, 256):
+            output = subprocess.run(
+                [sys.executable, __file__, "--queries", str(args.queries), "--probe", path, str(mmap_mb)],
+                capture_output=True, text=True, check=True,
+            ).stdout.split()
+            opened, fastest, p50, p95, anon, file = output
+            label = f"mmap {mmap_mb} MB" if mmap_mb else "no mmap"
+            print(f"  {label:<12} open={opened}  min={fastest}  p50={p50}  p95={p95}  rss_growth: private={anon} MB file={file} MB  "
+                  f"(index {size_mb:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Latency added by Llama Guard moderation to a streamed reply: serial checks vs the
+concurrent pipeline in moderation.py.
+
+The generation is simulated (time to first token, then tokens at a fixed rate) and the
+guard is the fake Llama Guard model with --guard-latency per call. Per reply:
+
+- none:      no moderation
+- serial:    the question is checked before generating; each output window is held back
+             until its verdict arrives (the stream pauses at every window)
+- parallel:  ModerationGuard: question checked alongside the first call, output windows
+             checked in the background, last window checked before the stream ends
+
+Each mode runs once with new questions and once with repeated ones (verdicts cached). A
+flagged reply shows how soon each mode stops generating after the unsafe text appears.
+
+    cd python_backend
+    python benchmarks/bench_moderation.py --replies 20 --guard-latency 0.25 --first-token 0.4
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fake_backends import FakeChatModel  # noqa: E402
+from moderation import ContentFlagged, Moderator  # noqa: E402
+from search_cache import SearchCache  # noqa: E402
+
+UNSAFE = "forbidden-term"
+WORDS = "the ECG shows ST elevation so start aspirin and page cardiology for a cath lab slot".split()
+
+
+async def generate(first_token: float, tokens_per_second: float, tokens: int, unsafe_at=None):
+    """Fake token stream; unsafe_at puts UNSAFE at that token index"""
+    await asyncio.sleep(first_token)
+    for i in range(tokens):
+        if i:
+            await asyncio.sleep(1 / tokens_per_second)
+        yield (UNSAFE if i == unsafe_at else WORDS[i % len(WORDS)]) + " "
+
+
+async def reply_none(moderator, question, args, unsafe_at=None):
+    started, first = time.perf_counter(), None
+    async for token in generate(args.first_token, args.tps, args.tokens, unsafe_at):
+        first = first or time.perf_counter() - started
+    return first, time.perf_counter() - started, None
+
+
+async def reply_serial(moderator, question, args, unsafe_at=None):
+    started, first, held, checked = time.perf_counter(), None, "", ""
+    if (await moderator.classify("input", [("user", question)]))["flagged"]:
+        return None, time.perf_counter() - started, 0.0
+    tokens = generate(args.first_token, args.tps, args.tokens, unsafe_at)
+    async for token in tokens:
+        held += token
+        if len(held) >= moderator.window_chars:
+            checked += held
+            held = ""
+            verdict = await moderator.classify("output", [("user", question), ("assistant", checked[-moderator.context_chars:])])
+            if verdict["flagged"]:
+                await tokens.aclose()
+                return first, time.perf_counter() - started, time.perf_counter()
+            first = first or time.perf_counter() - started
+    if held:
+        checked += held
+        await moderator.classify("output", [("user", question), ("assistant", checked[-moderator.context_chars:])])
+        first = first or time.perf_counter() - started
+    return first, time.perf_counter() - started, None
+
+
+async def reply_parallel(moderator, question, args, unsafe_at=None):
+    started, first = time.perf_counter(), None
+    guard = moderator.guard(question)
+    tokens = generate(args.first_token, args.tps, args.tokens, unsafe_at)
+    try:
+        async for token in tokens:
+            await guard.admit(token)
+            first = first or time.perf_counter() - started
+        await guard.finish()
+    except ContentFlagged:
+        await tokens.aclose()
+        return first, time.perf_counter() - started, time.perf_counter()
+    return first, time.perf_counter() - started, None
+
+
+MODES = {"none": reply_none, "serial": reply_serial, "parallel": reply_parallel}
+
+
+def new_moderator(args) -> Moderator:
+    guard = FakeChatModel(model_name="meta-llama/llama-guard-4-12b", latency=args.guard_latency, unsafe_terms=[UNSAFE])
+    return Moderator(lambda: guard, SearchCache(ttl=3600, max_entries=10000), window_chars=args.window)
+
+
+async def run(mode: str, args):
+    moderator = new_moderator(args)
+    rows = []
+    for label in ("new", "repeated"):
+        calls_before = moderator.stats()["guard_calls"]
+        results = [await MODES[mode](moderator, f"Chest pain workup, case {i}", args) for i in range(args.replies)]
+        ttft = [1000 * r[0] for r in results]
+        total = [1000 * r[1] for r in results]
+        rows.append((label, statistics.median(ttft), statistics.median(total), moderator.stats()["guard_calls"] - calls_before))
+    return rows
+
+
+async def flagged(mode: str, args):
+    """Seconds from the unsafe token being generated to generation stopping"""
+    moderator = new_moderator(args)
+    unsafe_at = args.tokens // 2
+    started = time.perf_counter()
+    first, total, stopped = await MODES[mode](moderator, "Chest pain workup, flagged case", args, unsafe_at)
+    produced_at = started + args.first_token + unsafe_at / args.tps
+    return (stopped - produced_at) if stopped else None, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--replies", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=300, help="tokens per reply")
+    parser.add_argument("--tps", type=float, default=250, help="generation tokens per second")
+    parser.add_argument("--first-token", type=float, default=0.4, help="time to the first token (s)")
+    parser.add_argument("--guard-latency", type=float, default=0.25, help="Llama Guard call latency (s)")
+    parser.add_argument("--window", type=int, default=400, help="MODERATION_WINDOW_CHARS")
+    args = parser.parse_args()
+
+    baseline = {}
+    for mode in MODES:
+        for label, ttft, total, calls in asyncio.run(run(mode, args)):
+            baseline.setdefault(label, (ttft, total))
+            added_ttft, added_total = ttft - baseline[label][0], total - baseline[label][1]
+            print(
+                f"{mode:<9} {label:<9} ttft p50={ttft:6.0f} ms (+{added_ttft:4.0f})  "
+                f"total p50={total:6.0f} ms (+{added_total:4.0f})  guard calls={calls}"
+            )
+    for mode in ("serial", "parallel"):
+        delay, total = asyncio.run(flagged(mode, args))
+        print(f"{mode:<9} flagged   stopped {delay * 1000:.0f} ms after the unsafe text was generated  total={total * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
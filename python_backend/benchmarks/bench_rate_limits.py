@@ -0,0 +1,120 @@
+"""
+Fault injection for the rate-limited Groq client layer: plain vs rate-limited httpx clients.
+
+Sends concurrent chat completions through DebateLLMClient to a fake Groq endpoint that
+fails a fraction of calls with 429/5xx, then with the primary model unavailable so calls
+must fail over to its sibling. Exits non-zero if the rate-limited client loses a call.
+
+The retry, fallback, fail-fast and pacing policy itself is covered by
+tests/test_rate_limits.py.
+
+    cd python_backend
+    python benchmarks/bench_rate_limits.py --calls 60 --fault-rate 0.3
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from debate_llm import DebateLLMClient
+from fake_backends import FakeGroqServer
+from rate_limits import GroqRateLimiter, RateLimitedTransport
+
+MODEL = "llama-3.3-70b-versatile"
+SIBLING = "openai/gpt-oss-120b"
+MESSAGES = [{"role": "user", "content": "Fever, neck stiffness and confusion for one day"}]
+
+
+def run_calls(server: FakeGroqServer, http_client: httpx.Client, calls: int, concurrency: int) -> dict:
+    client = DebateLLMClient("fake-key", server.base_url, http_client=http_client)
+
+    def one(_):
+        started = time.perf_counter()
+        try:
+            client.complete(MODEL, MESSAGES, max_tokens=64)
+            return True, time.perf_counter() - started
+        except httpx.HTTPError:
+            return False, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, range(calls)))
+    latencies = sorted(seconds * 1000 for ok, seconds in results if ok)
+    return {
+        "ok": len(latencies),
+        "failed": calls - len(latencies),
+        "p50_ms": latencies[len(latencies) // 2] if latencies else 0.0,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0,
+        "mean_ms": statistics.mean(latencies) if latencies else 0.0,
+        "wall_s": time.perf_counter() - started,
+    }
+
+
+def limited_client(args) -> tuple:
+    limiter = GroqRateLimiter(
+        fallbacks={MODEL: SIBLING},
+        max_retries=args.max_retries,
+        backoff_base=args.backoff_base,
+        max_wait=5.0,
+    )
+    return limiter, httpx.Client(transport=RateLimitedTransport(limiter, httpx.HTTPTransport()), timeout=30)
+
+
+def report(label: str, result: dict, server: FakeGroqServer, limiter=None):
+    extra = f"  retries={limiter.retries:3d} fallbacks={limiter.fallback_count:3d}" if limiter else ""
+    print(
+        f"{label:<24} ok={result['ok']:4d} failed={result['failed']:4d}  "
+        f"p50={result['p50_ms']:7.1f} ms  p95={result['p95_ms']:7.1f} ms  "
+        f"wall={result['wall_s']:6.2f} s  upstream={server.calls:4d} faults={server.faults:4d}{extra}"
+    )
+    print(f"{'':<24} calls by model: {server.calls_by_model}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--fault-rate", type=float, default=0.3)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake time before the first token (s)")
+    parser.add_argument("--max-retries", type=int, default=4)
+    parser.add_argument("--backoff-base", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    logging.getLogger("meda").setLevel(logging.ERROR)
+
+    lost = 0
+    print(f"-- {args.fault_rate:.0%} of calls fail with 429/503")
+    for label in ("plain client", "rate-limited client"):
+        with FakeGroqServer(latency=args.latency, fault_rate=args.fault_rate, seed=args.seed) as server:
+            if label == "plain client":
+                with httpx.Client(timeout=30) as http_client:
+                    report(label, run_calls(server, http_client, args.calls, args.concurrency), server)
+            else:
+                limiter, http_client = limited_client(args)
+                with http_client:
+                    result = run_calls(server, http_client, args.calls, args.concurrency)
+                report(label, result, server, limiter)
+                lost += result["failed"]
+
+    print(f"-- {MODEL} unavailable (429, Retry-After 60s)")
+    with FakeGroqServer(latency=args.latency, unavailable_models=[MODEL]) as server:
+        limiter, http_client = limited_client(args)
+        with http_client:
+            result = run_calls(server, http_client, args.calls, args.concurrency)
+        report(f"fallback to {SIBLING}", result, server, limiter)
+        lost += result["failed"]
+
+    if lost:
+        print(f"FAIL: the rate-limited client lost {lost} calls")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
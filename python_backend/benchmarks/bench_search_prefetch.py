@@ -0,0 +1,129 @@
+"""
+Time to first token and total time of streamed /chat search questions, with and without
+speculative search prefetching, plus the share of prefetches that were wasted.
+
+The fake model searches for questions containing SEARCH_TRIGGER_TERMS, after its first
+completion (FAKE_LLM_LATENCY); the fake search takes FAKE_SEARCH_LATENCY. --skip-rate of
+the questions use a word the prefetcher treats as time-sensitive but the model answers
+without searching, so those prefetches are wasted (an extra Tavily call each).
+
+    cd python_backend
+    python benchmarks/bench_search_prefetch.py --requests 40 --llm-latency 0.4 --search-latency 1.0
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+SEARCHED = "Latest guidelines for sepsis management (case {i})"
+# "update" makes the prefetcher start a search; the fake model doesn't treat it as a trigger
+NOT_SEARCHED = "Any update on inhaler technique for asthma (case {i})"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def one_request(client: httpx.AsyncClient, question: str):
+    started = time.perf_counter()
+    first = None
+    async with client.stream("POST", "/chat", json={
+        "messages": [{"role": "user", "content": question}],
+        "stream": True,
+        "cache": False,
+    }) as response:
+        async for line in response.aiter_lines():
+            if first is None and line.startswith("data: {"):
+                first = time.perf_counter() - started
+    return first, time.perf_counter() - started
+
+
+async def run(base_url: str, requests: int, concurrency: int, skip_rate: float, offset: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    skip_every = round(1 / skip_rate) if skip_rate else 0
+
+    async def bounded(i):
+        question = (NOT_SEARCHED if skip_every and i % skip_every == 0 else SEARCHED).format(i=offset + i)
+        async with semaphore:
+            return await one_request(client, question)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        return await asyncio.gather(*(bounded(i) for i in range(requests)))
+
+
+def report(label: str, results, prefetch_stats, upstream_calls: int):
+    ttft = sorted(1000 * r[0] for r in results)
+    total = sorted(1000 * r[1] for r in results)
+    print(
+        f"{label:<12} ttft p50={statistics.median(ttft):7.0f} ms  mean={statistics.mean(ttft):7.0f} ms  "
+        f"total p50={statistics.median(total):7.0f} ms  searches={upstream_calls}  "
+        f"used={prefetch_stats['used']}  wasted={prefetch_stats['wasted']}  "
+        f"waste_rate={prefetch_stats['waste_rate']:.2f}  avg_saved={prefetch_stats['avg_saved_seconds'] * 1000:.0f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.4, help="fake time before the first token (s)")
+    parser.add_argument("--search-latency", type=float, default=1.0, help="fake Tavily latency (s)")
+    parser.add_argument("--skip-rate", type=float, default=0.25, help="share of questions the model answers without searching")
+    args = parser.parse_args()
+
+    os.environ.update(
+        LLM_BACKEND="fake",
+        SEARCH_BACKEND="fake",
+        FAKE_LLM_LATENCY=str(args.llm_latency),
+        FAKE_SEARCH_LATENCY=str(args.search_latency),
+        LOG_LEVEL="WARNING",
+        TRANSCRIPT_STORE_PATH=":memory:",
+    )
+    import uvicorn
+
+    import main as app_main
+    from prompts import SEARCH_TRIGGER_TERMS
+
+    app_main.search_prefetcher.search_triggers = SEARCH_TRIGGER_TERMS + ["update"]
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app_main.app, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    try:
+        for offset, enabled in enumerate((False, True)):
+            app_main.search_prefetcher.enabled = enabled
+            calls_before = app_main.search_cache.upstream_calls
+            stats_before = app_main.search_prefetcher.stats()
+            # The AgentExecutor is verbose; keep its chain output out of the report
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                results = asyncio.run(run(
+                    f"http://127.0.0.1:{port}", args.requests, args.concurrency, args.skip_rate, offset * args.requests
+                ))
+            stats = app_main.search_prefetcher.stats()
+            delta = {key: stats[key] - stats_before[key] for key in ("started", "used", "wasted")}
+            delta["waste_rate"] = delta["wasted"] / delta["started"] if delta["started"] else 0.0
+            saved = stats["saved_seconds"] - stats_before["saved_seconds"]
+            delta["avg_saved_seconds"] = saved / delta["used"] if delta["used"] else 0.0
+            report("prefetch on" if enabled else "prefetch off", results, delta,
+                   app_main.search_cache.upstream_calls - calls_before)
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Cache hits, session continuity and stream resumes across workers, per STATE_BACKEND.
+
+--workers API processes are started on their own ports (like nodes behind a load balancer
+without sticky routing) on the fake LLM and search backends. The client sends each request
+to the next worker in turn:
+
+- cache:     --questions questions, each asked once per worker; repeats should be cache hits
+- sessions:  --sessions sessions of --turns turns; every turn should find its session
+- streams:   --debates debate streams, dropped after --drop-after messages and resumed
+             on the next worker with Last-Event-ID; each should reach [DONE] without gaps
+
+For "redis" the benchmark runs fake_backends.FakeRedisServer; "sqlite" uses a temporary file.
+
+    cd python_backend
+    python benchmarks/bench_shared_state.py --workers 3 --backends memory sqlite redis
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BACKEND_DIR)
+
+from fake_backends import FakeRedisServer  # noqa: E402
+
+SYMPTOMS = "Crushing chest pain radiating to the left arm for two hours, sweating (case {i})"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_workers(count: int, env: dict) -> list:
+    workers = []
+    for _ in range(count):
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=BACKEND_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+        )
+        workers.append((process, f"http://127.0.0.1:{port}"))
+    deadline = time.monotonic() + 120
+    for process, url in workers:
+        while True:
+            try:
+                if httpx.get(url + "/health/ready").status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"Worker at {url} did not start")
+            time.sleep(0.2)
+    return workers
+
+
+async def cache_phase(client: httpx.AsyncClient, urls: list, args):
+    """Each question once per worker; returns (repeat hit rate, repeat p50 s)"""
+    hits, seconds = 0, []
+    for i in range(args.questions):
+        body = {"messages": [{"role": "user", "content": f"What is the mechanism of action of drug {i}?"}]}
+        for n, url in enumerate(urls):
+            started = time.perf_counter()
+            response = await client.post(url + "/chat", json=body)
+            response.raise_for_status()
+            if n:
+                seconds.append(time.perf_counter() - started)
+                hits += response.headers.get("x-cache") == "HIT"
+    repeats = args.questions * (len(urls) - 1)
+    return hits / repeats, statistics.median(seconds)
+
+
+async def session_phase(client: httpx.AsyncClient, urls: list, args):
+    """Turns round-robin over the workers; returns the fraction of turns that found their session"""
+    ok = 0
+    for i in range(args.sessions):
+        session_id = (await client.post(urls[i % len(urls)] + "/sessions")).json()["session_id"]
+        for turn in range(args.turns):
+            url = urls[(i + turn + 1) % len(urls)]
+            body = {"session_id": session_id, "messages": [{"role": "user", "content": f"Follow-up {turn} on case {i}"}]}
+            response = await client.post(url + "/chat", json=body)
+            ok += response.status_code == 200
+    return ok / (args.sessions * args.turns)
+
+
+async def read(response, ids, stop_after=None):
+    messages, event_id = 0, None
+    async for line in response.aiter_lines():
+        if line.startswith("id: "):
+            event_id = int(line[4:])
+        elif line.startswith("data: "):
+            ids.append(event_id)
+            if line == "data: [DONE]":
+                return True
+            if "name" in json.loads(line[6:]):
+                messages += 1
+                if stop_after is not None and messages >= stop_after:
+                    return False
+    return False
+
+
+async def one_resume(client: httpx.AsyncClient, urls: list, i: int, args):
+    """Start on one worker, resume on the next; True if the stream finished without gaps"""
+    ids = []
+    body = {"symptoms": SYMPTOMS.format(i=i), "max_rounds": args.rounds}
+    async with client.stream("POST", urls[i % len(urls)] + "/arena/debate-stream", json=body) as response:
+        run_id = response.headers["x-stream-run"]
+        await read(response, ids, stop_after=args.drop_after)
+    url = urls[(i + 1) % len(urls)]
+    async with client.stream("GET", f"{url}/streams/{run_id}", headers={"Last-Event-ID": str(ids[-1])}) as response:
+        if response.status_code != 200:
+            return False
+        done = await read(response, ids)
+    return done and ids == list(range(len(ids)))
+
+
+async def run(urls: list, args):
+    async with httpx.AsyncClient(timeout=120) as client:
+        hit_rate, repeat_p50 = await cache_phase(client, urls, args)
+        sessions_ok = await session_phase(client, urls, args)
+        resumes = await asyncio.gather(*(one_resume(client, urls, i, args) for i in range(args.debates)))
+        stats = (await client.get(urls[0] + "/state")).json()
+    return hit_rate, repeat_p50, sessions_ok, sum(resumes) / len(resumes), stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--backends", nargs="+", default=["memory", "sqlite", "redis"])
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--debates", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=8, help="max_round of each debate")
+    parser.add_argument("--drop-after", type=int, default=3, help="debate messages read before disconnecting")
+    args = parser.parse_args()
+
+    with FakeRedisServer() as redis, tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            env = dict(
+                os.environ,
+                LLM_BACKEND="fake",
+                SEARCH_BACKEND="fake",
+                AGENT_WARMUP_MODELS="[]",
+                LOG_LEVEL="WARNING",
+                TRANSCRIPT_STORE_PATH=":memory:",
+                STATE_BACKEND=backend,
+                STATE_SQLITE_PATH=os.path.join(tmp, f"state-{backend}.db"),
+                STATE_REDIS_URL=redis.url,
+            )
+            workers = start_workers(args.workers, env)
+            try:
+                hit_rate, repeat_p50, sessions_ok, resumes_ok, stats = asyncio.run(run([url for _, url in workers], args))
+            finally:
+                for process, _ in workers:
+                    process.terminate()
+                for process, _ in workers:
+                    process.wait()
+            print(
+                f"{backend:<7} repeat hit rate={hit_rate:4.0%}  repeat p50={repeat_p50 * 1000:6.0f} ms  "
+                f"session turns ok={sessions_ok:4.0%}  cross-worker resumes ok={resumes_ok:4.0%}  "
+                f"worker 0 backend ops: reads={stats['reads']} writes={stats['writes']} published={stats['published']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
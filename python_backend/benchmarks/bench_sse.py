@@ -0,0 +1,115 @@
+"""
+SSE framing cost: one frame per token (previous framing) vs the coalescing SSEWriter.
+
+Runs --streams concurrent token streams on one event loop, each writing its frames to a
+local socket pair (so every frame costs a send syscall as it would on a real connection),
+and reports frames, frames/s, bytes and CPU time per stream:
+
+    cd python_backend
+    python benchmarks/bench_sse.py --streams 200 --tokens 300 --tokens-per-second 400
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sse import DONE, Delta, SSEWriter, orjson
+
+WORDS = "the patient reports chest pain radiating to the left arm with sweating and nausea".split()
+
+
+async def tokens(count: int, tokens_per_second: float, seed: int):
+    rng = random.Random(seed)
+    for i in range(count):
+        if tokens_per_second:
+            await asyncio.sleep(1 / tokens_per_second)
+        word = rng.choice(WORDS)
+        # Chat models stream one or two tokens per chunk, sometimes empty ones
+        yield "" if i % 25 == 0 else (word[: rng.randint(1, len(word))] + " ")
+
+
+async def legacy_frames(source):
+    async for token in source:
+        yield f"data: {json.dumps({'content': token})}\n\n".encode()
+    yield b"data: [DONE]\n\n"
+
+
+async def writer_frames(source, coalesce_ms: float):
+    async def events():
+        async for token in source:
+            yield Delta(token)
+        yield DONE
+
+    async for frame in SSEWriter(coalesce_seconds=coalesce_ms / 1000, heartbeat_seconds=None).stream(events()):
+        yield frame
+
+
+async def one_stream(frames) -> tuple:
+    loop = asyncio.get_running_loop()
+    sender, receiver = socket.socketpair()
+    sender.setblocking(False)
+    receiver.setblocking(False)
+
+    async def drain():
+        received = 0
+        while True:
+            data = await loop.sock_recv(receiver, 65536)
+            if not data:
+                return received
+            received += len(data)
+
+    reader = asyncio.ensure_future(drain())
+    count = 0
+    async for frame in frames:
+        await loop.sock_sendall(sender, frame)
+        count += 1
+    sender.close()
+    received = await reader
+    receiver.close()
+    return count, received
+
+
+async def run(mode: str, args) -> dict:
+    def frames(i):
+        source = tokens(args.tokens, args.tokens_per_second, i)
+        return legacy_frames(source) if mode == "legacy" else writer_frames(source, args.coalesce_ms)
+
+    cpu, wall = time.process_time(), time.perf_counter()
+    results = await asyncio.gather(*(one_stream(frames(i)) for i in range(args.streams)))
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    frame_count = sum(count for count, _ in results)
+    return {
+        "frames": frame_count,
+        "bytes": sum(received for _, received in results),
+        "wall": wall,
+        "cpu": cpu,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=300)
+    parser.add_argument("--tokens-per-second", type=float, default=400, help="per stream; 0 = as fast as possible")
+    parser.add_argument("--coalesce-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    print(f"json encoder for SSEWriter: {'orjson' if orjson else 'json'}")
+    for mode in ("legacy", "writer"):
+        result = asyncio.run(run(mode, args))
+        label = "frame per token" if mode == "legacy" else f"SSEWriter {args.coalesce_ms:g} ms"
+        print(
+            f"{label:<18} frames={result['frames']:8d}  frames/s={result['frames'] / result['wall']:9.0f}  "
+            f"bytes={result['bytes']:9d}  wall={result['wall']:6.2f} s  "
+            f"cpu={result['cpu']:6.2f} s  cpu/stream={result['cpu'] / args.streams * 1000:6.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
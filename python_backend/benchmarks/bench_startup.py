@@ -0,0 +1,133 @@
+"""
+Import time, time to ready and memory of the API, per process and per worker.
+
+1. `import main` in a fresh interpreter, with the heavy libraries deferred (current) and
+   with them imported up front (how main used to load), reporting time and peak RSS.
+2. serve.py with --workers N, with and without preloading: time until every worker
+   answers /health/ready, and RSS and PSS summed over the parent and its workers. PSS
+   splits shared pages between the processes sharing them, so it shows what preloading
+   saves (Linux only).
+
+Runs on the fake backends:
+
+    cd python_backend
+    python benchmarks/bench_startup.py --workers 4
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+# What main imported at load time before the heavy imports were deferred
+EAGER_IMPORTS = "import langchain.agents, langchain_groq, langchain_community.tools.tavily_search, autogen_agents, autogen_streaming; "
+IMPORT_PROBE = (
+    "import resource, time; started = time.perf_counter(); {eager}import main; "
+    "print(time.perf_counter() - started, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+)
+
+
+def environment() -> dict:
+    return dict(
+        os.environ,
+        LLM_BACKEND="fake",
+        SEARCH_BACKEND="fake",
+        LOG_LEVEL="WARNING",
+        TRANSCRIPT_STORE_PATH=":memory:",
+        PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])),
+    )
+
+
+def import_cost(eager: bool, repeats: int):
+    times, rss = [], []
+    for _ in range(repeats):
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE.format(eager=EAGER_IMPORTS if eager else "")],
+            cwd=BACKEND_DIR, env=environment(), capture_output=True, text=True, check=True,
+        ).stdout.split()
+        times.append(float(out[-2]))
+        rss.append(int(out[-1]) / 1024)
+    return min(times), min(rss)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def memory_kb(pid: int, field: str) -> int:
+    """A field from /proc/<pid>/smaps_rollup (Rss, Pss), in kB"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as rollup:
+            for line in rollup:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def children(pid: int):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def launcher(workers: int, preload: bool, timeout: float = 120):
+    port = free_port()
+    command = [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)]
+    if not preload:
+        command.append("--no-preload")
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=environment(), stderr=subprocess.DEVNULL)
+    ready_pids = set()
+    try:
+        while len(ready_pids) < workers:
+            if time.perf_counter() - started > timeout:
+                raise TimeoutError(f"only {len(ready_pids)} of {workers} workers ready")
+            try:
+                # A new connection each time, so the probes reach every worker
+                response = httpx.get(f"http://127.0.0.1:{port}/health/ready", headers={"Connection": "close"}, timeout=2)
+                if response.status_code == 200:
+                    ready_pids.add(response.json()["pid"])
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.02)
+        ready = time.perf_counter() - started
+        pids = [process.pid] + children(process.pid)
+        rss = sum(memory_kb(pid, "Rss") for pid in pids) / 1024
+        pss = sum(memory_kb(pid, "Pss") for pid in pids) / 1024
+        return ready, rss, pss
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=3, help="import measurements (best is reported)")
+    args = parser.parse_args()
+
+    for label, eager in (("eager imports", True), ("deferred imports", False)):
+        seconds, rss = import_cost(eager, args.repeats)
+        print(f"import main, {label:<17} {seconds:6.2f} s  peak RSS {rss:6.1f} MB")
+
+    for label, preload in (("no preload", False), ("preload", True)):
+        ready, rss, pss = launcher(args.workers, preload)
+        print(
+            f"serve.py {args.workers} workers, {label:<10} ready in {ready:6.2f} s  "
+            f"RSS {rss:7.1f} MB  PSS {pss:7.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+LLM calls and wall time of debate streams whose client drops mid-debate, without and with
+resumable streams.
+
+Each client reads /arena/debate-stream until --drop-after messages, disconnects, stays
+offline for --offline seconds, then:
+
+- restart:  starts the debate again (STREAM_RESUME=false: the dropped debate was cancelled)
+- resume:   reconnects to GET /streams/{run_id} with Last-Event-ID
+
+Resumed streams are checked for gaps or repeated event IDs. The fake Groq endpoint counts
+LLM calls.
+
+    cd python_backend
+    python benchmarks/bench_stream_resume.py --debates 4 --rounds 10 --drop-after 4
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fake_backends import FakeGroqServer  # noqa: E402
+
+SYMPTOMS = "Crushing chest pain radiating to the left arm for two hours, sweating (case {i})"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def read(response, ids, stop_after=None):
+    """Record event IDs; stop after stop_after debate messages or at [DONE]. Returns messages read"""
+    messages, event_id = 0, None
+    async for line in response.aiter_lines():
+        if line.startswith("id: "):
+            event_id = int(line[4:])
+        elif line.startswith("data: "):
+            ids.append(event_id)
+            if line == "data: [DONE]":
+                break
+            if "name" in json.loads(line[6:]):
+                messages += 1
+                if stop_after is not None and messages >= stop_after:
+                    break
+    return messages
+
+
+async def one_debate(client: httpx.AsyncClient, i: int, mode: str, args):
+    body = {"symptoms": SYMPTOMS.format(i=i), "max_rounds": args.rounds}
+    started = time.perf_counter()
+    ids = []
+    async with client.stream("POST", "/arena/debate-stream", json=body) as response:
+        run_id = response.headers.get("x-stream-run")
+        await read(response, ids, stop_after=args.drop_after)
+    await asyncio.sleep(args.offline)
+    if mode == "restart":
+        ids = []
+        async with client.stream("POST", "/arena/debate-stream", json=body) as response:
+            await read(response, ids)
+    else:
+        headers = {"Last-Event-ID": str(ids[-1])}
+        async with client.stream("GET", f"/streams/{run_id}", headers=headers) as response:
+            response.raise_for_status()
+            await read(response, ids)
+    intact = ids == list(range(len(ids)))
+    return time.perf_counter() - started, intact
+
+
+async def run(base_url: str, mode: str, args):
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        return await asyncio.gather(*(one_debate(client, i, mode, args) for i in range(args.debates)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--debates", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=10, help="max_round of each debate")
+    parser.add_argument("--drop-after", type=int, default=4, help="debate messages read before disconnecting")
+    parser.add_argument("--offline", type=float, default=1.0, help="seconds before reconnecting")
+    parser.add_argument("--latency", type=float, default=0.3, help="fake time to the first token (s)")
+    args = parser.parse_args()
+
+    os.environ.update(
+        LLM_BACKEND="groq",
+        GROQ_API_KEY="fake",
+        SEARCH_BACKEND="fake",
+        AGENT_WARMUP_MODELS="[]",
+        LOG_LEVEL="WARNING",
+        TRANSCRIPT_STORE_PATH=":memory:",
+        DEBATE_WORKERS=str(args.debates),
+        DEBATE_DEFAULT_MODEL_CONCURRENCY=str(args.debates),
+        DEBATE_MODEL_CONCURRENCY="{}",
+    )
+    with FakeGroqServer(latency=args.latency, tokens_per_second=200) as fake:
+        os.environ["GROQ_API_BASE"] = fake.base_url
+        import uvicorn
+
+        import main as app_main
+
+        port = free_port()
+        server = uvicorn.Server(uvicorn.Config(app_main.app, port=port, log_level="warning"))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.05)
+        try:
+            for mode in ("restart", "resume"):
+                app_main.settings.STREAM_RESUME = mode == "resume"
+                calls_before = fake.calls
+                # The autogen agents print every message; keep them out of the report
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    results = asyncio.run(run(f"http://127.0.0.1:{port}", mode, args))
+                    # Cancelled debates stop between rounds: let their last call finish before counting
+                    time.sleep(1.0 + args.latency)
+                walls = [r[0] for r in results]
+                calls = (fake.calls - calls_before) / args.debates
+                intact = "" if mode == "restart" else f"  event ids intact: {all(r[1] for r in results)}"
+                print(f"{mode:<8} llm calls/debate={calls:5.1f}  wall p50={statistics.median(walls):6.2f} s{intact}")
+            print(app_main.stream_runs.stats())
+        finally:
+            server.should_exit = True
+            thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Tokens, cost and wall time of long debates without and with request token budgets, and
+how much they delay short /chat requests running alongside.
+
+--debates debates of --rounds rounds (the pathological case: the history, and so every
+prompt, grows each round) run next to --chats non-streamed /chat requests against the fake
+Groq endpoint, which enforces a --tpm tokens-per-minute quota shared by all of them like
+a Groq account (calls over it get 429 and wait out its Retry-After):
+
+- unbudgeted:  DEBATE_MAX_PROMPT_TOKENS / DEBATE_MAX_COMPLETION_TOKENS unset
+- budgeted:    --prompt-budget / --completion-budget (default 12000 / 2000, well under what
+               a --rounds debate uses, so the budget binds; config.py's production
+               defaults are sized for real debates and wouldn't stop these)
+
+Each mode runs in its own process (and so its own quota window). Usage is read from the
+X-Usage-* headers. Exits non-zero unless every budgeted debate stops early
+(X-Budget-Stopped) and no unbudgeted one does.
+
+    cd python_backend
+    python benchmarks/bench_token_budget.py --tpm 90000 --prompt-budget 12000 --completion-budget 2000
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fake_backends import DEFAULT_REPLY, FakeGroqServer  # noqa: E402
+
+MODES = ("unbudgeted", "budgeted")
+SYMPTOMS = "Crushing chest pain radiating to the left arm for two hours, sweating (case {i})"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def debate(client: httpx.AsyncClient, i: int, rounds: int):
+    started = time.perf_counter()
+    response = await client.post("/arena/debate", json={"symptoms": SYMPTOMS.format(i=i), "max_rounds": rounds})
+    response.raise_for_status()
+    tokens = int(response.headers["x-usage-prompt-tokens"]) + int(response.headers["x-usage-completion-tokens"])
+    stopped = response.headers.get("x-budget-stopped")
+    return time.perf_counter() - started, tokens, float(response.headers["x-usage-cost-usd"]), stopped
+
+
+async def chat(client: httpx.AsyncClient, i: int, delay: float):
+    await asyncio.sleep(delay)
+    started = time.perf_counter()
+    body = {"messages": [{"role": "user", "content": f"What is a normal resting heart rate? ({i})"}], "stream": False, "cache": False}
+    response = await client.post("/chat", json=body)
+    response.raise_for_status()
+    return time.perf_counter() - started
+
+
+async def run(base_url: str, args):
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        debates = asyncio.gather(*(debate(client, i, args.rounds) for i in range(args.debates)))
+        # Chats arrive once the debates are well under way
+        chats = asyncio.gather(*(chat(client, i, 1.0 + 0.2 * i) for i in range(args.chats)))
+        return await debates, await chats
+
+
+def bench(mode: str, args):
+    os.environ.update(
+        LLM_BACKEND="groq",
+        GROQ_API_KEY="fake",
+        SEARCH_BACKEND="fake",
+        AGENT_WARMUP_MODELS="[]",
+        # Quota 429s log a fallback warning each
+        LOG_LEVEL="ERROR",
+        TRANSCRIPT_STORE_PATH=":memory:",
+        DEBATE_WORKERS=str(args.debates),
+        DEBATE_DEFAULT_MODEL_CONCURRENCY=str(args.debates),
+        DEBATE_MODEL_CONCURRENCY="{}",
+        # Wait out the fake quota's Retry-After (up to a minute) instead of failing fast
+        LLM_MAX_RATE_LIMIT_WAIT="60",
+    )
+    reply = " ".join([DEFAULT_REPLY] * args.reply_sentences)
+    with FakeGroqServer(latency=args.latency, tokens_per_second=400, reply=reply, tokens_per_minute=args.tpm) as fake:
+        os.environ["GROQ_API_BASE"] = fake.base_url
+        import uvicorn
+
+        import main as app_main
+
+        settings = app_main.settings
+        if mode == "unbudgeted":
+            settings.DEBATE_MAX_PROMPT_TOKENS = settings.DEBATE_MAX_COMPLETION_TOKENS = None
+        else:
+            settings.DEBATE_MAX_PROMPT_TOKENS = args.prompt_budget
+            settings.DEBATE_MAX_COMPLETION_TOKENS = args.completion_budget
+        port = free_port()
+        server = uvicorn.Server(uvicorn.Config(app_main.app, port=port, log_level="warning"))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.05)
+        try:
+            # The autogen agents print every message; keep them out of the report
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                debates, chats = asyncio.run(run(f"http://127.0.0.1:{port}", args))
+            calls = (fake.calls - fake.faults - args.chats) / args.debates
+            print(
+                f"{mode:<11} budget={settings.DEBATE_MAX_PROMPT_TOKENS}/{settings.DEBATE_MAX_COMPLETION_TOKENS}  "
+                f"debate tokens p50={statistics.median(d[1] for d in debates):7.0f}  "
+                f"cost p50=${statistics.median(d[2] for d in debates):.4f}  llm calls/debate={calls:5.1f}  "
+                f"debate wall p50={statistics.median(d[0] for d in debates):6.2f} s  "
+                f"chat p50={statistics.median(chats):6.2f} s  429s={fake.faults}  "
+                f"stopped early={sum(bool(d[3]) for d in debates)}/{len(debates)}"
+            )
+            stopped = [d[3] for d in debates]
+            if mode == "budgeted":
+                assert all(stopped), f"budgeted debates ran to completion: raise --rounds or lower the budgets ({stopped})"
+            else:
+                assert not any(stopped), f"unbudgeted debates stopped early: {stopped}"
+        finally:
+            server.should_exit = True
+            thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--debates", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=25, help="max_round of each debate")
+    parser.add_argument("--chats", type=int, default=8)
+    parser.add_argument("--tpm", type=int, default=60000, help="tokens per minute of the fake Groq account")
+    parser.add_argument("--prompt-budget", type=int, default=12000, help="DEBATE_MAX_PROMPT_TOKENS of the budgeted run")
+    parser.add_argument("--completion-budget", type=int, default=2000, help="DEBATE_MAX_COMPLETION_TOKENS of the budgeted run")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake time to the first token (s)")
+    parser.add_argument("--reply-sentences", type=int, default=8, help="length of each fake reply")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        bench(args.mode, args)
+        return
+    for mode in MODES:
+        subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--mode", mode], check=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Per-turn time to first token on /arena/debate-stream: whole messages vs stream_tokens.
+
+Runs against the local fake Groq endpoint streaming at a fixed token rate:
+
+    cd python_backend
+    python benchmarks/bench_token_streaming.py --rounds 8 --tokens-per-second 150
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fake_backends import FakeGroqServer
+
+SYMPTOMS = "Sudden severe headache, photophobia and vomiting since this morning"
+
+
+async def whole_messages(rounds: int):
+    """Client sees nothing of a turn until the previous-to-current message gap has elapsed"""
+    from autogen_streaming import StreamingDebateSystem
+
+    debate = StreamingDebateSystem("fake-key", "llama-3.3-70b-versatile")
+    gaps, last = [], time.perf_counter()
+    async for _ in debate.run_debate_streaming(SYMPTOMS, rounds):
+        now = time.perf_counter()
+        gaps.append(now - last)
+        last = now
+    # The first message is the opening case description, not an LLM turn
+    return gaps[1:]
+
+
+async def token_stream(rounds: int):
+    from autogen_streaming import StreamingDebateSystem
+
+    debate = StreamingDebateSystem("fake-key", "llama-3.3-70b-versatile", stream_tokens=True)
+    ttft, turn_started = [], None
+    async for event in debate.run_debate_streaming(SYMPTOMS, rounds):
+        if event["type"] == "turn_start":
+            turn_started = time.perf_counter()
+        elif event["type"] == "delta" and turn_started is not None:
+            ttft.append(time.perf_counter() - turn_started)
+            turn_started = None
+    return ttft
+
+
+def report(label, samples):
+    ms = sorted(s * 1000 for s in samples)
+    print(
+        f"{label:<16} turns={len(ms):3d}  mean={statistics.mean(ms):8.1f} ms  "
+        f"p50={ms[len(ms) // 2]:8.1f} ms  max={ms[-1]:8.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.1, help="fake time before the first token (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=150)
+    args = parser.parse_args()
+
+    with FakeGroqServer(latency=args.latency, tokens_per_second=args.tokens_per_second) as server:
+        os.environ["GROQ_API_BASE"] = server.base_url
+        report("whole messages", asyncio.run(whole_messages(args.rounds)))
+        report("stream_tokens", asyncio.run(token_stream(args.rounds)))
+
+
+if __name__ == "__main__":
+    main()
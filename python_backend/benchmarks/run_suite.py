@@ -0,0 +1,215 @@
+"""
+Load/benchmark suite for the FastAPI app on the fake LLM and search backends.
+
+Starts uvicorn with LLM_BACKEND=fake and SEARCH_BACKEND=fake, drives each scenario at
+the given concurrency and reports p50/p95/p99 latency, time to first byte, throughput
+and server RSS. Results are written as JSON so runs can be compared for regressions:
+
+    cd python_backend
+    python benchmarks/run_suite.py --concurrency 8 --requests 64 --output bench_results.json
+    python benchmarks/run_suite.py --scenarios chat chat-stream --fake-llm-latency 0.1
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Mix of lookups, reasoning and time-sensitive questions for model="auto" routing
+AUTO_QUERIES = [
+    "What does NSTEMI stand for?",
+    "Define tachycardia",
+    "Explain the mechanism of metformin and why it causes lactic acidosis",
+    "Differential diagnosis for a 54-year-old with acute chest pain and diaphoresis",
+    "Latest guidelines for sepsis management",
+]
+
+SCENARIOS = {
+    "chat": ("/chat", lambda i: {
+        "messages": [{"role": "user", "content": f"Explain the mechanism of metformin (case {i})"}],
+        "cache": False,
+    }),
+    "chat-stream": ("/chat", lambda i: {
+        "messages": [{"role": "user", "content": f"Explain the mechanism of metformin (case {i})"}],
+        "stream": True,
+        "cache": False,
+    }),
+    "chat-search": ("/chat", lambda i: {
+        "messages": [{"role": "user", "content": f"Latest guidelines for sepsis management (case {i})"}],
+        "stream": True,
+    }),
+    "chat-auto": ("/chat", lambda i: {
+        "messages": [{"role": "user", "content": AUTO_QUERIES[i % len(AUTO_QUERIES)]}],
+        "model": "auto",
+        "cache": False,
+    }),
+    "debate": ("/arena/debate", lambda i: {
+        "symptoms": f"Case {i}: fever, neck stiffness and confusion for one day",
+        "max_rounds": 8,
+    }),
+    "debate-stream": ("/arena/debate-stream", lambda i: {
+        "symptoms": f"Case {i}: fever, neck stiffness and confusion for one day",
+        "max_rounds": 8,
+    }),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb(pid: int) -> float:
+    """Resident set size of a process from /proc (Linux only, 0 elsewhere)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def start_server(port: int, args) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        LLM_BACKEND="fake",
+        SEARCH_BACKEND="fake",
+        FAKE_LLM_LATENCY=str(args.fake_llm_latency),
+        FAKE_LLM_TOKENS_PER_SECOND=str(args.fake_tokens_per_second),
+        FAKE_SEARCH_LATENCY=str(args.fake_search_latency),
+        DEBATE_WORKERS=str(args.concurrency),
+        DEBATE_DEFAULT_MODEL_CONCURRENCY=str(args.concurrency),
+        DEBATE_MODEL_CONCURRENCY="{}",
+        DEBATE_MAX_QUEUE=str(args.requests),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    # Wait for the background warm-up too, so the first scenario doesn't measure it
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/health/ready", timeout=1).raise_for_status()
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("server did not start")
+
+
+async def one_request(client: httpx.AsyncClient, path: str, body: Dict) -> Dict:
+    started = time.perf_counter()
+    first_byte = None
+    async with client.stream("POST", path, json=body) as response:
+        async for _ in response.aiter_raw():
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+        status = response.status_code
+    return {"status": status, "latency": time.perf_counter() - started, "ttfb": first_byte or 0.0}
+
+
+async def run_scenario(name: str, port: int, server_pid: int, concurrency: int, requests: int) -> Dict:
+    path, make_body = SCENARIOS[name]
+    semaphore = asyncio.Semaphore(concurrency)
+    peak_rss = rss_mb(server_pid)
+    sampling = True
+
+    async def sample_rss():
+        nonlocal peak_rss
+        while sampling:
+            peak_rss = max(peak_rss, rss_mb(server_pid))
+            await asyncio.sleep(0.2)
+
+    async def limited(client, i):
+        async with semaphore:
+            return await one_request(client, path, make_body(i))
+
+    sampler = asyncio.create_task(sample_rss())
+    started = time.perf_counter()
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=600) as client:
+        results = await asyncio.gather(*(limited(client, i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    sampling = False
+    await sampler
+
+    ok = [r for r in results if r["status"] == 200]
+    latencies = [r["latency"] * 1000 for r in ok]
+    ttfbs = [r["ttfb"] * 1000 for r in ok]
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": len(results) - len(ok),
+        "throughput_rps": len(ok) / elapsed if elapsed else 0.0,
+        "latency_ms": {p: percentile(latencies, float(p[1:])) for p in ("p50", "p95", "p99")},
+        "ttfb_ms": {p: percentile(ttfbs, float(p[1:])) for p in ("p50", "p95", "p99")},
+        "peak_rss_mb": peak_rss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--fake-llm-latency", type=float, default=0.3)
+    parser.add_argument("--fake-tokens-per-second", type=float, default=200)
+    parser.add_argument("--fake-search-latency", type=float, default=1.0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    port = free_port()
+    server = start_server(port, args)
+    try:
+        baseline_rss = rss_mb(server.pid)
+        results = [
+            asyncio.run(run_scenario(name, port, server.pid, args.concurrency, args.requests))
+            for name in args.scenarios
+        ]
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    print(f"{'scenario':<14} {'rps':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'ttfb p50':>9} {'rss MB':>8} {'err':>4}")
+    for r in results:
+        print(
+            f"{r['scenario']:<14} {r['throughput_rps']:7.2f} "
+            f"{r['latency_ms']['p50']:9.1f} {r['latency_ms']['p95']:9.1f} {r['latency_ms']['p99']:9.1f} "
+            f"{r['ttfb_ms']['p50']:9.1f} {r['peak_rss_mb']:8.1f} {r['errors']:4d}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump({
+                "timestamp": time.time(),
+                "python": platform.python_version(),
+                "baseline_rss_mb": baseline_rss,
+                "settings": vars(args),
+                "results": results,
+            }, out, indent=2)
+        print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,196 @@
+from functools import lru_cache
+
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 class Settings(BaseSettings):
-    GROQ_API_KEY: str
-    TAVILY_API_KEY: str
+    # Only required for the real backends
+    GROQ_API_KEY: Optional[str] = None
+    TAVILY_API_KEY: Optional[str] = None
+
+    # "groq" / "tavily", or "fake" for the deterministic local stand-ins in fake_backends.py
+    LLM_BACKEND: str = "groq"
+    SEARCH_BACKEND: str = "tavily"
+    FAKE_LLM_LATENCY: float = 0.3  # seconds before the first token
+    FAKE_LLM_TOKENS_PER_SECOND: Optional[float] = 200
+    FAKE_DEBATE_FINAL_AFTER: Optional[int] = None  # messages before the fake Doctor gives a final diagnosis
+    # Per-model overrides for the fake Groq endpoint, e.g. {"llama-3.1-8b-instant": {"latency": 0.1, "tokens_per_second": 800}}
+    FAKE_LLM_MODEL_PROFILES: Dict[str, Dict[str, float]] = {}
+    FAKE_SEARCH_LATENCY: float = 1.0
+    # The fake guard model answers "unsafe" for text containing one of these (case-insensitive)
+    FAKE_GUARD_UNSAFE_TERMS: List[str] = []
+
+    LOG_LEVEL: str = "INFO"
+
+    # SSE framing: token deltas are coalesced for up to SSE_COALESCE_MS (or SSE_COALESCE_BYTES)
+    # per frame; idle streams get a heartbeat comment every SSE_HEARTBEAT_SECONDS
+    SSE_COALESCE_MS: float = 20
+    SSE_COALESCE_BYTES: int = 1024
+    SSE_HEARTBEAT_SECONDS: Optional[float] = 15
+    # /chat and /arena/debate-stream runs outlive their connection: frames are buffered
+    # (STREAM_RESUME_MAX_EVENTS per run) and a reconnect to GET /streams/{run_id} with
+    # Last-Event-ID continues the run; runs without a connection stop after the grace period
+    STREAM_RESUME: bool = True
+    STREAM_RESUME_GRACE_SECONDS: float = 60
+    STREAM_RESUME_MAX_EVENTS: int = 5000
+
+    # State shared between workers and nodes (shared_state.py): "memory" (each worker its
+    # own), "sqlite" (the workers of one node) or "redis" (every node). With sqlite or redis
+    # the response, search and moderation caches, sessions, transcripts and stream runs are
+    # shared, so any worker can serve a cached answer, continue a session or resume a stream
+    STATE_BACKEND: str = "memory"
+    STATE_SQLITE_PATH: str = "meda_state.db"
+    STATE_SQLITE_POLL_SECONDS: float = 0.02
+    STATE_REDIS_URL: str = "redis://127.0.0.1:6379/0"
+    STATE_TRANSCRIPT_TTL: float = 7 * 86400  # shared transcripts expire this long after last use
+
+    # Production launcher (serve.py)
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: int = 2
+
+    # Agents (and debate agents) built at startup so first requests don't pay construction
+    # cost; ["all"] warms up every model in /models. /health/ready reports 503 until done.
+    AGENT_WARMUP_MODELS: List[str] = ["llama-3.3-70b-versatile"]
+    # Pooled keep-alive HTTP clients shared by every cached agent
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+
+    # Groq rate limiting: paced by the x-ratelimit-* headers, 429/5xx retried with jittered
+    # backoff, then failed over to the sibling model
+    LLM_FALLBACK_MODELS: Dict[str, str] = {
+        "llama-3.3-70b-versatile": "openai/gpt-oss-120b",
+        "openai/gpt-oss-120b": "llama-3.3-70b-versatile",
+    }
+    LLM_MAX_RETRIES: int = 3
+    LLM_BACKOFF_BASE: float = 0.5
+    LLM_BACKOFF_MAX: float = 20.0
+    LLM_MAX_RATE_LIMIT_WAIT: float = 30.0  # longer waits fail over (or fail fast without a fallback)
+
+    # Routing for /chat requests with model "auto": direct small-model answers for lookups,
+    # the large model for reasoning, the agent with search for time-sensitive questions
+    ROUTER_SMALL_MODEL: str = "llama-3.1-8b-instant"
+    ROUTER_LARGE_MODEL: str = "llama-3.3-70b-versatile"
+    ROUTER_DIRECT_MAX_WORDS: int = 12
+    ROUTER_LARGE_MIN_WORDS: int = 40
+    ROUTER_LLM_CLASSIFIER: bool = False  # ask the small model when the heuristics are unsure
+
+    # /chat response cache; similarity layer is off unless a threshold (0-1) is set
+    RESPONSE_CACHE_TTL: float = 3600
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1000
+    RESPONSE_CACHE_SIMILARITY_THRESHOLD: Optional[float] = None
+
+    # Tavily result cache; short TTL because most searches are for news
+    SEARCH_CACHE_TTL: float = 900
+    SEARCH_CACHE_MAX_ENTRIES: int = 500
+    SEARCH_CACHE_PATH: Optional[str] = None  # SQLite file to keep results across restarts
+    # Time-sensitive /chat questions start their Tavily search together with the first LLM
+    # call; the agent's search uses it if its query shares SEARCH_PREFETCH_MIN_OVERLAP of the terms
+    SEARCH_PREFETCH: bool = True
+    SEARCH_PREFETCH_MIN_OVERLAP: float = 0.5
+
+    # Offline medical reference index (knowledge_index.py) offered to the agent next to
+    # Tavily for stable reference facts; off unless a path is set
+    KNOWLEDGE_INDEX_PATH: Optional[str] = None
+    KNOWLEDGE_MAX_RESULTS: int = 4
+    KNOWLEDGE_MMAP_MB: int = 256
+
+    # Llama Guard moderation of /chat and debate streams (moderation.py): the question is
+    # classified alongside the first LLM call, output every MODERATION_WINDOW_CHARS characters
+    # in the background; flagged streams are cancelled with a "moderation" event
+    MODERATION_ENABLED: bool = False
+    MODERATION_MODEL: str = "meta-llama/llama-guard-4-12b"
+    MODERATION_WINDOW_CHARS: int = 400
+    MODERATION_CONTEXT_CHARS: int = 2000  # reply text sent with each output check
+    # S6 (specialized advice) is what a medical assistant is for
+    MODERATION_IGNORE_CATEGORIES: List[str] = ["S6"]
+    MODERATION_FAIL_OPEN: bool = True  # a failed guard call lets the content through
+    MODERATION_CACHE_TTL: float = 3600
+    MODERATION_CACHE_MAX_ENTRIES: int = 5000
+
+    # Token budgets per request, over every LLM call it makes (agent iterations, debate
+    # rounds, routing, moderation); None = unlimited. Requests over budget finish early.
+    CHAT_MAX_PROMPT_TOKENS: Optional[int] = 24000
+    CHAT_MAX_COMPLETION_TOKENS: Optional[int] = 4000
+    DEBATE_MAX_PROMPT_TOKENS: Optional[int] = 120000
+    DEBATE_MAX_COMPLETION_TOKENS: Optional[int] = 8000
+    # Token quotas per tenant (X-Tenant-ID header, "anonymous" without one) per window;
+    # a tenant over its quota gets 429 until the window rolls over
+    TENANT_TOKEN_LIMITS: Dict[str, int] = {}
+    TENANT_DEFAULT_TOKEN_LIMIT: Optional[int] = None
+    TENANT_WINDOW_SECONDS: float = 86400
+    # USD per million [prompt, completion] tokens, for reported costs (Groq list prices)
+    LLM_PRICES: Dict[str, List[float]] = {
+        "llama-3.3-70b-versatile": [0.59, 0.79],
+        "llama-3.1-8b-instant": [0.05, 0.08],
+        "meta-llama/llama-guard-4-12b": [0.20, 0.20],
+        "openai/gpt-oss-20b": [0.10, 0.50],
+        "openai/gpt-oss-120b": [0.15, 0.75],
+    }
+
+    # Debate scheduler: worker pool, admission queue and per-model caps (Groq rate limits)
+    DEBATE_WORKERS: int = 4
+    DEBATE_MAX_QUEUE: int = 16
+    # A debate counts against the cap of every model its agents use, so the Patient's small model
+    # (see DEBATE_ROLE_MODELS), which has far higher Groq limits, gets a cap that doesn't bind first
+    DEBATE_MODEL_CONCURRENCY: Dict[str, int] = {"llama-3.1-8b-instant": 4}
+    DEBATE_DEFAULT_MODEL_CONCURRENCY: int = 2
+    # Overall server-side limit per debate, queue time included; rounds stop once it passes
+    DEBATE_DEADLINE_SECONDS: Optional[float] = 300
+    # Per-agent debate context: recent messages sent verbatim and whether the rolling case
+    # summary is included; {} sends every agent the whole history
+    DEBATE_MEMORY: Dict[str, Dict[str, Any]] = {
+        "Doctor": {"window": 6, "summary": True},
+        "Resident": {"window": 6, "summary": True},
+        "Patient": {"window": 3, "summary": False},
+    }
+    # Model per debate agent, overriding the request's model; requests can override entries
+    # with role_models. The Patient's one- or two-sentence replies don't need the large model.
+    DEBATE_ROLE_MODELS: Dict[str, str] = {"Patient": "llama-3.1-8b-instant"}
+    DEBATE_SUMMARY_EVERY: int = 4  # messages aged out of the window before the summary is updated
+    DEBATE_SUMMARY_MODEL: str = "llama-3.1-8b-instant"
+
+    # Seeded debates are stored here and replayed for identical requests
+    TRANSCRIPT_STORE_PATH: str = "debate_transcripts.db"
+    TRANSCRIPT_STORE_MAX_MB: float = 50
+
+    # Batch case-simulation jobs (/arena/jobs); cases also count against the debate scheduler
+    BATCH_JOBS_DIR: str = "batch_jobs"
+    BATCH_MAX_PARALLEL: int = 2  # cases of one job running at once
+    BATCH_MAX_CASES: int = 200
+
+    # Server-side /chat sessions; idle sessions expire after SESSION_TTL seconds
+    SESSION_MAX_SESSIONS: int = 1000
+    SESSION_TTL: float = 86400
+    SESSION_DB_PATH: Optional[str] = None  # SQLite file to keep sessions across restarts
+    # Older turns are folded into a summary once history passes this many (estimated) tokens
+    SESSION_HISTORY_TOKEN_BUDGET: int = 3000
+    SESSION_KEEP_RECENT_TURNS: int = 6
+    SESSION_SUMMARY_MODEL: str = "llama-3.1-8b-instant"
+
+    @model_validator(mode="after")
+    def check_api_keys(self):
+        if self.LLM_BACKEND == "groq" and not self.GROQ_API_KEY:
+            raise ValueError("GROQ_API_KEY is required when LLM_BACKEND is 'groq'")
+        if self.SEARCH_BACKEND == "tavily" and not self.TAVILY_API_KEY:
+            raise ValueError("TAVILY_API_KEY is required when SEARCH_BACKEND is 'tavily'")
+        if self.STATE_BACKEND not in ("memory", "sqlite", "redis"):
+            raise ValueError("STATE_BACKEND must be 'memory', 'sqlite' or 'redis'")
+        return self
     
     class Config:
         env_file = "../.env"
         case_sensitive = True
         extra = "ignore"  # Allow extra fields from .env file
 
-settings = Settings()
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """Settings are read from the environment on first use, not when config is imported"""
+    return Settings()
+
+def __getattr__(name: str):
+    # `from config import settings` keeps working, but validation happens at that point
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module 'config' has no attribute {name!r}")
@@ -0,0 +1,161 @@
+"""
+Direct Groq chat-completions client for debate agents, with token streaming
+"""
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+import telemetry
+import token_budget
+from debate_scheduler import DebateCancelled
+from sessions import estimate_tokens
+
+DeltaCallback = Callable[[str], None]
+
+
+class DebateLLMClient:
+    """Calls Groq's OpenAI-compatible endpoint and reports streamed tokens as they arrive"""
+
+    def __init__(self, api_key: str, base_url: str, http_client: Optional[httpx.Client] = None, timeout: float = 60.0):
+        self.api_key = api_key
+        self.url = base_url.rstrip("/") + "/openai/v1/chat/completions"
+        self.http_client = http_client or httpx.Client(timeout=timeout)
+
+    def complete(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.8,
+        max_tokens: Optional[int] = None,
+        on_delta: Optional[DeltaCallback] = None,
+        seed: Optional[int] = None,
+    ) -> str:
+        """
+        Run one chat completion
+
+        Args:
+            model: Groq model name
+            messages: OpenAI-style messages (system prompt first)
+            temperature: Sampling temperature
+            max_tokens: Completion token limit
+            on_delta: If given, the completion is streamed and each text delta is passed to it
+            seed: Sampling seed for reproducible output
+
+        Returns:
+            The full completion text
+        """
+        payload: Dict[str, Any] = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "stream": on_delta is not None,
+        }
+        if max_tokens is not None:
+            payload["max_tokens"] = max_tokens
+        if seed is not None:
+            payload["seed"] = seed
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        started = time.perf_counter()
+
+        if on_delta is None:
+            response = self.http_client.post(self.url, json=payload, headers=headers)
+            response.raise_for_status()
+            body = response.json()
+            self._record(model, started, body.get("usage"))
+            return body["choices"][0]["message"].get("content") or ""
+
+        parts = []
+        usage = None
+        with self.http_client.stream("POST", self.url, json=payload, headers=headers) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                # Groq reports usage on the last chunk under x_groq
+                usage = chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage") or usage
+                choices = chunk.get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    parts.append(delta)
+                    on_delta(delta)
+        self._record(model, started, usage)
+        return "".join(parts)
+
+    @staticmethod
+    def _record(model: str, started: float, usage: Optional[Dict[str, Any]]):
+        usage = usage or {}
+        telemetry.record_llm_call(
+            time.perf_counter() - started,
+            model,
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+        )
+
+
+def to_chat_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Strip autogen bookkeeping keys, keeping what the chat-completions API accepts"""
+    converted = []
+    for msg in messages:
+        item = {"role": msg.get("role", "user"), "content": msg.get("content") or ""}
+        if msg.get("name"):
+            item["name"] = msg["name"]
+        converted.append(item)
+    return converted
+
+
+def register_llm_reply(
+    agent,
+    client: DebateLLMClient,
+    llm_config: Dict[str, Any],
+    on_turn_start: Optional[Callable[[str], None]] = None,
+    on_delta: Optional[Callable[[str, str], None]] = None,
+):
+    """
+    Make an autogen agent generate its replies through DebateLLMClient
+
+    Args:
+        agent: The ConversableAgent whose replies should be produced here
+        client: Shared client used for the completion
+        llm_config: Autogen llm_config; model, temperature, max_tokens and seed are taken from it
+        on_turn_start: Called with the agent name before the completion starts
+        on_delta: Called with (agent name, text delta) for each streamed token
+    """
+    model = llm_config["config_list"][0]["model"]
+    temperature = llm_config.get("temperature", 0.8)
+    max_tokens = llm_config.get("max_tokens")
+    seed = llm_config.get("seed")
+
+    def reply(recipient, messages=None, sender=None, config=None):
+        if messages is None:
+            messages = recipient._oai_messages[sender]
+        if on_turn_start is not None:
+            on_turn_start(recipient.name)
+        forward = (lambda delta: on_delta(recipient.name, delta)) if on_delta is not None else None
+        chat_messages = to_chat_messages(recipient._oai_system_message + messages)
+        limit = max_tokens
+        budget = token_budget.current()
+        if budget is not None:
+            # Stop the debate like at its deadline rather than go over the request's budget
+            try:
+                budget.check_call(sum(estimate_tokens(m["content"]) for m in chat_messages))
+            except token_budget.BudgetExceeded as e:
+                raise DebateCancelled(e.reason)
+            limit = budget.completion_allowance(max_tokens)
+        content = client.complete(
+            model,
+            chat_messages,
+            temperature=temperature,
+            max_tokens=limit,
+            on_delta=forward,
+            seed=seed,
+        )
+        return True, content
+
+    # Position 0 so this runs before autogen's own LLM reply
+    agent.register_reply([lambda _sender: True, None], reply, position=0)
@@ -0,0 +1,208 @@
+"""
+Bounded context memory for debate agents
+
+Without it every agent is sent the whole group chat history on every turn, so prompt
+tokens grow quadratically over a debate. With it an agent sees:
+- the opening case description (always kept)
+- a rolling case summary (key findings, differential, patient answers), if enabled for it
+- a sliding window of the most recent messages
+
+The summary is shared by the debate's agents and updated every few messages on the
+debate's executor, so no turn waits for it. Messages not yet folded into the summary
+stay in the prompt verbatim, nothing is lost while an update is in flight.
+"""
+import contextvars
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import telemetry
+from debate_scheduler import DebateCancelled, DebateControl
+
+# summarize(previous_summary, new_messages) -> updated summary
+Summarizer = Callable[[str, List[Dict[str, Any]]], str]
+
+CASE_SUMMARY_PROMPT = """You maintain the running case summary of a teaching consultation between a senior doctor, a resident and a patient.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+
+Write the updated summary in at most 150 words under these headings:
+Key findings:
+Differential:
+Patient answers:
+Keep every clinically relevant fact from the current summary. Reply with the summary only."""
+
+# Runs summary updates of debates started without an executor
+_fallback_executor: Optional[ThreadPoolExecutor] = None
+_fallback_lock = threading.Lock()
+
+
+def _default_executor() -> ThreadPoolExecutor:
+    global _fallback_executor
+    with _fallback_lock:
+        if _fallback_executor is None:
+            _fallback_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="case-summary")
+        return _fallback_executor
+
+
+def format_transcript(messages: List[Dict[str, Any]]) -> str:
+    return "\n".join(f"{msg.get('name') or msg.get('role', 'unknown')}: {msg.get('content') or ''}" for msg in messages)
+
+
+def llm_summarizer(client, model: str, max_tokens: int = 300) -> Summarizer:
+    """Summarizer backed by a DebateLLMClient (usually with a small, fast model)"""
+
+    def summarize(summary: str, messages: List[Dict[str, Any]]) -> str:
+        prompt = CASE_SUMMARY_PROMPT.format(summary=summary or "(none yet)", messages=format_transcript(messages))
+        return client.complete(model, [{"role": "user", "content": prompt}], temperature=0.2, max_tokens=max_tokens).strip()
+
+    return summarize
+
+
+class MemoryPolicy:
+    """How much history one agent is sent"""
+
+    def __init__(self, window: int = 6, summary: bool = True):
+        """
+        Args:
+            window: Most recent messages sent verbatim
+            summary: Whether the agent also gets the rolling case summary
+        """
+        self.window = window
+        self.summary = summary
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MemoryPolicy":
+        return cls(window=data.get("window", 6), summary=data.get("summary", True))
+
+
+class CaseMemory:
+    """Rolling case summary shared by one debate's agents; thread-safe"""
+
+    def __init__(
+        self,
+        summarize: Summarizer,
+        keep_recent: int = 6,
+        every: int = 4,
+        executor: Optional[Executor] = None,
+        control: Optional[DebateControl] = None,
+    ):
+        """
+        Args:
+            summarize: Folds new messages into the summary (see llm_summarizer)
+            keep_recent: Messages never folded into the summary while they are this recent
+            every: Fold once at least this many messages have aged out of keep_recent
+            executor: The debate's pool; updates run there, in the observing turn's context
+                so their tokens are charged to the debate's budget
+            control: The debate's stop signal, checked before each update's LLM call
+        """
+        self.summarize = summarize
+        self.keep_recent = keep_recent
+        self.every = every
+        self.summary = ""
+        # Messages after the opening one that the summary covers
+        self.covered = 0
+        self.updates = 0
+        self.executor = executor
+        self.control = control
+        self._lock = threading.Lock()
+        self._updating = False
+        self._closed = False
+        self._pending: Optional[Future] = None
+
+    def snapshot(self):
+        with self._lock:
+            return self.summary, self.covered
+
+    def observe(self, history: List[Dict[str, Any]]):
+        """Start a background update if enough messages have aged out of the recent window"""
+        with self._lock:
+            if self._updating or self._closed:
+                return
+            end = len(history) - self.keep_recent
+            if end - self.covered < self.every:
+                return
+            self._updating = True
+            summary, start = self.summary, self.covered
+            context = contextvars.copy_context()
+            self._pending = (self.executor or _default_executor()).submit(
+                context.run, self._update, summary, history[start:end], end
+            )
+
+    def close(self) -> Optional[Future]:
+        """
+        Stop updating once the debate has ended
+
+        A queued update is dropped. Returns the update still running, if any, so the
+        caller can wait for its tokens to be charged before reporting usage.
+        """
+        with self._lock:
+            self._closed = True
+            pending, self._pending = self._pending, None
+        if pending is None or pending.cancel() or pending.done():
+            return None
+        return pending
+
+    def _update(self, summary: str, messages: List[Dict[str, Any]], end: int):
+        updated = None
+        try:
+            if not self._closed:
+                if self.control is not None:
+                    self.control.check()
+                updated = self.summarize(summary, messages)
+        except DebateCancelled:
+            pass
+        except Exception:
+            # Keep the old summary; the messages stay in the prompt and are retried later
+            telemetry.logger.exception("Case summary update failed")
+        with self._lock:
+            if updated and not self._closed:
+                self.summary, self.covered = updated, end
+                self.updates += 1
+            self._updating = False
+
+    def view(self, messages: List[Dict[str, Any]], policy: MemoryPolicy) -> List[Dict[str, Any]]:
+        """
+        The messages one agent is sent
+
+        Args:
+            messages: The agent's full conversation (opening case message first)
+            policy: The agent's memory policy
+        """
+        if len(messages) <= policy.window + 1:
+            return messages
+        opening, rest = messages[:1], messages[1:]
+        if not policy.summary:
+            return opening + rest[-policy.window:]
+        summary, covered = self.snapshot()
+        # Everything the summary does not cover yet, and at least the recent window
+        recent = rest[min(covered, max(0, len(rest) - policy.window)):]
+        if not summary:
+            return opening + recent
+        return opening + [{"role": "system", "content": f"Case summary so far:\n{summary}"}] + recent
+
+
+def attach_memory(agents, memory: CaseMemory, policies: Dict[str, MemoryPolicy]):
+    """
+    Send each agent only its bounded view of the conversation
+
+    Args:
+        agents: autogen ConversableAgents taking part in the debate
+        memory: The debate's shared case memory
+        policies: Memory policy by agent name; agents without one keep the full history
+    """
+    for agent in agents:
+        policy = policies.get(agent.name)
+        if policy is None:
+            continue
+
+        def bounded(messages: List[Dict[str, Any]], policy: MemoryPolicy = policy) -> List[Dict[str, Any]]:
+            if policy.summary:
+                memory.observe(messages[1:])
+            return memory.view(messages, policy)
+
+        agent.register_hook("process_all_messages_before_reply", bounded)
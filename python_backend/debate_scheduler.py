@@ -0,0 +1,294 @@
+"""
+Admission control and a dedicated worker pool for Doctor-Resident debates
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, AsyncGenerator, Callable, Deque, Dict, Iterable, List, Optional
+
+
+class SchedulerFull(Exception):
+    """Raised when a debate cannot be queued; maps to an HTTP 429/503 with Retry-After"""
+
+    def __init__(self, retry_after: int, status_code: int = 429, detail: str = "Debate queue is full"):
+        super().__init__(detail)
+        self.retry_after = retry_after
+        self.status_code = status_code
+        self.detail = detail
+
+
+class DebateCancelled(Exception):
+    """Raised inside the debate thread to stop the chat between rounds"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class DebateControl:
+    """Thread-safe stop signal for a running debate: explicit cancel, an overall deadline or a token budget"""
+
+    def __init__(self, deadline_seconds: Optional[float] = None, budget=None):
+        """
+        Args:
+            deadline_seconds: Stop once this much time has passed
+            budget: token_budget.RequestBudget; stop once it is used up
+        """
+        self._cancelled = threading.Event()
+        self.reason: Optional[str] = None
+        self.deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+        self.budget = budget
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def check(self):
+        """Raise DebateCancelled if the debate should stop"""
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+        reason = self.budget.exceeded() if self.budget is not None else None
+        if reason is not None:
+            self.budget.stop(reason)
+            self.cancel(reason)
+        if self._cancelled.is_set():
+            raise DebateCancelled(self.reason)
+
+
+class DebateTicket(Executor):
+    """
+    A place in the debate queue; becomes a running slot once admitted
+
+    Pass the ticket as the debate's executor: work submitted to it runs on the
+    scheduler's pool, and the slot stays taken until that work has returned, even
+    when the awaiting coroutine gave up on it earlier (cancelled, disconnected).
+    """
+
+    def __init__(self, scheduler: "DebateScheduler", model: str, models: Optional[List[str]] = None):
+        self.scheduler = scheduler
+        self.model = model
+        # Every model the debate's agents call; each counts against its own cap
+        self.models = models or [model]
+        self.admitted = asyncio.Event()
+        self.started_at: Optional[float] = None
+        self._changed = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        # Submitted calls not finished yet; guarded by _lock (summaries submit from worker threads)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._releasing = False
+        self._released = False
+
+    @property
+    def position(self) -> int:
+        """1-based position in the queue, 0 once running"""
+        return self.scheduler._position(self)
+
+    async def wait(self) -> AsyncGenerator[int, None]:
+        """Yield the queue position each time it changes, return once admitted"""
+        last = None
+        while not self.admitted.is_set():
+            position = self.position
+            if position != last:
+                yield position
+                last = position
+            self._changed.clear()
+            await self._changed.wait()
+
+    async def wait_admitted(self, check: Optional[Callable[[], None]] = None, poll_interval: float = 1.0):
+        """
+        Wait until admitted, calling check() periodically so the wait can be abandoned
+
+        Args:
+            check: Raises to give up the place in the queue (e.g. client disconnected)
+            poll_interval: Seconds between check() calls
+        """
+        while not self.admitted.is_set():
+            if check is not None:
+                check()
+            try:
+                await asyncio.wait_for(self.admitted.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        """Run fn on the scheduler's pool, holding the slot until it returns"""
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self.scheduler.executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, _future: Optional[Future]):
+        with self._lock:
+            self._pending -= 1
+            idle = self._releasing and self._pending == 0
+        if idle:
+            try:
+                self._loop.call_soon_threadsafe(self._free)
+            except RuntimeError:
+                # The loop is closed; so is the scheduler
+                pass
+
+    def release(self):
+        """
+        Leave the queue, or free the running slot once every submitted call has
+        returned. Safe to call more than once.
+        """
+        with self._lock:
+            if self._releasing:
+                return
+            self._releasing = True
+            busy = self._pending > 0
+        if not busy:
+            self._free()
+
+    def _free(self):
+        if not self._released:
+            self._released = True
+            self.scheduler._release(self)
+
+
+class DebateScheduler:
+    """
+    Runs debates on a fixed-size thread pool behind a bounded FIFO queue.
+
+    Admission is decided on the event loop: a queued debate starts once a worker is
+    free and every model its agents use (the request's model and the role models,
+    e.g. the Patient's) is under its concurrency cap, so Groq rate limits are respected
+    per model and debates never occupy the default executor used by /chat.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        max_queue: int = 16,
+        model_limits: Optional[Dict[str, int]] = None,
+        default_model_limit: Optional[int] = None,
+    ):
+        """
+        Args:
+            workers: Debates allowed to run at once
+            max_queue: Debates allowed to wait for a worker before new ones are rejected
+            model_limits: Per-model cap on running debates that use the model
+            default_model_limit: Cap for models not in model_limits (defaults to workers)
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.model_limits = model_limits or {}
+        self.default_model_limit = default_model_limit or workers
+        # A running debate uses one thread for its chat and at most one for a case summary update
+        self.executor = ThreadPoolExecutor(max_workers=workers * 2, thread_name_prefix="debate")
+        self._waiting: Deque[DebateTicket] = deque()
+        self._running: Dict[str, int] = {}  # running debates using each model
+        self._active = 0
+        self._durations: Deque[float] = deque(maxlen=20)
+        self._closed = False
+        self.rejected = 0
+        self.completed = 0
+
+    @property
+    def running(self) -> int:
+        return self._active
+
+    def _model_limit(self, model: str) -> int:
+        return self.model_limits.get(model, self.default_model_limit)
+
+    def _can_start(self, models: Iterable[str]) -> bool:
+        return self.running < self.workers and all(
+            self._running.get(model, 0) < self._model_limit(model) for model in models
+        )
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up, from recent debate durations"""
+        average = sum(self._durations) / len(self._durations) if self._durations else 60.0
+        waves = math.ceil((len(self._waiting) + 1) / self.workers)
+        return max(1, int(average * waves))
+
+    @staticmethod
+    def _models(model: str, role_models: Optional[Dict[str, str]]) -> List[str]:
+        return list(dict.fromkeys([model, *(role_models or {}).values()]))
+
+    def ensure_capacity(self, model: str, role_models: Optional[Dict[str, str]] = None):
+        """Raise SchedulerFull if a debate for this model would be rejected right now"""
+        if self._closed:
+            raise SchedulerFull(self.retry_after(), 503, "Debate scheduler is shutting down")
+        if len(self._waiting) >= self.max_queue and not self._can_start(self._models(model, role_models)):
+            self.rejected += 1
+            raise SchedulerFull(self.retry_after())
+
+    def reserve(self, model: str, role_models: Optional[Dict[str, str]] = None) -> DebateTicket:
+        """
+        Queue a debate, raising SchedulerFull when the queue is at capacity
+
+        Args:
+            model: The debate's model
+            role_models: Models of agents that don't use model; the debate also counts against their caps
+        """
+        self.ensure_capacity(model, role_models)
+        ticket = DebateTicket(self, model, self._models(model, role_models))
+        self._waiting.append(ticket)
+        self._dispatch()
+        return ticket
+
+    def _position(self, ticket: DebateTicket) -> int:
+        try:
+            return self._waiting.index(ticket) + 1
+        except ValueError:
+            return 0
+
+    def _dispatch(self):
+        # FIFO, but a debate blocked only by its model cap doesn't hold up other models
+        for ticket in list(self._waiting):
+            if self.running >= self.workers:
+                break
+            if self._can_start(ticket.models):
+                self._waiting.remove(ticket)
+                self._active += 1
+                for model in ticket.models:
+                    self._running[model] = self._running.get(model, 0) + 1
+                ticket.started_at = time.monotonic()
+                ticket.admitted.set()
+                ticket._changed.set()
+        for ticket in self._waiting:
+            ticket._changed.set()
+
+    def _release(self, ticket: DebateTicket):
+        if ticket.admitted.is_set():
+            self._active -= 1
+            for model in ticket.models:
+                self._running[model] -= 1
+            self._durations.append(time.monotonic() - ticket.started_at)
+            self.completed += 1
+        elif ticket in self._waiting:
+            self._waiting.remove(ticket)
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            # Running debates by model; a debate counts once for each model its agents use
+            "running": dict(self._running),
+            "debates_running": self._active,
+            "queued": len(self._waiting),
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        """Stop admitting debates and release the worker threads"""
+        self._closed = True
+        self.executor.shutdown(wait=False, cancel_futures=True)
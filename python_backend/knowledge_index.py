@@ -0,0 +1,248 @@
+"""
+Offline medical reference index, searched by the agent's medical_reference tool
+
+Stable reference material (drug classes, anatomy, physiology, standard definitions) is
+looked up locally instead of through a Tavily round trip; Tavily stays for anything recent.
+
+The index is a SQLite file with an FTS5 table ranked by BM25. It is opened memory-mapped,
+so a worker starts answering queries without loading it and workers share its pages
+through the page cache. Documents are split into overlapping passages; adding a document
+again replaces its passages only if its text changed, so a corpus can be re-indexed
+incrementally.
+
+Build or extend an index from a directory of .txt/.md files:
+
+    cd python_backend
+    python knowledge_index.py --index knowledge_index.db add ../knowledge --optimize
+    python knowledge_index.py --index knowledge_index.db query "mechanism of action of beta blockers"
+"""
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+INDEX_EXTENSIONS = (".txt", ".md")
+
+# Dropped from queries: OR-ing them in only slows the match down
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it of on or should the this to "
+    "was what when where which who why with you your".split()
+)
+
+_WORD = re.compile(r"\w+")
+
+
+def chunk_text(text: str, words: int = 180, overlap: int = 30) -> List[str]:
+    """Split text into passages of about `words` words, overlapping by `overlap`"""
+    tokens = text.split()
+    if len(tokens) <= words:
+        return [" ".join(tokens)] if tokens else []
+    step = max(1, words - overlap)
+    return [" ".join(tokens[start:start + words]) for start in range(0, len(tokens) - overlap, step)]
+
+
+def match_expression(query: str) -> Optional[str]:
+    """FTS5 MATCH expression for a free-text query (any term may match), or None if it has no terms"""
+    terms = [t for t in _WORD.findall(query.lower()) if t not in STOPWORDS]
+    if not terms:
+        return None
+    return " OR ".join(f'"{t}"' for t in dict.fromkeys(terms))
+
+
+class KnowledgeIndex:
+    """BM25 passage index in a memory-mapped SQLite file; thread-safe"""
+
+    def __init__(self, path: str, mmap_bytes: int = 256 * 1024 * 1024, chunk_words: int = 180, overlap_words: int = 30):
+        """
+        Args:
+            path: SQLite file (":memory:" for a throwaway index)
+            mmap_bytes: How much of the file is read through mmap instead of read() calls
+            chunk_words: Passage length in words
+            overlap_words: Words shared by consecutive passages, so facts aren't cut in half
+        """
+        self.path = path
+        self.chunk_words = chunk_words
+        self.overlap_words = overlap_words
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.query_seconds = 0.0
+        with self._lock:
+            self._db.execute(f"PRAGMA mmap_size = {int(mmap_bytes)}")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "source TEXT PRIMARY KEY, title TEXT, digest TEXT, first_passage INTEGER, passages INTEGER, added_at REAL)"
+            )
+            self._db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5("
+                "title, content, source UNINDEXED, tokenize = 'porter unicode61')"
+            )
+            self._db.commit()
+
+    def _delete_passages(self, source: str):
+        row = self._db.execute("SELECT first_passage, passages FROM documents WHERE source = ?", (source,)).fetchone()
+        if row is not None:
+            # By rowid range: source is not indexed, so filtering on it would scan every passage
+            self._db.execute("DELETE FROM passages WHERE rowid BETWEEN ? AND ?", (row[0], row[0] + row[1] - 1))
+
+    def _add(self, source: str, text: str, title: Optional[str]) -> int:
+        digest = hashlib.sha256(text.encode()).hexdigest()
+        row = self._db.execute("SELECT digest, title FROM documents WHERE source = ?", (source,)).fetchone()
+        if row is not None:
+            if row[0] == digest:
+                return 0
+            self._delete_passages(source)
+        # An update without a title keeps the document's current one
+        title = title or (row[1] if row is not None else None) or source
+        passages = chunk_text(text, self.chunk_words, self.overlap_words)
+        # A document's passages get consecutive rowids, recorded so they can be replaced later
+        last = self._db.execute("SELECT rowid FROM passages ORDER BY rowid DESC LIMIT 1").fetchone()
+        first = (last[0] if last else 0) + 1
+        self._db.executemany(
+            "INSERT INTO passages (rowid, title, content, source) VALUES (?, ?, ?, ?)",
+            [(first + i, title, passage, source) for i, passage in enumerate(passages)],
+        )
+        self._db.execute(
+            "INSERT OR REPLACE INTO documents (source, title, digest, first_passage, passages, added_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (source, title, digest, first, len(passages), time.time()),
+        )
+        return len(passages)
+
+    def add_documents(self, documents: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Add or update documents in one transaction
+
+        Args:
+            documents: Dicts with "source" (unique id, e.g. a file path or URL), "text" and optionally "title"
+
+        Returns:
+            Counts of documents indexed, left unchanged and passages written
+        """
+        counts = {"indexed": 0, "unchanged": 0, "passages": 0}
+        with self._lock:
+            try:
+                for doc in documents:
+                    written = self._add(doc["source"], doc["text"], doc.get("title"))
+                    counts["indexed" if written else "unchanged"] += 1
+                    counts["passages"] += written
+                self._db.commit()
+            except Exception:
+                self._db.rollback()
+                raise
+        return counts
+
+    def add_directory(self, directory: str, extensions=INDEX_EXTENSIONS) -> Dict[str, int]:
+        """Index every matching file under directory; the file name (without extension) is the title"""
+
+        def documents():
+            for root, _, files in os.walk(directory):
+                for name in sorted(files):
+                    if not name.lower().endswith(tuple(extensions)):
+                        continue
+                    path = os.path.join(root, name)
+                    with open(path, encoding="utf-8", errors="replace") as f:
+                        text = f.read()
+                    title = os.path.splitext(name)[0].replace("_", " ").replace("-", " ")
+                    yield {"source": os.path.relpath(path, directory), "text": text, "title": title}
+
+        return self.add_documents(documents())
+
+    def remove(self, source: str) -> bool:
+        with self._lock:
+            self._delete_passages(source)
+            deleted = self._db.execute("DELETE FROM documents WHERE source = ?", (source,)).rowcount
+            self._db.commit()
+        return bool(deleted)
+
+    def optimize(self):
+        """Merge the index segments left by many incremental additions (faster queries)"""
+        with self._lock:
+            self._db.execute("INSERT INTO passages (passages) VALUES ('optimize')")
+            self._db.commit()
+
+    def search(self, query: str, k: int = 4) -> List[Dict[str, Any]]:
+        """
+        Best matching passages, best first
+
+        Returns:
+            Dicts with title, source, content and score (BM25, higher is better)
+        """
+        expression = match_expression(query)
+        if expression is None:
+            return []
+        started = time.perf_counter()
+        with self._lock:
+            # bm25() is lower for better matches; titles count twice as much as body text
+            rows = self._db.execute(
+                "SELECT title, source, content, bm25(passages, 2.0, 1.0) AS rank FROM passages "
+                "WHERE passages MATCH ? ORDER BY rank LIMIT ?",
+                (expression, k),
+            ).fetchall()
+            self.queries += 1
+            self.query_seconds += time.perf_counter() - started
+        return [
+            {"title": title, "source": source, "content": content, "score": round(-rank, 3)}
+            for title, source, content, rank in rows
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            documents, passages = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(passages), 0) FROM documents"
+            ).fetchone()
+            page_count = self._db.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._db.execute("PRAGMA page_size").fetchone()[0]
+            return {
+                "path": self.path,
+                "documents": documents,
+                "passages": passages,
+                "bytes": page_count * page_size,
+                "queries": self.queries,
+                "avg_query_ms": round(1000 * self.query_seconds / self.queries, 3) if self.queries else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query the offline medical reference index")
+    parser.add_argument("--index", default=None, help="index file (default: KNOWLEDGE_INDEX_PATH)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="index (or re-index) the .txt/.md files under a directory")
+    add.add_argument("directory")
+    add.add_argument("--optimize", action="store_true", help="merge index segments afterwards")
+    query = commands.add_parser("query", help="print the best passages for a query")
+    query.add_argument("text")
+    query.add_argument("-k", type=int, default=4)
+    commands.add_parser("stats")
+    args = parser.parse_args()
+
+    path = args.index
+    if path is None:
+        from config import get_settings
+
+        path = get_settings().KNOWLEDGE_INDEX_PATH
+        if not path:
+            parser.error("pass --index or set KNOWLEDGE_INDEX_PATH")
+    index = KnowledgeIndex(path)
+    if args.command == "add":
+        started = time.perf_counter()
+        counts = index.add_directory(args.directory)
+        if args.optimize:
+            index.optimize()
+        print(f"{counts} in {time.perf_counter() - started:.2f} s")
+    elif args.command == "query":
+        for hit in index.search(args.text, args.k):
+            print(f"[{hit['score']}] {hit['title']} ({hit['source']})\n    {hit['content'][:300]}\n")
+    print(index.stats())
+
+
+if __name__ == "__main__":
+    main()
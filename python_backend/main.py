@@ -1,33 +1,104 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, Response as PlainResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, AsyncGenerator
-import json
+from contextlib import aclosing, asynccontextmanager
+from typing import Dict, Iterable, List, Optional
 import asyncio
+import importlib
 import os
+import time
 
-from langchain_groq import ChatGroq
-from langchain_community.tools.tavily_search import TavilySearchResults
-from langchain.agents import AgentExecutor, create_tool_calling_agent
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 
-from autogen_agents import MedicalDebateSystem
-from autogen_streaming import StreamingDebateSystem
+from agent_registry import AgentRegistry
+from batch_jobs import BatchJobManager
+from backends import create_chat_model, create_search_api_wrapper, start_fake_groq_endpoint, use_fake_search
+from debate_scheduler import DebateCancelled, DebateControl, DebateScheduler, SchedulerFull
+from model_router import AUTO_MODEL, ModelRouter
+from rate_limits import GroqRateLimiter
+from response_cache import ResponseCache, is_time_sensitive
+from knowledge_index import KnowledgeIndex
+from moderation import ContentFlagged, Moderator
+from search_cache import SearchCache
+from search_prefetch import SearchPrefetcher
+from sse import DONE, Delta, SSEWriter
+from shared_state import create_backend
+from stream_runs import ResumeGap, StreamRuns
+import token_budget
+from token_budget import BUDGET_STOPPED_REPLY, BudgetCallbackHandler, BudgetExceeded, RequestBudget, TenantLedger, TenantQuotaExceeded
+from sessions import SessionStore, SessionSummarizer, SharedSessionStore, SQLiteSessionStore
+import telemetry
+from telemetry import RequestContextMiddleware, TelemetryCallbackHandler, logger
+from transcript_store import SharedTranscriptStore, TranscriptStore, transcript_key
+# langchain agents and autogen are imported on first use (or by warm_up), not here
 
 # Ensure API Keys are loaded into environment variables
 # LangChain tools often look for TAVILY_API_KEY in os.environ automatically
 try:
     from config import settings
-    from prompts import MEDICAL_ASSISTANT_SYSTEM_PROMPT
-    os.environ["TAVILY_API_KEY"] = settings.TAVILY_API_KEY
-    os.environ["GROQ_API_KEY"] = settings.GROQ_API_KEY
+    from prompts import MEDICAL_ASSISTANT_SYSTEM_PROMPT, REFERENCE_TOOL_PROMPT, SEARCH_TRIGGER_TERMS
+    if settings.TAVILY_API_KEY:
+        os.environ["TAVILY_API_KEY"] = settings.TAVILY_API_KEY
+    if settings.GROQ_API_KEY:
+        os.environ["GROQ_API_KEY"] = settings.GROQ_API_KEY
 except ImportError:
     # Fallback for demonstration
     MEDICAL_ASSISTANT_SYSTEM_PROMPT = "You are a professional medical assistant with real-time web access."
+    REFERENCE_TOOL_PROMPT = ""
+    SEARCH_TRIGGER_TERMS = []
 
-app = FastAPI(title="MEDA Medical Assistant API")
+# Worker state for /health/ready: ready once warm_up has finished
+readiness = {"ready": False, "pid": os.getpid(), "warmup_seconds": None, "warmed_models": [], "errors": []}
+
+def warm_up():
+    """
+    Import the deferred agent and debate modules and build each warm-up model's agent
+    and debate agents, so the first real request doesn't pay for it
+    """
+    started = time.perf_counter()
+    # Also imports autogen_agents
+    importlib.import_module("autogen_streaming")
+    from autogen_agents import MedicalDebateSystem
+
+    models = AVAILABLE_MODELS if settings.AGENT_WARMUP_MODELS == ["all"] else settings.AGENT_WARMUP_MODELS
+    for model in models:
+        try:
+            agent_registry.warm_up([model])
+            MedicalDebateSystem(
+                os.getenv("GROQ_API_KEY") or "warmup", model, role_models=settings.DEBATE_ROLE_MODELS
+            ).create_agents()
+            readiness["warmed_models"].append(model)
+        except Exception as e:
+            logger.exception("Warm-up failed", extra={"model": model})
+            readiness["errors"].append(f"{model}: {e}")
+    readiness["warmup_seconds"] = round(time.perf_counter() - started, 3)
+    readiness["ready"] = True
+    logger.info("Warm-up finished", extra={"seconds": readiness["warmup_seconds"]})
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Local Groq stand-in for the debate agents when LLM_BACKEND is "fake"
+    fake_groq = start_fake_groq_endpoint()
+    # Warm up in the background: /health/live answers right away, /health/ready once done
+    warmup_task = asyncio.create_task(asyncio.to_thread(warm_up))
+    yield
+    readiness["ready"] = False
+    await warmup_task
+    await batch_jobs.shutdown()
+    stream_runs.shutdown()
+    debate_scheduler.shutdown()
+    await agent_registry.aclose()
+    state_backend.close()
+    if fake_groq is not None:
+        fake_groq.stop()
+
+telemetry.configure_logging(settings.LOG_LEVEL)
+
+app = FastAPI(title="MEDA Medical Assistant API", lifespan=lifespan)
+
+# Request IDs, request timing and optional per-request traces (X-Trace: 1)
+app.add_middleware(RequestContextMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -51,41 +122,124 @@ class Message(BaseModel):
 
 class ChatRequest(BaseModel):
     messages: List[Message]
-    model: str = "llama-3.3-70b-versatile"
+    model: str = "llama-3.3-70b-versatile"  # or "auto" to route by question complexity
     stream: bool = False
+    cache: bool = True  # Set False to always run the agent
+    session_id: Optional[str] = None  # With a session, messages holds only the new turns
 
 class ChatResponse(BaseModel):
     role: str
     content: str
 
+# Where caches, sessions, transcripts and stream runs are shared with other workers
+# (STATE_BACKEND); shared is None when each worker keeps its own
+state_backend = create_backend(
+    settings.STATE_BACKEND,
+    sqlite_path=settings.STATE_SQLITE_PATH,
+    redis_url=settings.STATE_REDIS_URL,
+    sqlite_poll_seconds=settings.STATE_SQLITE_POLL_SECONDS,
+)
+shared = state_backend if state_backend.distributed else None
+
+# Shared by every agent's Tavily tool: identical queries are answered once
+search_cache = SearchCache(
+    ttl=settings.SEARCH_CACHE_TTL,
+    max_entries=settings.SEARCH_CACHE_MAX_ENTRIES,
+    path=settings.SEARCH_CACHE_PATH,
+    shared=shared,
+)
+
+# Starts the Tavily search of time-sensitive questions alongside the agent's first LLM call
+search_prefetcher = SearchPrefetcher(
+    SEARCH_TRIGGER_TERMS,
+    min_overlap=settings.SEARCH_PREFETCH_MIN_OVERLAP,
+    enabled=settings.SEARCH_PREFETCH,
+)
+
+def prefetch_search(executor):
+    """The agent's Tavily search, for search_prefetcher; None if the agent has no Tavily tool"""
+    from search_tool import CachedTavilySearch
+
+    tool = next((tool for tool in getattr(executor, "tools", ()) if isinstance(tool, CachedTavilySearch)), None)
+    return tool.prefetch if tool is not None else None
+
 def get_tavily_tool():
     """Initialize Tavily search tool correctly."""
+    from search_tool import CachedTavilySearch
+
     api_key = os.getenv("TAVILY_API_KEY")
-    if not api_key:
-        print("Error: TAVILY_API_KEY not found in environment.")
+    if not api_key and not use_fake_search():
+        logger.error("TAVILY_API_KEY not found in environment")
         return None
     try:
-        return TavilySearchResults(
+        api_wrapper = create_search_api_wrapper()
+        return CachedTavilySearch(
             max_results=3,
-            search_depth="advanced" # Advanced depth ensures better real-time results
+            search_depth="advanced", # Advanced depth ensures better real-time results
+            search_cache=search_cache,
+            **({"api_wrapper": api_wrapper} if api_wrapper is not None else {}),
         )
-    except Exception as e:
-        print(f"Failed to init Tavily: {e}")
+    except Exception:
+        logger.exception("Failed to init Tavily")
         return None
 
-def create_medical_agent(model_name: str):
-    llm = ChatGroq(
-        api_key=os.getenv("GROQ_API_KEY"),
-        model=model_name,
+# Offline reference index for stable facts (drug classes, anatomy, ...), next to Tavily
+knowledge_index = (
+    KnowledgeIndex(settings.KNOWLEDGE_INDEX_PATH, mmap_bytes=settings.KNOWLEDGE_MMAP_MB * 1024 * 1024)
+    if settings.KNOWLEDGE_INDEX_PATH
+    else None
+)
+
+def get_knowledge_tool():
+    """The medical_reference tool, or None when no index is configured"""
+    if knowledge_index is None:
+        return None
+    from search_tool import LocalKnowledgeSearch
+
+    return LocalKnowledgeSearch(knowledge_index=knowledge_index, max_results=settings.KNOWLEDGE_MAX_RESULTS)
+
+def agent_system_prompt(tools: Iterable[str] = ("knowledge", "tavily")) -> str:
+    """The system prompt an agent built with these tools runs with"""
+    has_reference = "knowledge" in tools and knowledge_index is not None
+    return MEDICAL_ASSISTANT_SYSTEM_PROMPT + (REFERENCE_TOOL_PROMPT if has_reference else "")
+
+def response_cache_prompt(tools: Iterable[str] = ("knowledge", "tavily")) -> str:
+    """
+    Effective system prompt and available tools of /chat agents, the "system prompt" the
+    response cache is keyed on: answers given with and without a tool are never mixed up
+    """
+    available = [
+        name for name in tools
+        if (name == "knowledge" and knowledge_index is not None)
+        or (name == "tavily" and (os.getenv("TAVILY_API_KEY") or use_fake_search()))
+    ]
+    return agent_system_prompt(tools) + f"\n\n[tools: {', '.join(available) or 'none'}]"
+
+def create_medical_agent(
+    model_name: str,
+    tools: Iterable[str] = ("knowledge", "tavily"),
+    http_client=None,
+    http_async_client=None,
+):
+    from langchain.agents import AgentExecutor, create_tool_calling_agent
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+    llm = create_chat_model(
+        model_name,
         temperature=0.1, # Lower temperature for better tool use accuracy
+        http_client=http_client,
+        http_async_client=http_async_client,
+        max_retries=0, # The registry's rate-limited clients retry and fail over
     )
     
-    tavily_tool = get_tavily_tool()
-    tools = [tavily_tool] if tavily_tool else []
+    knowledge_tool = get_knowledge_tool() if "knowledge" in tools else None
+    tavily_tool = get_tavily_tool() if "tavily" in tools else None
+    tools = [tool for tool in (knowledge_tool, tavily_tool) if tool]
+    system_prompt = agent_system_prompt(["knowledge"] if knowledge_tool else [])
     
     # Prompt MUST include agent_scratchpad for tool-calling agents
     prompt = ChatPromptTemplate.from_messages([
-        ("system", MEDICAL_ASSISTANT_SYSTEM_PROMPT),
+        ("system", system_prompt),
         MessagesPlaceholder(variable_name="chat_history"),
         ("human", "{input}"),
         MessagesPlaceholder(variable_name="agent_scratchpad"),
@@ -104,6 +258,169 @@ def create_medical_agent(model_name: str):
         )
     return llm
 
+# Paces, retries and fails over every Groq call made by /chat agents and debates
+rate_limiter = GroqRateLimiter(
+    fallbacks=settings.LLM_FALLBACK_MODELS,
+    max_retries=settings.LLM_MAX_RETRIES,
+    backoff_base=settings.LLM_BACKOFF_BASE,
+    backoff_max=settings.LLM_BACKOFF_MAX,
+    max_wait=settings.LLM_MAX_RATE_LIMIT_WAIT,
+)
+
+# One executor per (model, tools), reused across requests with shared keep-alive clients
+agent_registry = AgentRegistry(
+    create_medical_agent,
+    max_connections=settings.HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    rate_limiter=rate_limiter,
+)
+
+# Answers to repeated questions; time-sensitive queries always bypass it
+response_cache = ResponseCache(
+    ttl=settings.RESPONSE_CACHE_TTL,
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    similarity_threshold=settings.RESPONSE_CACHE_SIMILARITY_THRESHOLD,
+    shared=shared,
+)
+
+# Conversation history kept server-side, so session clients only send new turns
+if shared is not None:
+    session_store = SharedSessionStore(shared, max_sessions=settings.SESSION_MAX_SESSIONS, ttl=settings.SESSION_TTL)
+elif settings.SESSION_DB_PATH:
+    session_store = SQLiteSessionStore(
+        settings.SESSION_DB_PATH,
+        max_sessions=settings.SESSION_MAX_SESSIONS,
+        ttl=settings.SESSION_TTL,
+    )
+else:
+    session_store = SessionStore(max_sessions=settings.SESSION_MAX_SESSIONS, ttl=settings.SESSION_TTL)
+
+session_summarizer = SessionSummarizer(
+    lambda: create_chat_model(
+        settings.SESSION_SUMMARY_MODEL,
+        temperature=0,
+        http_client=agent_registry.http_client,
+        http_async_client=agent_registry.http_async_client,
+        max_retries=0,
+    ),
+    session_store,
+    token_budget=settings.SESSION_HISTORY_TOKEN_BUDGET,
+    keep_recent=settings.SESSION_KEEP_RECENT_TURNS,
+    callbacks=lambda: [TelemetryCallbackHandler(settings.SESSION_SUMMARY_MODEL)],
+)
+
+# Llama Guard checks of questions and streamed output, run alongside generation
+moderator = Moderator(
+    lambda: create_chat_model(
+        settings.MODERATION_MODEL,
+        temperature=0,
+        http_client=agent_registry.http_client,
+        http_async_client=agent_registry.http_async_client,
+        max_retries=0,
+    ),
+    SearchCache(
+        ttl=settings.MODERATION_CACHE_TTL,
+        max_entries=settings.MODERATION_CACHE_MAX_ENTRIES,
+        shared=shared,
+        namespace="moderation",
+    ),
+    window_chars=settings.MODERATION_WINDOW_CHARS,
+    context_chars=settings.MODERATION_CONTEXT_CHARS,
+    ignore_categories=settings.MODERATION_IGNORE_CATEGORIES,
+    fail_open=settings.MODERATION_FAIL_OPEN,
+    enabled=settings.MODERATION_ENABLED,
+)
+
+@app.exception_handler(ContentFlagged)
+async def content_flagged_handler(request, exc: ContentFlagged):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": "Content flagged by moderation", "moderation": exc.event()},
+    )
+
+# Token usage per tenant (X-Tenant-ID), with optional quotas
+tenant_ledger = TenantLedger(
+    window_seconds=settings.TENANT_WINDOW_SECONDS,
+    limits=settings.TENANT_TOKEN_LIMITS,
+    default_limit=settings.TENANT_DEFAULT_TOKEN_LIMIT,
+)
+
+@app.exception_handler(TenantQuotaExceeded)
+async def tenant_quota_handler(request, exc: TenantQuotaExceeded):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+def start_budget(http_request: Request, max_prompt_tokens: Optional[int], max_completion_tokens: Optional[int]) -> RequestBudget:
+    """
+    Admit the request's tenant (429 when over quota) and make a new token budget the
+    current request's; LLM calls made on its behalf from here on are charged to it
+    """
+    tenant = http_request.headers.get("x-tenant-id") or "anonymous"
+    tenant_ledger.admit(tenant)
+    budget = RequestBudget(
+        max_prompt_tokens,
+        max_completion_tokens,
+        tenant=tenant,
+        ledger=tenant_ledger,
+        prices=settings.LLM_PRICES,
+    )
+    token_budget.use(budget)
+    return budget
+
+# Keep references to fire-and-forget tasks so they aren't garbage collected mid-run
+_background_tasks = set()
+
+async def summarize_session(session, tenant: str):
+    # Runs after the request has answered: charge the summary to its own budget (and the tenant)
+    token_budget.use(RequestBudget(tenant=tenant, ledger=tenant_ledger, prices=settings.LLM_PRICES))
+    try:
+        await session_summarizer.maybe_summarize(session)
+    except Exception:
+        logger.exception("Session summary failed", extra={"session_id": session.id})
+
+async def state_call(fn, *args, **kwargs):
+    """
+    Call a cache, session or transcript store method. With a shared backend (and for the
+    SQLite stores) that is network or disk I/O, so it runs in a thread, off the event loop.
+    """
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+async def response_cache_call(fn, *args):
+    """response_cache.get/set: in memory unless a shared backend is configured"""
+    return fn(*args) if shared is None else await state_call(fn, *args)
+
+async def record_session_turns(session, messages: List[Message], reply: str):
+    """Store the new turns and the reply, then summarize older turns off the request path"""
+    async with session_store.lock(session.id):
+        # Another turn of the session may have been recorded since this request read it
+        session = await state_call(session_store.get, session.id) or session
+        session.extend([{"role": msg.role, "content": msg.content} for msg in messages])
+        session.extend([{"role": "assistant", "content": reply}])
+        await state_call(session_store.save, session)
+    budget = token_budget.current()
+    task = asyncio.create_task(summarize_session(session, budget.tenant if budget is not None else "anonymous"))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+# Picks the model (and whether to use the agent and search) for model="auto"
+model_router = ModelRouter(
+    small_model=settings.ROUTER_SMALL_MODEL,
+    large_model=settings.ROUTER_LARGE_MODEL,
+    search_triggers=SEARCH_TRIGGER_TERMS,
+    direct_max_words=settings.ROUTER_DIRECT_MAX_WORDS,
+    large_min_words=settings.ROUTER_LARGE_MIN_WORDS,
+    classifier=create_chat_model(
+        settings.ROUTER_SMALL_MODEL,
+        temperature=0,
+        http_client=agent_registry.http_client,
+        http_async_client=agent_registry.http_async_client,
+        max_retries=0,
+    ) if settings.ROUTER_LLM_CLASSIFIER else None,
+)
+
 def convert_messages(messages: List[Message]):
     langchain_messages = []
     for msg in messages[:-1]:
@@ -113,6 +430,79 @@ def convert_messages(messages: List[Message]):
             langchain_messages.append(AIMessage(content=msg.content))
     return langchain_messages
 
+# Streamed LLM runs, buffered so a client that drops can resume with Last-Event-ID
+stream_runs = StreamRuns(
+    grace_seconds=settings.STREAM_RESUME_GRACE_SECONDS,
+    max_events=settings.STREAM_RESUME_MAX_EVENTS,
+    heartbeat_seconds=settings.SSE_HEARTBEAT_SECONDS,
+    shared=shared,
+)
+
+def sse_response(events, headers=None, resumable: bool = False) -> StreamingResponse:
+    """
+    Stream events (see sse.SSEWriter) as coalesced SSE frames with event IDs and heartbeats
+
+    A resumable stream runs on even if the client disconnects; its run ID is sent in the
+    X-Stream-Run header for GET /streams/{run_id}.
+    """
+    writer = SSEWriter(
+        coalesce_seconds=settings.SSE_COALESCE_MS / 1000,
+        coalesce_bytes=settings.SSE_COALESCE_BYTES,
+        heartbeat_seconds=settings.SSE_HEARTBEAT_SECONDS,
+    )
+    if not (resumable and settings.STREAM_RESUME):
+        return StreamingResponse(writer.stream(events), media_type="text/event-stream", headers=headers)
+    run = stream_runs.start(events, writer)
+    return StreamingResponse(
+        stream_runs.subscribe(run),
+        media_type="text/event-stream",
+        headers={**(headers or {}), "X-Stream-Run": run.id},
+    )
+
+@app.get("/streams")
+async def get_stream_stats():
+    return stream_runs.stats()
+
+@app.get("/state")
+async def get_state_stats():
+    """Shared state backend (STATE_BACKEND) operations and subscriptions"""
+    return state_backend.stats()
+
+@app.get("/streams/{run_id}")
+async def resume_stream(run_id: str, http_request: Request, last_event_id: Optional[int] = None):
+    """Reconnect to a streamed run: frames after Last-Event-ID (header or query), then live ones"""
+    # Runs of other workers are followed through the shared backend, if there is one
+    run = stream_runs.get(run_id) or await stream_runs.get_remote(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Stream run not found (finished too long ago or on another worker)")
+    header = http_request.headers.get("last-event-id")
+    if header is not None:
+        try:
+            last_event_id = int(header)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    try:
+        run.check_resumable(last_event_id)
+    except ResumeGap as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return StreamingResponse(
+        stream_runs.subscribe(run, last_event_id),
+        media_type="text/event-stream",
+        headers={"X-Stream-Run": run.id},
+    )
+
+@app.get("/health/live")
+async def liveness():
+    """The worker is up and its event loop is responsive"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """200 once warm-up has finished, 503 before that and while shutting down"""
+    if not readiness["ready"]:
+        return JSONResponse(status_code=503, content={"status": "warming_up", **readiness})
+    return {"status": "ready", **readiness}
+
 @app.get("/models")
 async def get_models():
     """Get list of available models"""
@@ -121,53 +511,298 @@ async def get_models():
         "default": "llama-3.3-70b-versatile"
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: request, LLM, tool, agent iteration and debate turn histograms"""
+    body, content_type = telemetry.metrics_response()
+    return PlainResponse(content=body, media_type=content_type)
+
+@app.get("/traces/{request_id}")
+async def get_trace(request_id: str):
+    """Span trace of a recent request that was sent with the X-Trace: 1 header"""
+    trace = telemetry.get_trace(request_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace
+
+@app.get("/agents/stats")
+async def get_agent_stats():
+    """Agent cache hit/miss counters and the currently built agents"""
+    return agent_registry.stats()
+
+@app.get("/llm/limits")
+async def get_rate_limits():
+    """Per-model rate-limit budgets learned from Groq's headers, plus retry and fallback counts"""
+    return rate_limiter.stats()
+
+@app.post("/agents/invalidate")
+async def invalidate_agents(model: Optional[str] = None):
+    """Drop cached agents (all of them, or only those for one model)"""
+    return {"invalidated": agent_registry.invalidate(model)}
+
+@app.get("/chat/cache")
+async def get_response_cache_stats():
+    """Response cache size and hit rate"""
+    return response_cache.stats()
+
+@app.delete("/chat/cache")
+async def clear_response_cache():
+    await response_cache_call(response_cache.clear)
+    return {"cleared": True}
+
+@app.get("/chat/routing")
+async def get_routing_stats():
+    """Routing decisions and per-route latency for model="auto" requests"""
+    return model_router.stats()
+
+@app.get("/search/cache")
+async def get_search_cache_stats():
+    """Tavily cache hit rate and upstream time saved"""
+    return search_cache.stats()
+
+@app.get("/search/prefetch")
+async def get_search_prefetch_stats():
+    """Speculative searches started, used and wasted, and the search latency they saved"""
+    return search_prefetcher.stats()
+
+@app.get("/usage/tenants")
+async def get_tenant_usage():
+    return tenant_ledger.stats()
+
+@app.get("/usage/tenants/{tenant}")
+async def get_usage_of_tenant(tenant: str):
+    return tenant_ledger.usage(tenant)
+
+@app.get("/moderation")
+async def get_moderation_stats():
+    return moderator.stats()
+
+@app.get("/knowledge")
+async def get_knowledge_stats():
+    """Offline reference index size and query latency"""
+    if knowledge_index is None:
+        raise HTTPException(status_code=404, detail="No knowledge index configured (KNOWLEDGE_INDEX_PATH)")
+    return knowledge_index.stats()
+
+@app.get("/knowledge/search")
+async def search_knowledge(query: str, k: int = 4):
+    """What the agent's medical_reference tool returns for a query"""
+    if knowledge_index is None:
+        raise HTTPException(status_code=404, detail="No knowledge index configured (KNOWLEDGE_INDEX_PATH)")
+    return {"results": knowledge_index.search(query, k)}
+
+class KnowledgeDocument(BaseModel):
+    source: str  # Unique id (file path, URL); re-adding a source replaces it if the text changed
+    text: str
+    title: Optional[str] = None
+
+class KnowledgeDocuments(BaseModel):
+    documents: List[KnowledgeDocument]
+
+@app.post("/knowledge/documents")
+async def add_knowledge_documents(request: KnowledgeDocuments):
+    """Add or update reference documents; the agent sees them on its next lookup"""
+    if knowledge_index is None:
+        raise HTTPException(status_code=404, detail="No knowledge index configured (KNOWLEDGE_INDEX_PATH)")
+    return await asyncio.to_thread(knowledge_index.add_documents, [doc.model_dump() for doc in request.documents])
+
+@app.post("/sessions")
+async def create_session():
+    """Start a server-side conversation; pass its session_id to /chat"""
+    return {"session_id": (await state_call(session_store.create)).id}
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    """Stored turns and the summary of older ones"""
+    session = await state_call(session_store.get, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session.to_dict()
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if not await state_call(session_store.delete, session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"deleted": True}
+
 @app.post("/chat")
-async def chat(request: ChatRequest):
-    if request.model not in AVAILABLE_MODELS:
+async def chat(request: ChatRequest, response: Response, http_request: Request):
+    # Already loaded once an agent has been built (see warm_up)
+    from langchain.agents import AgentExecutor
+
+    started = time.perf_counter()
+    if request.model not in AVAILABLE_MODELS and request.model != AUTO_MODEL:
         raise HTTPException(status_code=400, detail="Invalid model")
+    if not request.messages:
+        raise HTTPException(status_code=400, detail="No messages")
+    telemetry.set_model(request.model)
+    budget = start_budget(http_request, settings.CHAT_MAX_PROMPT_TOKENS, settings.CHAT_MAX_COMPLETION_TOKENS)
     
     current_query = request.messages[-1].content
-    chat_history = convert_messages(request.messages)
-    executor = create_medical_agent(request.model)
+    conversation = [(msg.role, msg.content) for msg in request.messages]
+    session = None
+    if request.session_id:
+        session = await state_call(session_store.get, request.session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        # Stored history is already converted; only the new turns need converting
+        chat_history = session.history() + convert_messages(request.messages)
+        earlier = [("summary", session.summary)] if session.summary else []
+        conversation = earlier + [(t["role"], t["content"]) for t in session.turns] + conversation
+    else:
+        chat_history = convert_messages(request.messages)
+    
+    # Serve repeated questions from cache, but never anything the prompt routes to search
+    use_cache = request.cache and not is_time_sensitive(current_query, SEARCH_TRIGGER_TERMS)
+    # Keyed on the full tool set: with "auto" the route (and so the tools) is only chosen on a miss
+    cache_prompt = response_cache_prompt()
+    cached = await response_cache_call(response_cache.get, request.model, cache_prompt, conversation) if use_cache else None
+    cache_status = "HIT" if cached is not None else ("MISS" if use_cache else "BYPASS")
+    headers = {"X-Cache": cache_status}
+
+    # "auto": pick the model, and whether the agent and search are needed at all
+    model, tools, route = request.model, ("knowledge", "tavily"), None
+    if request.model == AUTO_MODEL and cached is None:
+        route = await model_router.route(current_query, has_history=bool(chat_history))
+        model, tools = route.model, route.tools
+        telemetry.set_model(model)
+        headers.update({"X-Route": route.route, "X-Model": model})
 
     if request.stream:
+        async def generate_cached_stream():
+            yield {"content": cached}
+            if session is not None:
+                await record_session_turns(session, request.messages, cached)
+            yield DONE
+
+        if cached is not None:
+            return sse_response(generate_cached_stream(), headers)
+
+        executor = agent_registry.cached(model, tools) or await asyncio.to_thread(agent_registry.get, model, tools)
+        run_config = {"callbacks": [TelemetryCallbackHandler(model), BudgetCallbackHandler(budget, model)]}
+
         async def generate_stream():
-            if isinstance(executor, AgentExecutor):
-                # Standard for streaming from agents
-                async for event in executor.astream_events(
-                    {"input": current_query, "chat_history": chat_history},
-                    version="v1"
-                ):
-                    kind = event["event"]
-                    if kind == "on_chat_model_stream":
-                        content = event["data"]["chunk"].content
-                        if content:
-                            yield f"data: {json.dumps({'content': content})}\n\n"
-            else:
-                messages = [SystemMessage(content=MEDICAL_ASSISTANT_SYSTEM_PROMPT)] + chat_history + [HumanMessage(content=current_query)]
-                async for chunk in executor.astream(messages):
-                    yield f"data: {json.dumps({'content': chunk.content})}\n\n"
-            yield "data: [DONE]\n\n"
+            parts = []
+            # Classifies the question now, alongside the first LLM call
+            guard = moderator.guard(current_query)
+            try:
+                if isinstance(executor, AgentExecutor):
+                    with search_prefetcher.speculate(current_query, prefetch_search(executor)):
+                        # Standard for streaming from agents; closed (cancelling generation) when flagged
+                        async with aclosing(executor.astream_events(
+                            {"input": current_query, "chat_history": chat_history},
+                            config=run_config,
+                            version="v1"
+                        )) as events:
+                            async for event in events:
+                                kind = event["event"]
+                                if kind == "on_chat_model_stream":
+                                    content = event["data"]["chunk"].content
+                                    if content:
+                                        await guard.admit(content)
+                                        parts.append(content)
+                                        yield Delta(content)
+                else:
+                    messages = [SystemMessage(content=MEDICAL_ASSISTANT_SYSTEM_PROMPT)] + chat_history + [HumanMessage(content=current_query)]
+                    async with aclosing(executor.astream(messages, config=run_config)) as chunks:
+                        async for chunk in chunks:
+                            await guard.admit(chunk.content)
+                            parts.append(chunk.content)
+                            yield Delta(chunk.content)
+                await guard.finish()
+            except BudgetExceeded:
+                # Out of tokens: keep what was streamed (checked by moderation all the same)
+                if not parts:
+                    parts.append(BUDGET_STOPPED_REPLY)
+                    yield Delta(BUDGET_STOPPED_REPLY)
+                try:
+                    await guard.finish()
+                except ContentFlagged as e:
+                    yield e.event()
+                    yield budget.event()
+                    yield DONE
+                    return
+            except ContentFlagged as e:
+                # Nothing flagged is cached or kept in the session
+                yield e.event()
+                yield budget.event()
+                yield DONE
+                return
+            # Answers cut short by the budget aren't cached
+            if use_cache and parts and budget.stopped is None:
+                await response_cache_call(response_cache.set, request.model, cache_prompt, conversation, "".join(parts))
+            if session is not None:
+                await record_session_turns(session, request.messages, "".join(parts))
+            if route is not None:
+                model_router.record_latency(route, time.perf_counter() - started)
+            yield budget.event()
+            yield DONE
 
-        return StreamingResponse(generate_stream(), media_type="text/event-stream")
+        return sse_response(generate_stream(), headers, resumable=True)
 
     else:
-        if isinstance(executor, AgentExecutor):
-            # INVOKE includes tool execution automatically
-            result = await executor.ainvoke({"input": current_query, "chat_history": chat_history})
-            response_content = result["output"]
-        else:
-            messages = [SystemMessage(content=MEDICAL_ASSISTANT_SYSTEM_PROMPT)] + chat_history + [HumanMessage(content=current_query)]
-            result = await executor.ainvoke(messages)
-            response_content = result.content
+        response.headers.update(headers)
+        if cached is not None:
+            if session is not None:
+                await record_session_turns(session, request.messages, cached)
+            return ChatResponse(role="assistant", content=cached)
+        
+        executor = agent_registry.cached(model, tools) or await asyncio.to_thread(agent_registry.get, model, tools)
+        run_config = {"callbacks": [TelemetryCallbackHandler(model), BudgetCallbackHandler(budget, model)]}
+        # Flagged content raises ContentFlagged (400, see content_flagged_handler)
+        guard = moderator.guard(current_query)
+        try:
+            if isinstance(executor, AgentExecutor):
+                # INVOKE includes tool execution automatically
+                with search_prefetcher.speculate(current_query, prefetch_search(executor)):
+                    result = await guard.run(executor.ainvoke({"input": current_query, "chat_history": chat_history}, config=run_config))
+                response_content = result["output"]
+            else:
+                messages = [SystemMessage(content=MEDICAL_ASSISTANT_SYSTEM_PROMPT)] + chat_history + [HumanMessage(content=current_query)]
+                result = await guard.run(executor.ainvoke(messages, config=run_config))
+                response_content = result.content
+        except BudgetExceeded as e:
+            # Cut off at the completion budget (keep what was generated) or stopped before an
+            # LLM call that would have gone over it
+            response_content = e.partial or BUDGET_STOPPED_REPLY
+        await guard.admit(response_content)
+        await guard.finish()
+        response.headers.update(budget.headers())
+        
+        if use_cache and budget.stopped is None:
+            await response_cache_call(response_cache.set, request.model, cache_prompt, conversation, response_content)
+        if session is not None:
+            await record_session_turns(session, request.messages, response_content)
+        if route is not None:
+            model_router.record_latency(route, time.perf_counter() - started)
             
         return ChatResponse(role="assistant", content=response_content)
 
 # Autogen Medical Arena Endpoints
+# Debates run on their own bounded pool so they never starve /chat
+debate_scheduler = DebateScheduler(
+    workers=settings.DEBATE_WORKERS,
+    max_queue=settings.DEBATE_MAX_QUEUE,
+    model_limits=settings.DEBATE_MODEL_CONCURRENCY,
+    default_model_limit=settings.DEBATE_DEFAULT_MODEL_CONCURRENCY,
+)
+
+@app.exception_handler(SchedulerFull)
+async def scheduler_full_handler(request, exc: SchedulerFull):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 class DebateRequest(BaseModel):
     symptoms: str
     model: str = "llama-3.3-70b-versatile"
     max_rounds: int = 25
+    stream_tokens: bool = False  # /arena/debate-stream only: per-token delta events
+    seed: Optional[int] = None  # Deterministic mode: same request is replayed from the transcript store
+    replay_speed: Optional[float] = None  # /arena/debate-stream replays: 1.0 = original pacing, None = instant
+    role_models: Optional[Dict[str, str]] = None  # Per-agent models on top of DEBATE_ROLE_MODELS, e.g. {"Doctor": "openai/gpt-oss-120b"}
 
 class DebateMessage(BaseModel):
     role: str
@@ -176,23 +811,120 @@ class DebateMessage(BaseModel):
 
 class DebateResponse(BaseModel):
     messages: List[DebateMessage]
+    stopped_reason: Optional[str] = None  # Set when the debate was cut short (e.g. "deadline")
+    replayed: bool = False  # Served from the transcript store
+
+# Bounded per-agent context for every debate (see debate_memory)
+debate_memory_options = {
+    "memory": settings.DEBATE_MEMORY,
+    "summary_model": settings.DEBATE_SUMMARY_MODEL,
+    "summary_every": settings.DEBATE_SUMMARY_EVERY,
+}
+
+# Finished seeded debates, replayed instead of re-running the conversation
+if shared is not None:
+    transcript_store = SharedTranscriptStore(shared, ttl=settings.STATE_TRANSCRIPT_TTL)
+else:
+    transcript_store = TranscriptStore(
+        settings.TRANSCRIPT_STORE_PATH,
+        max_bytes=int(settings.TRANSCRIPT_STORE_MAX_MB * 1024 * 1024),
+    )
+
+# Agents a DebateRequest's role_models may name (autogen_agents.DEBATE_SPEAKERS, without importing autogen)
+DEBATE_ROLES = ("Doctor", "Resident", "Patient")
+
+def debate_role_models(request: DebateRequest) -> Dict[str, str]:
+    """Model per agent: the request's role_models on top of DEBATE_ROLE_MODELS"""
+    return {**settings.DEBATE_ROLE_MODELS, **(request.role_models or {})}
+
+def debate_request_error(request: DebateRequest) -> Optional[str]:
+    """Why the request's models can't be used, or None"""
+    if request.model not in AVAILABLE_MODELS:
+        return "Invalid model"
+    for role, model in (request.role_models or {}).items():
+        if role not in DEBATE_ROLES:
+            return f"Unknown role in role_models: {role} (expected one of {', '.join(DEBATE_ROLES)})"
+        if model not in AVAILABLE_MODELS:
+            return f"Invalid model for {role}: {model}"
+    return None
+
+async def stored_transcript(request: DebateRequest):
+    """(key, stored transcript or None) for a seeded request, (None, None) otherwise"""
+    if request.seed is None:
+        return None, None
+    key = transcript_key(request.symptoms, request.model, request.max_rounds, request.seed, debate_role_models(request))
+    return key, await state_call(transcript_store.get, key)
+
+async def store_transcript(key: str, request: DebateRequest, messages, turn_seconds):
+    await state_call(
+        transcript_store.put, key, request.symptoms, request.model, request.max_rounds, request.seed, messages, turn_seconds,
+    )
+
+async def cancel_on_disconnect(http_request: Request, control: DebateControl, interval: float = 1.0):
+    """Cancel the debate once the client has gone away"""
+    while not control.cancelled:
+        if await http_request.is_disconnected():
+            control.cancel("client disconnected")
+            return
+        await asyncio.sleep(interval)
 
 @app.post("/arena/debate")
-async def medical_debate(request: DebateRequest):
+async def medical_debate(request: DebateRequest, http_request: Request, response: Response):
     """Start a Doctor-Resident debate about patient symptoms"""
+    telemetry.set_model(request.model)
+    budget = start_budget(http_request, settings.DEBATE_MAX_PROMPT_TOKENS, settings.DEBATE_MAX_COMPLETION_TOKENS)
+    control = DebateControl(settings.DEBATE_DEADLINE_SECONDS, budget=budget)
+    watcher = asyncio.create_task(cancel_on_disconnect(http_request, control))
     try:
-        if request.model not in AVAILABLE_MODELS:
-            raise HTTPException(status_code=400, detail="Invalid model")
+        error = debate_request_error(request)
+        if error is not None:
+            raise HTTPException(status_code=400, detail=error)
+        
+        key, stored = await stored_transcript(request)
+        if stored is not None:
+            return DebateResponse(
+                messages=[DebateMessage(**msg) for msg in stored["messages"]],
+                replayed=True,
+            )
         
         groq_api_key = os.getenv("GROQ_API_KEY")
         if not groq_api_key:
             raise HTTPException(status_code=500, detail="GROQ_API_KEY not configured")
         
-        # Create debate system
-        debate_system = MedicalDebateSystem(groq_api_key, request.model)
+        from autogen_agents import MedicalDebateSystem
+
+        # Classifies the symptoms while the debate queues and starts
+        guard = moderator.guard(request.symptoms)
+        # Wait for a debate slot (raises SchedulerFull -> 429/503 when the queue is full)
+        ticket = debate_scheduler.reserve(request.model, debate_role_models(request))
+        try:
+            await ticket.wait_admitted(control.check)
+            
+            # Create debate system
+            debate_system = MedicalDebateSystem(
+                groq_api_key,
+                request.model,
+                executor=ticket,
+                control=control,
+                http_client=agent_registry.http_client,
+                **debate_memory_options,
+                role_models=debate_role_models(request),
+                seed=request.seed,
+            )
+            
+            # Run the debate
+            messages = await guard.run(debate_system.run_debate(request.symptoms, request.max_rounds))
+        finally:
+            ticket.release()
+        # Every message is checked concurrently (the symptoms, already checked, are the first)
+        for msg in messages[1:]:
+            await guard.admit(msg["content"] + "\n")
+        await guard.finish()
+        response.headers.update(budget.headers())
         
-        # Run the debate
-        messages = await debate_system.run_debate(request.symptoms, request.max_rounds)
+        # Only complete debates are worth replaying
+        if key is not None and debate_system.stopped_reason is None:
+            await store_transcript(key, request, messages, debate_system.turn_seconds)
         
         # Format response
         debate_messages = [
@@ -204,44 +936,265 @@ async def medical_debate(request: DebateRequest):
             for msg in messages
         ]
         
-        return DebateResponse(messages=debate_messages)
+        return DebateResponse(messages=debate_messages, stopped_reason=debate_system.stopped_reason)
     
+    except DebateCancelled as e:
+        # Still queued when the deadline passed or the client left
+        raise HTTPException(status_code=504, detail=f"Debate not started: {e.reason}")
+    except ContentFlagged:
+        control.cancel("moderation")
+        raise
+    except (HTTPException, SchedulerFull):
+        raise
     except Exception as e:
-        print(f"Debate error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Debate error")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        watcher.cancel()
 
 @app.post("/arena/debate-stream")
-async def medical_debate_stream(request: DebateRequest):
+async def medical_debate_stream(request: DebateRequest, http_request: Request):
     """Stream Doctor-Resident debate messages in real-time as they're generated"""
+    telemetry.set_model(request.model)
+    budget = start_budget(http_request, settings.DEBATE_MAX_PROMPT_TOKENS, settings.DEBATE_MAX_COMPLETION_TOKENS)
+    key, stored = await stored_transcript(request)
+    if stored is not None:
+        from autogen_streaming import replay_debate
+
+        async def generate_replay():
+            async for msg in replay_debate(
+                stored["messages"],
+                stored["turn_seconds"],
+                speed=request.replay_speed,
+                stream_tokens=request.stream_tokens,
+            ):
+                yield msg
+            yield DONE
+
+        return sse_response(generate_replay(), {"X-Transcript-Cache": "HIT"})
+
+    # Reject up front so the client gets a real 429/503 instead of an SSE error
+    debate_scheduler.ensure_capacity(request.model, debate_role_models(request))
+    
     async def generate_debate_stream():
+        ticket = None
+        control = DebateControl(settings.DEBATE_DEADLINE_SECONDS, budget=budget)
         try:
-            if request.model not in AVAILABLE_MODELS:
-                yield f"data: {json.dumps({'error': 'Invalid model'})}\n\n"
+            error = debate_request_error(request)
+            if error is not None:
+                yield {"error": error}
                 return
             
             groq_api_key = os.getenv("GROQ_API_KEY")
             if not groq_api_key:
-                yield f"data: {json.dumps({'error': 'GROQ_API_KEY not configured'})}\n\n"
+                yield {"error": "GROQ_API_KEY not configured"}
                 return
             
+            # Classifies the symptoms while the debate queues and starts
+            guard = moderator.guard(request.symptoms)
+            # Report the queue position until a debate slot is free
+            ticket = debate_scheduler.reserve(request.model, debate_role_models(request))
+            async for position in ticket.wait():
+                control.check()
+                yield {"type": "queued", "position": position}
+            
+            from autogen_streaming import StreamingDebateSystem
+
             # Create streaming debate system
-            debate_system = StreamingDebateSystem(groq_api_key, request.model)
+            debate_system = StreamingDebateSystem(
+                groq_api_key,
+                request.model,
+                executor=ticket,
+                control=control,
+                stream_tokens=request.stream_tokens,
+                http_client=agent_registry.http_client,
+                **debate_memory_options,
+                role_models=debate_role_models(request),
+                seed=request.seed,
+            )
             
             # Stream messages as they're generated in real-time
+            messages = []
             async for msg in debate_system.run_debate_streaming(request.symptoms, request.max_rounds):
-                yield f"data: {json.dumps(msg)}\n\n"
+                if msg.get("type") in (None, "turn_end"):
+                    messages.append({"role": msg["role"], "content": msg["content"], "name": msg["name"]})
+                    # Each finished message is a moderation window (token deltas aren't checked separately)
+                    if len(messages) > 1:
+                        await guard.admit(msg["content"] + "\n")
+                yield Delta(msg["content"], type="delta", role=msg["role"], name=msg["name"]) if msg.get("type") == "delta" else msg
             
-            yield "data: [DONE]\n\n"
+            await guard.finish()
+            if key is not None and debate_system.stopped_reason is None:
+                await store_transcript(key, request, messages, debate_system.turn_seconds)
+            yield budget.event()
+            yield DONE
         
+        except ContentFlagged as e:
+            control.cancel("moderation")
+            yield e.event()
+            yield budget.event()
+            yield DONE
+        except DebateCancelled as e:
+            yield {"type": "stopped", "reason": e.reason}
+            yield budget.event()
         except Exception as e:
-            print(f"Debate stream error: {e}")
-            import traceback
-            traceback.print_exc()
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            logger.exception("Debate stream error")
+            yield {"error": str(e)}
+        
+        finally:
+            # Also runs when the client is gone for good (stream_runs grace period, or right
+            # away without STREAM_RESUME): stop the debate between rounds
+            # (harmless once the debate has already finished)
+            control.cancel("client disconnected")
+            if ticket is not None:
+                ticket.release()
     
-    return StreamingResponse(generate_debate_stream(), media_type="text/event-stream")
+    return sse_response(
+        generate_debate_stream(), {"X-Transcript-Cache": "MISS"} if key is not None else None, resumable=True
+    )
+
+@app.get("/arena/transcripts")
+async def get_transcript_store_stats():
+    """Transcript store size and replay hit rate"""
+    return await state_call(transcript_store.stats)
+
+@app.delete("/arena/transcripts")
+async def purge_transcripts(model: Optional[str] = None):
+    """Purge stored transcripts (all of them, or only those for one model)"""
+    return {"purged": await state_call(transcript_store.purge, model=model)}
+
+@app.delete("/arena/transcripts/{key}")
+async def purge_transcript(key: str):
+    return {"purged": await state_call(transcript_store.purge, key=key)}
+
+@app.get("/arena/scheduler")
+async def get_scheduler_stats():
+    """Running and queued debates per model"""
+    return debate_scheduler.stats()
+
+async def run_batch_case(symptoms: str, model: str, max_rounds: int, control: DebateControl):
+    """One batch case: waits its turn in the debate scheduler like any other debate"""
+    from autogen_agents import MedicalDebateSystem
+
+    while True:
+        try:
+            ticket = debate_scheduler.reserve(model, settings.DEBATE_ROLE_MODELS)
+            break
+        except SchedulerFull as e:
+            if e.status_code != 429:
+                raise
+            # Interactive debates filled the queue; try again once a slot is likely free
+            control.check()
+            await asyncio.sleep(e.retry_after)
+    try:
+        await ticket.wait_admitted(control.check)
+        debate_system = MedicalDebateSystem(
+            os.getenv("GROQ_API_KEY"),
+            model,
+            executor=ticket,
+            control=control,
+            http_client=agent_registry.http_client,
+            **debate_memory_options,
+            role_models=settings.DEBATE_ROLE_MODELS,
+        )
+        messages = await debate_system.run_debate(symptoms, max_rounds)
+        return messages, debate_system.stopped_reason
+    finally:
+        ticket.release()
+
+def start_batch_budget(tenant: str) -> RequestBudget:
+    """A batch case's budget: the debate limits, charged to the tenant that submitted the job"""
+    tenant_ledger.admit(tenant)
+    return RequestBudget(
+        settings.DEBATE_MAX_PROMPT_TOKENS,
+        settings.DEBATE_MAX_COMPLETION_TOKENS,
+        tenant=tenant,
+        ledger=tenant_ledger,
+        prices=settings.LLM_PRICES,
+    )
+
+# Batches of vignettes; transcripts are appended to <BATCH_JOBS_DIR>/<job_id>/transcripts.jsonl
+batch_jobs = BatchJobManager(
+    settings.BATCH_JOBS_DIR,
+    run_batch_case,
+    start_batch_budget,
+    max_parallel=settings.BATCH_MAX_PARALLEL,
+    deadline_seconds=settings.DEBATE_DEADLINE_SECONDS,
+)
+
+class BatchJobRequest(BaseModel):
+    cases: List[str]  # symptom vignettes
+    model: str = "llama-3.3-70b-versatile"
+    max_rounds: int = 25
+
+def get_batch_job(job_id: str):
+    job = batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/arena/jobs")
+async def create_batch_job(request: BatchJobRequest, http_request: Request):
+    """Run a batch of symptom vignettes through the debate system in parallel"""
+    if request.model not in AVAILABLE_MODELS:
+        raise HTTPException(status_code=400, detail="Invalid model")
+    if not request.cases or len(request.cases) > settings.BATCH_MAX_CASES:
+        raise HTTPException(status_code=400, detail=f"Submit between 1 and {settings.BATCH_MAX_CASES} cases")
+    if not os.getenv("GROQ_API_KEY"):
+        raise HTTPException(status_code=500, detail="GROQ_API_KEY not configured")
+    # Refuse up front when the tenant is already over quota (429); each case is admitted again
+    tenant = http_request.headers.get("x-tenant-id") or "anonymous"
+    tenant_ledger.admit(tenant)
+    job = batch_jobs.create(request.cases, request.model, request.max_rounds, tenant)
+    return job.summary()
+
+@app.get("/arena/jobs")
+async def list_batch_jobs():
+    return {"jobs": [job.summary() for job in batch_jobs.jobs.values()]}
+
+@app.get("/arena/jobs/{job_id}")
+async def get_batch_job_status(job_id: str):
+    """Job progress and the status of each case"""
+    job = get_batch_job(job_id)
+    return {
+        **job.summary(),
+        "cases": [
+            {"index": i, "symptoms": symptoms, "status": job.case_status.get(i, "pending")}
+            for i, symptoms in enumerate(job.cases)
+        ],
+    }
+
+@app.get("/arena/jobs/{job_id}/events")
+async def stream_batch_job(job_id: str):
+    """Stream job and case progress events until the job finishes"""
+    job = get_batch_job(job_id)
+
+    async def generate_events():
+        async for event in job.watch():
+            yield event
+        yield DONE
+
+    return sse_response(generate_events())
+
+@app.get("/arena/jobs/{job_id}/transcripts")
+async def get_batch_transcripts(job_id: str):
+    """Finished cases as JSON Lines (one record per case attempt)"""
+    job = get_batch_job(job_id)
+    if not os.path.exists(job.transcript_path):
+        return PlainResponse(content=b"", media_type="application/x-ndjson")
+    return FileResponse(job.transcript_path, media_type="application/x-ndjson", filename=f"{job_id}.jsonl")
+
+@app.post("/arena/jobs/{job_id}/resume")
+async def resume_batch_job(job_id: str):
+    """Re-run only the cases that have not completed (failed, cancelled or interrupted)"""
+    job = get_batch_job(job_id)
+    return {"resumed_cases": batch_jobs.resume(job), **job.summary()}
+
+@app.post("/arena/jobs/{job_id}/cancel")
+async def cancel_batch_job(job_id: str):
+    job = get_batch_job(job_id)
+    batch_jobs.cancel(job)
+    return job.summary()
 
 if __name__ == "__main__":
     import uvicorn
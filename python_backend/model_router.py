@@ -0,0 +1,172 @@
+"""
+Complexity-based model routing for /chat requests with model "auto"
+
+Three routes:
+- direct: small model answers on its own (no AgentExecutor, no Tavily) - terminology lookups
+- large: large model without tools - reasoning that doesn't need fresh information
+- search: large model with the tool-calling agent, Tavily and the offline reference index
+  (if configured) - anything time-sensitive
+
+Cheap keyword/length heuristics decide most queries; ambiguous ones can optionally be
+classified by the small model. Decisions and per-route latency are kept for tuning.
+"""
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import telemetry
+from response_cache import is_time_sensitive, normalize_text
+
+AUTO_MODEL = "auto"
+
+ROUTE_TOOLS: Dict[str, Tuple[str, ...]] = {
+    "direct": (),
+    "large": (),
+    "search": ("knowledge", "tavily"),
+}
+
+# Lookups a small model answers well: definitions, abbreviations, normal values
+DIRECT_PATTERNS = [
+    r"^(what is|what's|what are|define|definition of|meaning of|what does)\b",
+    r"\b(stand for|abbreviation|acronym|full form|medical term for|synonym)\b",
+    r"\b(normal range|normal value|reference range|spell|pronounce)\b",
+]
+
+# Signals that a question needs the large model's reasoning
+COMPLEX_TERMS = [
+    "differential", "diagnos", "management", "treatment plan", "compare", "versus", " vs ",
+    "mechanism", "pathophysiology", "contraindicat", "interaction", "dose adjustment",
+    "case", "patient with", "year-old", "year old", "why", "explain", "evidence", "pros and cons",
+]
+
+CLASSIFIER_PROMPT = """Classify this medical question for routing. Answer with exactly one word:
+DIRECT - a short factual lookup (definition, abbreviation, normal value) a small model can answer
+LARGE - needs careful clinical reasoning or a detailed explanation
+SEARCH - needs current information (news, recent guidelines, trials, approvals, statistics)
+
+Question: {query}
+Answer:"""
+
+
+class RouteDecision:
+    """Where a query goes and why"""
+
+    def __init__(self, route: str, model: str, reason: str, classifier_seconds: float = 0.0):
+        self.route = route
+        self.model = model
+        self.tools = ROUTE_TOOLS[route]
+        self.reason = reason
+        self.classifier_seconds = classifier_seconds
+
+
+class ModelRouter:
+    """Picks a route for each "auto" query and records routing outcomes"""
+
+    def __init__(
+        self,
+        small_model: str,
+        large_model: str,
+        search_triggers: List[str],
+        direct_max_words: int = 12,
+        large_min_words: int = 40,
+        classifier=None,
+        history_size: int = 500,
+    ):
+        """
+        Args:
+            small_model: Model for the direct route (and the classifier)
+            large_model: Model for the large and search routes
+            search_triggers: Phrases that send a query to search (see SEARCH_TRIGGER_TERMS)
+            direct_max_words: Longest query the heuristics may send to the direct route
+            large_min_words: Queries at least this long always go to the large model
+            classifier: Optional LangChain chat model consulted when the heuristics are unsure
+            history_size: Recent latencies kept per route for stats()
+        """
+        self.small_model = small_model
+        self.large_model = large_model
+        self.search_triggers = search_triggers
+        self.direct_max_words = direct_max_words
+        self.large_min_words = large_min_words
+        self.classifier = classifier
+        self._direct = [re.compile(p) for p in DIRECT_PATTERNS]
+        self._lock = threading.Lock()
+        self._decisions: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._latencies: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=history_size))
+
+    def _decision(self, route: str, reason: str, classifier_seconds: float = 0.0) -> RouteDecision:
+        model = self.small_model if route == "direct" else self.large_model
+        return RouteDecision(route, model, reason, classifier_seconds)
+
+    def heuristic(self, query: str, has_history: bool = False) -> Optional[RouteDecision]:
+        """Route by keywords and length, or None if the query is ambiguous"""
+        if is_time_sensitive(query, self.search_triggers):
+            return self._decision("search", "time_sensitive")
+        text = normalize_text(query)
+        words = len(text.split())
+        if words >= self.large_min_words:
+            return self._decision("large", "long_query")
+        if any(term in f" {text} " for term in COMPLEX_TERMS):
+            return self._decision("large", "complex_terms")
+        if (
+            words <= self.direct_max_words
+            and not has_history
+            and query.count("?") <= 1
+            and any(p.search(text) for p in self._direct)
+        ):
+            return self._decision("direct", "lookup")
+        return None
+
+    async def route(self, query: str, has_history: bool = False) -> RouteDecision:
+        decision = self.heuristic(query, has_history)
+        if decision is None and self.classifier is not None:
+            decision = await self._classify(query)
+        if decision is None:
+            # Unsure and no classifier: the large model is the safe choice
+            decision = self._decision("large", "default")
+        with self._lock:
+            self._decisions[(decision.route, decision.reason)] += 1
+        telemetry.record_route_decision(decision.route, decision.reason, decision.classifier_seconds)
+        return decision
+
+    async def _classify(self, query: str) -> Optional[RouteDecision]:
+        started = time.perf_counter()
+        try:
+            result = await self.classifier.ainvoke(CLASSIFIER_PROMPT.format(query=query))
+        except Exception:
+            telemetry.logger.exception("Routing classifier failed")
+            return None
+        seconds = time.perf_counter() - started
+        answer = str(result.content).strip().upper()
+        for route in ("SEARCH", "DIRECT", "LARGE"):
+            if answer.startswith(route):
+                return self._decision(route.lower(), "classifier", seconds)
+        return None
+
+    def record_latency(self, decision: RouteDecision, seconds: float):
+        """Record how long a routed request took end to end"""
+        with self._lock:
+            self._latencies[decision.route].append(seconds)
+        telemetry.record_route_latency(decision.route, decision.model, seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            decisions: Dict[str, Dict[str, int]] = defaultdict(dict)
+            for (route, reason), count in self._decisions.items():
+                decisions[route][reason] = count
+            latency = {}
+            for route, samples in self._latencies.items():
+                ordered = sorted(samples)
+                latency[route] = {
+                    "requests": len(ordered),
+                    "p50_ms": round(ordered[len(ordered) // 2] * 1000, 1),
+                    "p95_ms": round(ordered[round(0.95 * (len(ordered) - 1))] * 1000, 1),
+                }
+        return {
+            "small_model": self.small_model,
+            "large_model": self.large_model,
+            "classifier": self.classifier is not None,
+            "decisions": dict(decisions),
+            "latency": latency,
+        }
@@ -0,0 +1,282 @@
+"""
+Safety classification of /chat and debate traffic with Llama Guard (MODERATION_MODEL)
+
+Checking the question before generating, and each piece of output before sending it,
+would put a guard round trip in front of the first token and stall the stream at every
+window. Instead:
+
+- the question is classified while the agent's first LLM call runs; the first token is
+  only held back if the verdict hasn't arrived by then (rare: the guard is a short call)
+- streamed output is classified in the background every MODERATION_WINDOW_CHARS
+  characters, while generation continues; the last window is checked before the stream ends
+
+When something is flagged the generation is cancelled and the stream ends with a
+{"type": "moderation", ...} event. Output windows are sent before their verdict arrives,
+so an output-stage event carries "retract": true: clients should remove the reply.
+
+Verdicts are cached by normalized text, so repeated questions and replies skip the guard.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+import telemetry
+from response_cache import normalize_text
+from search_cache import SearchCache
+from telemetry import logger
+
+# Llama Guard 4 hazard categories (MLCommons taxonomy)
+HAZARD_CATEGORIES = {
+    "S1": "Violent Crimes",
+    "S2": "Non-Violent Crimes",
+    "S3": "Sex-Related Crimes",
+    "S4": "Child Sexual Exploitation",
+    "S5": "Defamation",
+    "S6": "Specialized Advice",
+    "S7": "Privacy",
+    "S8": "Intellectual Property",
+    "S9": "Indiscriminate Weapons",
+    "S10": "Hate",
+    "S11": "Suicide & Self-Harm",
+    "S12": "Sexual Content",
+    "S13": "Elections",
+    "S14": "Code Interpreter Abuse",
+}
+
+
+def parse_verdict(text: str) -> Dict[str, Any]:
+    """Llama Guard's reply ("safe", or "unsafe" and a line of categories like "S1,S10") as a verdict"""
+    lines = [line.strip() for line in str(text).strip().splitlines() if line.strip()]
+    if not lines or lines[0].lower() != "unsafe":
+        return {"flagged": False, "categories": []}
+    categories = [c.strip().upper() for line in lines[1:] for c in line.split(",") if c.strip()]
+    return {"flagged": True, "categories": categories}
+
+
+class ContentFlagged(Exception):
+    """Raised by ModerationGuard when the question or the output was flagged"""
+
+    status_code = 400
+
+    def __init__(self, stage: str, verdict: Dict[str, Any]):
+        super().__init__(f"Content flagged at the {stage} stage: {', '.join(verdict['categories']) or 'unsafe'}")
+        self.stage = stage
+        self.verdict = verdict
+
+    def event(self) -> Dict[str, Any]:
+        """The SSE event (and error body) describing the verdict"""
+        return {
+            "type": "moderation",
+            "stage": self.stage,
+            "categories": self.verdict["categories"],
+            "labels": [HAZARD_CATEGORIES.get(c, c) for c in self.verdict["categories"]],
+            # Output windows are sent before their verdict: the client should drop the reply
+            "retract": self.stage == "output",
+        }
+
+
+class Moderator:
+    """Classifies text with the guard model and caches verdicts; thread-safe"""
+
+    def __init__(
+        self,
+        create_llm: Callable[[], Any],
+        cache: SearchCache,
+        window_chars: int = 400,
+        context_chars: int = 2000,
+        ignore_categories=(),
+        fail_open: bool = True,
+        enabled: bool = True,
+    ):
+        """
+        Args:
+            create_llm: Builds the LangChain chat model for the guard; called on the first
+                check so startup doesn't pay for it
+            cache: Where verdicts are kept (keyed by the normalized conversation)
+            window_chars: New output characters that trigger another output check
+            context_chars: How much of the reply so far each output check sends
+            ignore_categories: Hazard codes that don't count as flagged (e.g. "S6",
+                specialized advice, which is what a medical assistant gives)
+            fail_open: Treat a failed guard call as safe (False: as flagged)
+            enabled: Whether to classify at all
+        """
+        self.create_llm = create_llm
+        self._llm = None
+        self.cache = cache
+        self.window_chars = window_chars
+        self.context_chars = context_chars
+        self.ignore_categories = set(ignore_categories)
+        self.fail_open = fail_open
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {
+            "input": 0, "output": 0, "flagged_input": 0, "flagged_output": 0, "guard_calls": 0, "errors": 0,
+        }
+        self.waited_seconds = 0.0
+        self.guard_seconds = 0.0
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            self._llm = self.create_llm()
+        return self._llm
+
+    def _count(self, key: str, guard_seconds: float = 0.0):
+        with self._lock:
+            self._counts[key] += 1
+            self.guard_seconds += guard_seconds
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.waited_seconds += seconds
+
+    async def _fetch(self, conversation: List[Tuple[str, str]]) -> Dict[str, Any]:
+        messages = [HumanMessage(content=text) if role == "user" else AIMessage(content=text) for role, text in conversation]
+        started = time.perf_counter()
+        try:
+            result = await self.llm.ainvoke(messages)
+        except Exception as e:
+            logger.warning("Moderation check failed", extra={"error": str(e)})
+            self._count("errors")
+            return {"flagged": not self.fail_open, "categories": [], "error": str(e)}
+        self._count("guard_calls", time.perf_counter() - started)
+        return parse_verdict(result.content)
+
+    async def classify(self, stage: str, conversation: List[Tuple[str, str]]) -> Dict[str, Any]:
+        """
+        Verdict for a conversation, from the cache when the same text was seen before
+
+        Args:
+            stage: "input" (the last message is the user's) or "output" (the assistant's)
+            conversation: (role, text) pairs, role "user" or "assistant"
+
+        Returns:
+            {"flagged": bool, "categories": [...]} with ignored categories left out
+        """
+        started = time.perf_counter()
+        key = hashlib.sha256(
+            "\x1e".join(f"{role}\x1f{normalize_text(text)}" for role, text in conversation).encode()
+        ).hexdigest()
+        verdict = await self.cache.aget_or_fetch(
+            "guard:" + key, lambda: self._fetch(conversation), cacheable=lambda v: "error" not in v
+        )
+        categories = [c for c in verdict["categories"] if c not in self.ignore_categories]
+        # "unsafe" without categories still counts; only a verdict made of ignored ones doesn't
+        flagged = verdict["flagged"] and (bool(categories) or not verdict["categories"])
+        self._count(stage)
+        if flagged:
+            self._count("flagged_" + stage)
+        telemetry.record_moderation(stage, "error" if "error" in verdict else ("unsafe" if flagged else "safe"),
+                                    time.perf_counter() - started)
+        return {"flagged": flagged, "categories": categories}
+
+    def guard(self, query: str) -> "ModerationGuard":
+        """Start moderating a request for query; must be called from a running event loop"""
+        return ModerationGuard(self, query)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+            calls = counts["guard_calls"]
+            return {
+                "enabled": self.enabled,
+                **counts,
+                # Time streams waited for an input verdict after their first token was ready
+                "waited_seconds": round(self.waited_seconds, 3),
+                "avg_guard_seconds": round(self.guard_seconds / calls, 3) if calls else 0.0,
+                "cache": self.cache.stats(),
+            }
+
+
+class ModerationGuard:
+    """
+    Moderation of one request: the input check starts on creation, output is fed in as it is produced
+
+    All methods raise ContentFlagged once a verdict flags the content. When the moderator
+    is disabled they do nothing.
+    """
+
+    def __init__(self, moderator: Moderator, query: str):
+        self.moderator = moderator
+        self.query = query
+        self.text = ""
+        self.checked_chars = 0
+        self._input: Optional[asyncio.Future] = None
+        self._input_checked = False
+        self._windows: List[asyncio.Future] = []
+        if moderator.enabled:
+            self._input = asyncio.ensure_future(moderator.classify("input", [("user", query)]))
+
+    async def _check_input(self):
+        if self._input is None or self._input_checked:
+            return
+        if not self._input.done():
+            started = time.perf_counter()
+            await asyncio.shield(self._input)
+            self.moderator.record_wait(time.perf_counter() - started)
+        self._input_checked = True
+        verdict = self._input.result()
+        if verdict["flagged"]:
+            raise ContentFlagged("input", verdict)
+
+    def _check_windows(self):
+        for window in self._windows:
+            if window.done() and window.result()["flagged"]:
+                raise ContentFlagged("output", window.result())
+        self._windows = [window for window in self._windows if not window.done()]
+
+    def _start_window(self):
+        context = self.text[-self.moderator.context_chars:]
+        self.checked_chars = len(self.text)
+        self._windows.append(asyncio.ensure_future(
+            self.moderator.classify("output", [("user", self.query), ("assistant", context)])
+        ))
+
+    async def run(self, awaitable: Awaitable[Any]) -> Any:
+        """
+        Await a non-streamed generation alongside the input check
+
+        The generation is cancelled as soon as the question is flagged.
+        """
+        if self._input is None:
+            return await awaitable
+        generation = asyncio.ensure_future(awaitable)
+        try:
+            await asyncio.wait({generation, self._input}, return_when=asyncio.FIRST_COMPLETED)
+            if self._input.done():
+                await self._check_input()
+            result = await generation
+            await self._check_input()
+            return result
+        finally:
+            generation.cancel()
+
+    async def admit(self, text: str):
+        """
+        Feed output about to be sent to the client
+
+        Waits for the input verdict the first time (usually already there); starts an
+        output check in the background once window_chars new characters have accumulated.
+        """
+        if self._input is None:
+            return
+        await self._check_input()
+        self.text += text
+        if len(self.text) - self.checked_chars >= self.moderator.window_chars:
+            self._start_window()
+        self._check_windows()
+
+    async def finish(self):
+        """Check the output not yet covered by a window and wait for every pending verdict"""
+        if self._input is None:
+            return
+        await self._check_input()
+        if len(self.text) > self.checked_chars:
+            self._start_window()
+        if self._windows:
+            await asyncio.wait(self._windows)
+        self._check_windows()
@@ -38,3 +38,40 @@ MEDICAL_ASSISTANT_SYSTEM_PROMPT = """You are MEDA (Medical Enlightened Digital A
 - End with follow-up suggestions or related information that might be helpful
 
 Remember: You are a trusted medical research companion, helping users navigate the complex world of medical information with accuracy, clarity, and professionalism."""
+
+
+# Appended to MEDICAL_ASSISTANT_SYSTEM_PROMPT when the agent has the offline reference tool
+REFERENCE_TOOL_PROMPT = """
+
+## When to Use the Reference Tool:
+You also have `medical_reference`, a local medical reference library that answers in milliseconds.
+- Use it first for stable reference facts: drug classes and mechanisms, anatomy, physiology, pathology, definitions and normal values
+- Use the search tool only for recent or changing information (news, latest research, trials, approvals, updated guidelines), or when the reference library has no answer
+- When citing the reference library, mention the source title"""
+
+# Phrases that MEDICAL_ASSISTANT_SYSTEM_PROMPT routes to the search tool ("When to Use the
+# Search Tool"). Queries containing them need fresh results and must not be answered from cache.
+SEARCH_TRIGGER_TERMS = [
+    "latest",
+    "recent",
+    "recently",
+    "news",
+    "breakthrough",
+    "breakthroughs",
+    "current",
+    "currently",
+    "today",
+    "this week",
+    "this month",
+    "this year",
+    "new guidelines",
+    "updated guidelines",
+    "clinical trial",
+    "clinical trials",
+    "approval",
+    "approved",
+    "fda",
+    "outbreak",
+    "policy",
+    "statistics",
+]
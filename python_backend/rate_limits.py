@@ -0,0 +1,393 @@
+"""
+Rate-limit-aware transport for Groq chat completions.
+
+Every chat completion made through the shared httpx clients - ChatGroq in the /chat
+agents and DebateLLMClient in the arena - passes through GroqRateLimiter, which:
+
+- paces requests with per-model token buckets (requests and tokens), refilled from
+  Groq's x-ratelimit-* response headers
+- retries 429 and 5xx responses (and connection errors) with jittered exponential
+  backoff, honoring Retry-After
+- fails over to a configured sibling model once a model is exhausted or would make
+  the caller wait too long
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+import telemetry
+from telemetry import logger
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds from Groq's reset headers ("7.66s", "2m59.56s", "120ms") or a plain number"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def estimate_request_tokens(payload: Dict) -> int:
+    """Tokens a completion will count against the limit: prompt (about 4 chars each) plus max_tokens"""
+    chars = sum(len(str(m.get("content") or "")) for m in payload.get("messages", []))
+    return chars // 4 + (payload.get("max_tokens") or payload.get("max_completion_tokens") or 256)
+
+
+class TokenBucket:
+    """
+    Token bucket whose capacity and refill rate are learned from response headers.
+
+    Until the first header arrives it admits everything. Reservations may drive the
+    level negative; later callers then wait for the deficit to refill.
+    """
+
+    def __init__(self):
+        self.capacity: Optional[float] = None
+        self.level = 0.0
+        self.rate = 0.0  # units per second
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.capacity is not None and self.rate:
+            self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take amount from the bucket and return how long the caller must wait first"""
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.capacity is None:
+            return wait
+        amount = min(amount, self.capacity)
+        if self.level < amount:
+            wait = max(wait, (amount - self.level) / self.rate if self.rate else float("inf"))
+        self.level -= amount
+        return wait
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """How long a reservation of amount would wait, without taking it"""
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.capacity is None or self.level >= min(amount, self.capacity):
+            return wait
+        return max(wait, (min(amount, self.capacity) - self.level) / self.rate if self.rate else float("inf"))
+
+    def update(self, limit: Optional[float], remaining: Optional[float], reset: Optional[float], now: float):
+        """Resynchronize with the provider's view: limit, remaining and seconds until full"""
+        if limit is None or remaining is None:
+            return
+        self.capacity = limit
+        self.level = remaining
+        if reset:
+            self.rate = max(limit - remaining, 1.0) / reset
+        elif not self.rate:
+            self.rate = limit / 60
+        self._updated = now
+
+    def block(self, seconds: float, now: float):
+        """Admit nothing for the given time (after a 429 with Retry-After)"""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class ModelBudget:
+    """Request and token buckets for one model"""
+
+    def __init__(self):
+        self.requests = TokenBucket()
+        self.tokens = TokenBucket()
+
+    def reserve(self, tokens: int, now: float) -> float:
+        return max(self.requests.reserve(1, now), self.tokens.reserve(tokens, now))
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        return max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+
+    def update(self, headers: httpx.Headers, now: float):
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            bucket.update(
+                _header_float(headers, f"x-ratelimit-limit-{kind}"),
+                _header_float(headers, f"x-ratelimit-remaining-{kind}"),
+                parse_duration(headers.get(f"x-ratelimit-reset-{kind}")),
+                now,
+            )
+
+    def block(self, seconds: float, now: float):
+        self.requests.block(seconds, now)
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        return {
+            "requests_remaining": round(self.requests.level, 1) if self.requests.capacity is not None else None,
+            "tokens_remaining": round(self.tokens.level, 1) if self.tokens.capacity is not None else None,
+            "blocked_for": round(max(0.0, self.requests.blocked_until - time.monotonic()), 2),
+        }
+
+
+def _header_float(headers: httpx.Headers, name: str) -> Optional[float]:
+    try:
+        return float(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
+class GroqRateLimiter:
+    """Shared pacing, retry and fallback policy for Groq chat completions"""
+
+    def __init__(
+        self,
+        fallbacks: Optional[Dict[str, str]] = None,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        max_wait: float = 30.0,
+    ):
+        """
+        Args:
+            fallbacks: Sibling model to fail over to, by model name
+            max_retries: Retries per model before failing over (or giving up)
+            backoff_base: First backoff ceiling in seconds; doubles per retry (full jitter)
+            backoff_max: Upper bound on a single backoff
+            max_wait: Longest pacing or Retry-After wait; a longer Retry-After fails over, or
+                returns the 429 to the caller when there is no fallback left
+        """
+        self.fallbacks = fallbacks or {}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_wait = max_wait
+        self._budgets: Dict[str, ModelBudget] = {}
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.fallback_count = 0
+
+    def _budget(self, model: str) -> ModelBudget:
+        budget = self._budgets.get(model)
+        if budget is None:
+            budget = self._budgets[model] = ModelBudget()
+        return budget
+
+    def models_for(self, model: str) -> List[str]:
+        """The model followed by its fallback chain (each model at most once)"""
+        chain = [model]
+        while self.fallbacks.get(chain[-1]) and self.fallbacks[chain[-1]] not in chain:
+            chain.append(self.fallbacks[chain[-1]])
+        return chain
+
+    def reserve(self, model: str, tokens: int, has_fallback: bool) -> Optional[float]:
+        """
+        Reserve budget for one call.
+
+        Returns:
+            Seconds to wait before sending, or None if the wait exceeds max_wait and the
+            caller should fail over instead (nothing is reserved then)
+        """
+        with self._lock:
+            budget = self._budget(model)
+            now = time.monotonic()
+            if has_fallback and budget.wait_time(tokens, now) > self.max_wait:
+                return None
+            return min(budget.reserve(tokens, now), self.max_wait)
+
+    def observe(self, model: str, response: Optional[httpx.Response]) -> Optional[float]:
+        """
+        Feed a response's rate-limit headers back into the model's budget.
+
+        Returns:
+            The Retry-After delay if the response is a 429 that carries one
+        """
+        if response is None:
+            return None
+        with self._lock:
+            budget = self._budget(model)
+            now = time.monotonic()
+            budget.update(response.headers, now)
+            retry_after = parse_duration(response.headers.get("retry-after"))
+            if response.status_code == 429 and retry_after:
+                budget.block(retry_after, now)
+                return retry_after
+        return None
+
+    def backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """Seconds to sleep before a retry: jittered backoff or Retry-After, at most max_wait"""
+        ceiling = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return min(max(retry_after or 0.0, random.uniform(0, ceiling)), self.max_wait)
+
+    def record_retry(self, model: str, reason: str):
+        with self._lock:
+            self.retries += 1
+        telemetry.record_llm_retry(model, reason)
+
+    def record_fallback(self, model: str, fallback: str):
+        with self._lock:
+            self.fallback_count += 1
+        telemetry.record_llm_fallback(model, fallback)
+        logger.warning("Falling back to sibling model", extra={"model": model, "fallback": fallback})
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "retries": self.retries,
+                "fallbacks": self.fallback_count,
+                "fallback_models": self.fallbacks,
+                "models": {model: budget.stats() for model, budget in self._budgets.items()},
+            }
+
+
+def _completion_payload(request: httpx.Request) -> Optional[Dict]:
+    """The JSON body of a chat completion request, or None for anything else"""
+    if request.method != "POST" or not request.url.path.endswith("/chat/completions"):
+        return None
+    try:
+        payload = json.loads(request.content)
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) and payload.get("model") else None
+
+
+def _with_model(request: httpx.Request, payload: Dict, model: str) -> httpx.Request:
+    """Copy of the request addressed to another model"""
+    body = json.dumps(dict(payload, model=model)).encode()
+    headers = [(k, v) for k, v in request.headers.raw if k.lower() != b"content-length"]
+    return httpx.Request(request.method, request.url, headers=headers, content=body, extensions=request.extensions)
+
+
+class _Attempt:
+    """Bookkeeping shared by the sync and async transports for one logical request"""
+
+    def __init__(self, limiter: GroqRateLimiter, request: httpx.Request, payload: Dict):
+        self.limiter = limiter
+        self.request = request
+        self.payload = payload
+        self.tokens = estimate_request_tokens(payload)
+        self.chain = limiter.models_for(payload["model"])
+
+    def request_for(self, index: int, model: str) -> httpx.Request:
+        if index == 0:
+            return self.request
+        self.limiter.record_fallback(self.chain[index - 1], model)
+        return _with_model(self.request, self.payload, model)
+
+    def has_fallback(self, index: int) -> bool:
+        return index + 1 < len(self.chain)
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """Wraps a synchronous transport with GroqRateLimiter pacing, retries and fallback"""
+
+    def __init__(self, limiter: GroqRateLimiter, transport: httpx.BaseTransport):
+        self.limiter = limiter
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        payload = _completion_payload(request)
+        if payload is None:
+            return self.transport.handle_request(request)
+        attempt = _Attempt(self.limiter, request, payload)
+        response = None
+        error: Optional[Exception] = None
+        for index, model in enumerate(attempt.chain):
+            request = attempt.request_for(index, model)
+            fallback = attempt.has_fallback(index)
+            for retry in range(self.limiter.max_retries + 1):
+                wait = self.limiter.reserve(model, attempt.tokens, fallback)
+                if wait is None:
+                    break
+                if wait:
+                    time.sleep(wait)
+                try:
+                    response = self.transport.handle_request(request)
+                    error = None
+                except httpx.TransportError as exc:
+                    response, error = None, exc
+                retry_after = self.limiter.observe(model, response)
+                if response is not None and response.status_code not in RETRY_STATUSES:
+                    return response
+                # A Retry-After over max_wait fails over, or fails fast when there's no fallback
+                if retry == self.limiter.max_retries or (retry_after or 0) > self.limiter.max_wait:
+                    break
+                if response is not None:
+                    # Drain the (small) error body so the connection goes back to the pool
+                    response.read()
+                    response.close()
+                self.limiter.record_retry(model, str(response.status_code) if response is not None else "connection")
+                time.sleep(self.limiter.backoff(retry, retry_after))
+            if fallback and response is not None:
+                response.read()
+                response.close()
+        if error is not None:
+            raise error
+        if response is None:
+            raise httpx.ConnectError("No model in the fallback chain had rate-limit budget", request=request)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of RateLimitedTransport, sharing the same limiter"""
+
+    def __init__(self, limiter: GroqRateLimiter, transport: httpx.AsyncBaseTransport):
+        self.limiter = limiter
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        payload = _completion_payload(request)
+        if payload is None:
+            return await self.transport.handle_async_request(request)
+        attempt = _Attempt(self.limiter, request, payload)
+        response = None
+        error: Optional[Exception] = None
+        for index, model in enumerate(attempt.chain):
+            request = attempt.request_for(index, model)
+            fallback = attempt.has_fallback(index)
+            for retry in range(self.limiter.max_retries + 1):
+                wait = self.limiter.reserve(model, attempt.tokens, fallback)
+                if wait is None:
+                    break
+                if wait:
+                    await asyncio.sleep(wait)
+                try:
+                    response = await self.transport.handle_async_request(request)
+                    error = None
+                except httpx.TransportError as exc:
+                    response, error = None, exc
+                retry_after = self.limiter.observe(model, response)
+                if response is not None and response.status_code not in RETRY_STATUSES:
+                    return response
+                # A Retry-After over max_wait fails over, or fails fast when there's no fallback
+                if retry == self.limiter.max_retries or (retry_after or 0) > self.limiter.max_wait:
+                    break
+                if response is not None:
+                    await response.aread()
+                    await response.aclose()
+                self.limiter.record_retry(model, str(response.status_code) if response is not None else "connection")
+                await asyncio.sleep(self.limiter.backoff(retry, retry_after))
+            if fallback and response is not None:
+                await response.aread()
+                await response.aclose()
+        if error is not None:
+            raise error
+        if response is None:
+            raise httpx.ConnectError("No model in the fallback chain had rate-limit budget", request=request)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -0,0 +1,209 @@
+"""
+Response cache for /chat: exact matches on the normalized conversation, plus an
+optional TF-IDF similarity layer for near-identical single-turn questions
+"""
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from shared_state import StateBackend, StateBackendError
+from telemetry import logger
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    return re.sub(r"\s+", " ", text.lower()).strip().rstrip("?!. ")
+
+
+def cache_key(model: str, system_prompt: str, messages: Sequence[Tuple[str, str]]) -> str:
+    """Hash of the model, system prompt and normalized (role, content) history"""
+    payload = json.dumps(
+        [model, system_prompt, [[role, normalize_text(content)] for role, content in messages]],
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Size-bounded LRU with TTL; thread-safe"""
+
+    def __init__(
+        self,
+        ttl: float = 3600,
+        max_entries: int = 1000,
+        similarity_threshold: Optional[float] = None,
+        shared: Optional[StateBackend] = None,
+    ):
+        """
+        Args:
+            ttl: Seconds an entry stays valid
+            max_entries: Entries kept before the least recently used is evicted
+            similarity_threshold: Cosine similarity (0-1) for the TF-IDF layer; disabled when None
+            shared: Backend for exact matches found by other workers (the similarity layer
+                only covers this worker's entries)
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._doc_freq: Counter = Counter()
+        self._lock = threading.Lock()
+        self.shared = shared
+        self.hits = 0
+        self.shared_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def get(
+        self,
+        model: str,
+        system_prompt: str,
+        messages: Sequence[Tuple[str, str]],
+    ) -> Optional[str]:
+        """Return a cached response for this conversation, or None"""
+        key = cache_key(model, system_prompt, messages)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires_at"] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["content"]
+            if entry is not None:
+                self._remove(key)
+
+        content = self._get_shared(key)
+        if content is not None:
+            with self._lock:
+                self.shared_hits += 1
+                self._store(key, model, system_prompt, messages, content)
+            return content
+
+        with self._lock:
+            similar = self._find_similar(model, system_prompt, messages, now)
+            if similar is not None:
+                self.similar_hits += 1
+                return similar
+            self.misses += 1
+            return None
+
+    def set(
+        self,
+        model: str,
+        system_prompt: str,
+        messages: Sequence[Tuple[str, str]],
+        content: str,
+    ):
+        key = cache_key(model, system_prompt, messages)
+        with self._lock:
+            self._store(key, model, system_prompt, messages, content)
+        if self.shared is not None:
+            try:
+                self.shared.set(f"response:{key}", content.encode(), ttl=self.ttl)
+            except StateBackendError as e:
+                logger.warning("Shared cache write failed", extra={"cache": "response", "error": str(e)})
+
+    def _get_shared(self, key: str) -> Optional[str]:
+        if self.shared is None:
+            return None
+        try:
+            content = self.shared.get(f"response:{key}")
+        except StateBackendError as e:
+            logger.warning("Shared cache read failed", extra={"cache": "response", "error": str(e)})
+            return None
+        return content.decode() if content is not None else None
+
+    def _store(self, key: str, model: str, system_prompt: str, messages: Sequence[Tuple[str, str]], content: str):
+        """Add an entry; called with the lock held"""
+        if key in self._entries:
+            self._remove(key)
+        entry = {
+            "content": content,
+            "expires_at": time.time() + self.ttl,
+            "scope": (model, system_prompt),
+            "terms": None,
+        }
+        # Only single-turn questions go into the similarity index; with history the
+        # same words can mean a different question
+        if self.similarity_threshold is not None and len(messages) == 1:
+            entry["terms"] = Counter(_WORD.findall(normalize_text(messages[0][1])))
+            self._doc_freq.update(entry["terms"].keys())
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._doc_freq.clear()
+        if self.shared is not None:
+            try:
+                self.shared.delete(*self.shared.keys("response:"))
+            except StateBackendError as e:
+                logger.warning("Shared cache clear failed", extra={"cache": "response", "error": str(e)})
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.similar_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.shared_hits + self.similar_hits) / lookups if lookups else 0.0,
+            }
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        if entry["terms"]:
+            self._doc_freq.subtract(entry["terms"].keys())
+            self._doc_freq += Counter()  # drop terms whose count reached zero
+
+    def _vector(self, terms: Counter) -> Dict[str, float]:
+        total = len(self._entries) + 1
+        vector = {
+            term: count * math.log(total / (1 + self._doc_freq.get(term, 0))) + count
+            for term, count in terms.items()
+        }
+        norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+        return {term: w / norm for term, w in vector.items()}
+
+    def _find_similar(
+        self,
+        model: str,
+        system_prompt: str,
+        messages: Sequence[Tuple[str, str]],
+        now: float,
+    ) -> Optional[str]:
+        if self.similarity_threshold is None or len(messages) != 1:
+            return None
+        query_terms = Counter(_WORD.findall(normalize_text(messages[0][1])))
+        if not query_terms:
+            return None
+        query = self._vector(query_terms)
+        best_key, best_score = None, self.similarity_threshold
+        for key, entry in self._entries.items():
+            if not entry["terms"] or entry["scope"] != (model, system_prompt) or entry["expires_at"] <= now:
+                continue
+            candidate = self._vector(entry["terms"])
+            score = sum(weight * candidate.get(term, 0.0) for term, weight in query.items())
+            if score >= best_score:
+                best_key, best_score = key, score
+        if best_key is None:
+            return None
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key]["content"]
+
+
+def is_time_sensitive(query: str, triggers: List[str]) -> bool:
+    """True if the query asks for recent information the prompt routes to search"""
+    text = normalize_text(query)
+    return any(re.search(rf"\b{re.escape(trigger)}\b", text) for trigger in triggers)
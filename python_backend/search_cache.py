@@ -0,0 +1,274 @@
+"""
+Caching, request-coalescing store for Tavily search results (the tool itself is in search_tool)
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from response_cache import normalize_text
+from shared_state import StateBackend, StateBackendError
+from telemetry import logger
+
+# Result a cancelled leader hands its waiters, so they retry instead of being cancelled too
+_LEADER_CANCELLED = object()
+
+
+class SearchCache:
+    """
+    TTL + LRU cache for search results with single-flight fetching.
+
+    Concurrent lookups for the same key share one upstream request. Entries can
+    optionally be persisted to SQLite so they survive restarts, and shared with other
+    workers through a shared_state backend.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 900,
+        max_entries: int = 500,
+        path: Optional[str] = None,
+        shared: Optional[StateBackend] = None,
+        namespace: str = "search",
+    ):
+        """
+        Args:
+            ttl: Seconds a result stays fresh (short by default, since queries are mostly news)
+            max_entries: In-memory entries kept before LRU eviction
+            path: SQLite file for the on-disk store; memory only when None
+            shared: Backend consulted after memory and written through, so a result fetched
+                by one worker is found by the others
+            namespace: Prefix of this cache's keys in the shared backend
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight_async: Dict[str, asyncio.Future] = {}
+        self._inflight_sync: Dict[str, threading.Event] = {}
+        self.shared = shared
+        self.namespace = namespace
+        self.shared_hits = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+            self._db.execute("DELETE FROM search_cache WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self.upstream_seconds = 0.0
+
+    @staticmethod
+    def make_key(query: str, **params: Any) -> str:
+        payload = json.dumps([normalize_text(query), params], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._get_memory(key)
+        return value if value is not None else self._get_stored(key)
+
+    @property
+    def _stored(self) -> bool:
+        """Whether lookups past memory do I/O (SQLite or the shared backend)"""
+        return self._db is not None or self.shared is not None
+
+    def _get_memory(self, key: str) -> Optional[Any]:
+        """The in-memory entry; never does I/O, so it is safe on the event loop"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                return value
+            self._entries.pop(key, None)
+        return None
+
+    def _get_stored(self, key: str) -> Optional[Any]:
+        """The on-disk entry, then the shared backend's"""
+        if self._db is not None:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM search_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if row[1] > time.time():
+                        value = json.loads(row[0])
+                        self._remember(key, value, row[1])
+                        return value
+                    self._delete(key)
+        return self._get_shared(key)
+
+    def _get_shared(self, key: str) -> Optional[Any]:
+        if self.shared is None:
+            return None
+        try:
+            entry = self.shared.get_json(f"{self.namespace}:{key}")
+        except StateBackendError as e:
+            logger.warning("Shared cache read failed", extra={"cache": self.namespace, "error": str(e)})
+            return None
+        if entry is None:
+            return None
+        with self._lock:
+            self.shared_hits += 1
+            self._remember(key, entry["value"], entry["expires_at"])
+        return entry["value"]
+
+    def _remember(self, key: str, value: Any, expires_at: float):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def set(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, value, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO search_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires_at),
+                )
+                self._db.commit()
+        if self.shared is not None:
+            try:
+                self.shared.set_json(f"{self.namespace}:{key}", {"value": value, "expires_at": expires_at}, ttl=self.ttl)
+            except StateBackendError as e:
+                logger.warning("Shared cache write failed", extra={"cache": self.namespace, "error": str(e)})
+
+    def _delete(self, key: str):
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+            self._db.commit()
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _record_upstream(self, started: float):
+        with self._lock:
+            self.upstream_calls += 1
+            self.upstream_seconds += time.perf_counter() - started
+
+    async def aget_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        cacheable: Callable[[Any], bool] = lambda value: True,
+    ) -> Any:
+        """
+        Return the cached value, join an identical in-flight fetch, or fetch it
+
+        SQLite and shared backend lookups and writes run in a thread, off the event loop.
+        """
+        while True:
+            value = self._get_memory(key)
+            if value is None and self._stored:
+                value = await asyncio.to_thread(self._get_stored, key)
+            if value is not None:
+                self._count("hits")
+                return value
+            inflight = self._inflight_async.get(key)
+            if inflight is None:
+                break
+            self._count("coalesced")
+            value = await asyncio.shield(inflight)
+            if value is not _LEADER_CANCELLED:
+                return value
+            # The leader was cancelled (its client went away); look again and fetch ourselves
+
+        self._count("misses")
+        future = asyncio.get_running_loop().create_future()
+        self._inflight_async[key] = future
+        started = time.perf_counter()
+        try:
+            value = await fetch()
+        except asyncio.CancelledError:
+            # Only the leader was cancelled: wake the waiters without cancelling them
+            future.set_result(_LEADER_CANCELLED)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Waiters re-raise it; mark it retrieved so there's no "never retrieved" warning
+            future.exception()
+            raise
+        else:
+            self._record_upstream(started)
+            # Waiters get the value before it's written, so a cancelled write can't strand them
+            future.set_result(value)
+            if cacheable(value):
+                if self._stored:
+                    await asyncio.to_thread(self.set, key, value)
+                else:
+                    self.set(key, value)
+            return value
+        finally:
+            self._inflight_async.pop(key, None)
+
+    def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Any],
+        cacheable: Callable[[Any], bool] = lambda value: True,
+    ) -> Any:
+        """Thread-based counterpart of aget_or_fetch for synchronous tool calls"""
+        while True:
+            value = self.get(key)
+            if value is not None:
+                self._count("hits")
+                return value
+            with self._lock:
+                done = self._inflight_sync.get(key)
+                if done is None:
+                    done = self._inflight_sync[key] = threading.Event()
+                    leader = True
+                else:
+                    leader = False
+                    self.coalesced += 1
+            if leader:
+                break
+            done.wait()
+            value = self.get(key)
+            if value is not None:
+                return value
+            # The leader's result wasn't cacheable; fetch ourselves
+
+        self._count("misses")
+        started = time.perf_counter()
+        try:
+            value = fetch()
+            self._record_upstream(started)
+            if cacheable(value):
+                self.set(key, value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight_sync.pop(key, None)
+            done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.coalesced + self.misses
+        average = self.upstream_seconds / self.upstream_calls if self.upstream_calls else 0.0
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            # Hits found in the shared backend (put there by another worker or earlier run)
+            "shared_hits": self.shared_hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "upstream_calls": self.upstream_calls,
+            "avg_upstream_seconds": average,
+            "upstream_seconds_saved": (self.hits + self.coalesced) * average,
+        }
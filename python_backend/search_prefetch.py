@@ -0,0 +1,173 @@
+"""
+Speculative Tavily search for time-sensitive /chat questions
+
+Normally the agent's first LLM call has to finish deciding to search before Tavily is
+called, and only then can the second call start. For questions the prompt routes to the
+search tool (SEARCH_TRIGGER_TERMS), the search is started together with the first LLM
+call instead. When the agent then calls the search tool with a query close enough to the
+question, the tool is answered from the prefetch (waiting for it if it is still running);
+otherwise it searches as usual and the prefetch is counted as wasted. The prefetch is
+written to the search cache either way.
+
+The prefetch is found through a context variable, so it only reaches tools running on
+behalf of the request that started it.
+"""
+import asyncio
+import contextvars
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+import telemetry
+from response_cache import is_time_sensitive, normalize_text
+
+_WORD = re.compile(r"\w+")
+
+# Words ignored when comparing the agent's search query with the question
+_FILLER = frozenset(
+    "a an and are as at be by can could do does for from how i in is it me of on or please should "
+    "tell the this to was what when where which who why with would you your about".split()
+)
+
+
+def query_terms(query: str):
+    return {t for t in _WORD.findall(normalize_text(query)) if t not in _FILLER}
+
+
+def query_overlap(a: str, b: str) -> float:
+    """Share of the smaller query's terms that the other one also has (0-1)"""
+    terms_a, terms_b = query_terms(a), query_terms(b)
+    if not terms_a or not terms_b:
+        return 0.0
+    return len(terms_a & terms_b) / min(len(terms_a), len(terms_b))
+
+
+class Prefetch:
+    """One in-flight speculative search"""
+
+    def __init__(self, query: str, task: "asyncio.Future", prefetcher: "SearchPrefetcher"):
+        self.query = query
+        self.task = task
+        self.prefetcher = prefetcher
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.claimed = False
+        task.add_done_callback(self._done)
+
+    def _done(self, task):
+        self.finished = time.perf_counter()
+        if not task.cancelled():
+            # Retrieved here so an unclaimed failure isn't logged as "never retrieved"
+            task.exception()
+
+
+_current: contextvars.ContextVar[Optional[Prefetch]] = contextvars.ContextVar("meda_search_prefetch", default=None)
+
+
+async def claim(query: str, usable: Callable[[Any], bool] = lambda result: True) -> Optional[Any]:
+    """
+    Result of the current request's prefetch if it matches query, else None
+
+    Called by the search tool; the first matching call takes the prefetch, later ones search normally.
+
+    Args:
+        query: The search the agent asked for
+        usable: Whether a prefetched result can be returned (False for error results)
+    """
+    prefetch = _current.get()
+    if prefetch is None or prefetch.claimed:
+        return None
+    if query_overlap(prefetch.query, query) < prefetch.prefetcher.min_overlap:
+        prefetch.prefetcher.record("mismatched")
+        return None
+    prefetch.claimed = True
+    claimed_at = time.perf_counter()
+    try:
+        # Shielded: a cancelled tool call must not cancel the search other requests may share via the cache
+        result = await asyncio.shield(prefetch.task)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        result = None
+    if result is None or not usable(result):
+        prefetch.prefetcher.record("failed")
+        return None
+    # Without the prefetch the search would have started at claimed_at
+    saved = min(claimed_at, prefetch.finished or claimed_at) - prefetch.started
+    prefetch.prefetcher.record("used", saved)
+    return result
+
+
+class SearchPrefetcher:
+    """Starts speculative searches and keeps their outcomes; thread-safe"""
+
+    def __init__(self, search_triggers, min_overlap: float = 0.5, enabled: bool = True):
+        """
+        Args:
+            search_triggers: Phrases that make a question time-sensitive (SEARCH_TRIGGER_TERMS)
+            min_overlap: How much of the agent's search query must match the question (0-1)
+                for the prefetched results to be used
+            enabled: Whether to prefetch at all
+        """
+        self.search_triggers = search_triggers
+        self.min_overlap = min_overlap
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {"started": 0, "used": 0, "wasted": 0, "mismatched": 0, "failed": 0}
+        self.saved_seconds = 0.0
+
+    def should_prefetch(self, query: str) -> bool:
+        return self.enabled and is_time_sensitive(query, self.search_triggers)
+
+    def record(self, outcome: str, saved_seconds: float = 0.0):
+        with self._lock:
+            self._counts[outcome] += 1
+            self.saved_seconds += saved_seconds
+        if outcome != "started":
+            telemetry.record_search_prefetch(outcome, saved_seconds)
+
+    @contextmanager
+    def speculate(self, query: str, fetch: Optional[Callable[[str], Awaitable[Any]]]) -> Iterator[Optional[Prefetch]]:
+        """
+        Start fetch(query) now if query is time-sensitive; search tools run inside the block can claim it
+
+        Must be entered from a running event loop. A prefetch nobody claimed is counted as
+        wasted on exit; it is left to finish so its results still land in the search cache.
+
+        Args:
+            query: The user's question
+            fetch: The agent's search (None when it has no search tool: nothing is prefetched)
+        """
+        if fetch is None or not self.should_prefetch(query):
+            yield None
+            return
+        # Created before the context variable is set, so the prefetch can't claim itself
+        prefetch = Prefetch(query, asyncio.ensure_future(fetch(query)), self)
+        self.record("started")
+        token = _current.set(prefetch)
+        try:
+            yield prefetch
+        finally:
+            try:
+                _current.reset(token)
+            except ValueError:
+                # Closed from another context (e.g. an abandoned stream finalized later)
+                pass
+            if not prefetch.claimed:
+                self.record("wasted")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+            started = counts["started"]
+            # wasted: never used, including prefetches whose query didn't match (mismatched)
+            return {
+                "enabled": self.enabled,
+                **counts,
+                "use_rate": counts["used"] / started if started else 0.0,
+                "waste_rate": counts["wasted"] / started if started else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+                "avg_saved_seconds": round(self.saved_seconds / counts["used"], 3) if counts["used"] else 0.0,
+            }
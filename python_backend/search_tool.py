@@ -0,0 +1,88 @@
+"""
+Agent search tools: Tavily backed by the shared SearchCache, and the offline medical reference index
+
+Kept apart from search_cache so that importing the cache doesn't pull in langchain_community.
+"""
+from typing import Any
+
+from langchain_community.tools.tavily_search import TavilySearchResults
+from langchain_core.tools import BaseTool
+
+import search_prefetch
+from search_cache import SearchCache
+
+
+class CachedTavilySearch(TavilySearchResults):
+    """TavilySearchResults that goes through a shared SearchCache"""
+
+    search_cache: Any = None
+
+    def _cache_key(self, query: str) -> str:
+        return SearchCache.make_key(
+            query,
+            max_results=self.max_results,
+            search_depth=self.search_depth,
+            include_domains=self.include_domains,
+            exclude_domains=self.exclude_domains,
+            include_answer=self.include_answer,
+            include_raw_content=self.include_raw_content,
+            include_images=self.include_images,
+        )
+
+    @staticmethod
+    def _cacheable(result) -> bool:
+        # On failure the parent returns (repr(error), {}); don't cache those
+        return bool(result[1])
+
+    def _run(self, query: str, run_manager=None):
+        if self.search_cache is None:
+            return super()._run(query, run_manager)
+        result = self.search_cache.get_or_fetch(
+            self._cache_key(query),
+            lambda: list(super(CachedTavilySearch, self)._run(query, run_manager)),
+            cacheable=self._cacheable,
+        )
+        return tuple(result)
+
+    async def _arun(self, query: str, run_manager=None):
+        # Started together with the first LLM call for time-sensitive questions (see search_prefetch)
+        prefetched = await search_prefetch.claim(query, usable=self._cacheable)
+        if prefetched is not None:
+            return prefetched
+        if self.search_cache is None:
+            return await super()._arun(query, run_manager)
+
+        async def fetch():
+            return list(await super(CachedTavilySearch, self)._arun(query, run_manager))
+
+        result = await self.search_cache.aget_or_fetch(self._cache_key(query), fetch, cacheable=self._cacheable)
+        return tuple(result)
+
+    async def prefetch(self, query: str):
+        """The search the agent would run for query, started ahead of the agent (see search_prefetch)"""
+        return await self._arun(query)
+
+
+class LocalKnowledgeSearch(BaseTool):
+    """Searches the offline KnowledgeIndex; answers in milliseconds, without a network call"""
+
+    name: str = "medical_reference"
+    description: str = (
+        "Search the local medical reference library: drug classes and mechanisms, anatomy, "
+        "physiology, pathology, standard definitions and normal values. Fast and offline, so "
+        "use it first for stable reference facts. It has no news, recent research, trials, "
+        "approvals or updated guidelines; use the web search tool for those. "
+        "Input should be a search query."
+    )
+    knowledge_index: Any = None
+    max_results: int = 4
+
+    def _run(self, query: str, run_manager=None):
+        results = self.knowledge_index.search(query, self.max_results)
+        if not results:
+            return "No matching passages in the local reference library."
+        return [{"title": r["title"], "source": r["source"], "content": r["content"]} for r in results]
+
+    async def _arun(self, query: str, run_manager=None):
+        # A lookup takes about a millisecond; not worth a hop to the thread pool
+        return self._run(query, run_manager)
@@ -0,0 +1,158 @@
+"""
+Production entry point: pre-forked uvicorn workers sharing one listening socket
+
+The parent process imports the heavy libraries (langchain, langchain_groq, autogen, the
+Tavily tool) and the read-only agent modules once, then forks the workers, so their
+memory pages are shared copy-on-write instead of each worker loading its own copy. The
+parent never imports main: the application state (SQLite stores, HTTP pools, caches)
+is created inside each worker. Workers that die are restarted.
+
+    cd python_backend
+    python serve.py --workers 4 --port 8000
+
+Each worker warms up in the background (see main.warm_up); point load balancer health
+checks at /health/ready and liveness probes at /health/live. `python main.py` remains the
+single-process development server with auto-reload.
+"""
+import argparse
+import importlib
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict
+
+from config import get_settings
+
+# Imported in the parent before forking; none of them opens files, sockets or threads
+PRELOAD_MODULES = [
+    "fastapi",
+    "langchain.agents",
+    "langchain_core.prompts",
+    "langchain_groq",
+    "langchain_community.tools.tavily_search",
+    "autogen",
+    "prompts",
+    "backends",
+    "search_tool",
+    "autogen_agents",
+    "autogen_streaming",
+]
+
+# A worker that dies sooner than this after starting is restarted with a delay
+MIN_WORKER_LIFETIME = 5.0
+
+
+def preload(modules=PRELOAD_MODULES) -> float:
+    """Import modules to share with the workers; returns the seconds it took"""
+    started = time.perf_counter()
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            print(f"serve: could not preload {name}", file=sys.stderr)
+    return time.perf_counter() - started
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, log_level: str):
+    """Body of a forked worker: serve main:app on the inherited socket"""
+    import uvicorn
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    config = uvicorn.Config("main:app", log_level=log_level, lifespan="on", access_log=False)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    """Forks the workers, restarts the ones that die and stops them all on SIGTERM/SIGINT"""
+
+    def __init__(self, sock: socket.socket, workers: int, log_level: str):
+        self.sock = sock
+        self.workers = workers
+        self.log_level = log_level
+        # pid -> start time
+        self.children: Dict[int, float] = {}
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.sock, self.log_level)
+            except BaseException:
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.workers):
+            self.spawn()
+        print(f"serve: {self.workers} workers started: {sorted(self.children)}", file=sys.stderr)
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            print(f"serve: worker {pid} exited with status {status}, restarting", file=sys.stderr)
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                # Crashing on startup; don't spin
+                time.sleep(MIN_WORKER_LIFETIME)
+            if not self.stopping:
+                self.spawn()
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Run the MEDA API with pre-forked workers")
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS)
+    parser.add_argument("--no-preload", action="store_true", help="let every worker import everything itself")
+    parser.add_argument("--log-level", default=settings.LOG_LEVEL.lower())
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        # No fork (Windows): uvicorn's spawned workers, without shared preloading
+        import uvicorn
+
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+        return
+
+    if not args.no_preload:
+        print(f"serve: preloaded libraries in {preload():.2f} s", file=sys.stderr)
+    sock = bind_socket(args.host, args.port)
+    print(f"serve: listening on {args.host}:{args.port}", file=sys.stderr)
+    Supervisor(sock, args.workers, args.log_level).run()
+
+
+if __name__ == "__main__":
+    main()
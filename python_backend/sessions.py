@@ -0,0 +1,307 @@
+"""
+Server-side conversation sessions for /chat.
+
+Clients send only the new turns; history lives here. Once the history exceeds a
+token budget, the oldest turns are folded into a rolling summary so prompt size
+stays bounded however long a study session runs.
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from shared_state import StateBackend
+
+SUMMARY_PROMPT = """You maintain a running summary of a medical study conversation between a user and MEDA, \
+an AI medical research assistant. Update the summary with the new turns below.
+
+Keep: the topics and questions covered, key facts, drug names and doses, guidelines and sources cited, \
+and anything the user said about their level or goals. Be concise (at most 200 words) and write plain prose.
+
+Current summary:
+{summary}
+
+New turns:
+{turns}
+
+Updated summary:"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token), good enough for budgeting"""
+    return len(text) // 4 + 1
+
+
+def to_langchain(turn: Dict[str, str]) -> Optional[BaseMessage]:
+    if turn["role"] == "user":
+        return HumanMessage(content=turn["content"])
+    if turn["role"] == "assistant":
+        return AIMessage(content=turn["content"])
+    return None
+
+
+class ChatSession:
+    """One conversation: the recent turns, a summary of older ones, and their LangChain form"""
+
+    def __init__(self, session_id: str, turns: Optional[List[Dict[str, str]]] = None, summary: str = ""):
+        self.id = session_id
+        self.turns: List[Dict[str, str]] = []
+        self.summary = summary
+        self.updated_at = time.time()
+        self._messages: List[BaseMessage] = []
+        self.extend(turns or [])
+
+    def extend(self, turns: List[Dict[str, str]]):
+        """Append turns, converting only the new ones"""
+        for turn in turns:
+            self.turns.append({"role": turn["role"], "content": turn["content"]})
+            message = to_langchain(turn)
+            if message is not None:
+                self._messages.append(message)
+        self.updated_at = time.time()
+
+    def history(self) -> List[BaseMessage]:
+        """Chat history for the agent: the summary (if any) followed by the recent turns"""
+        if not self.summary:
+            return list(self._messages)
+        return [SystemMessage(content=f"Summary of the earlier conversation: {self.summary}")] + self._messages
+
+    def history_tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(estimate_tokens(t["content"]) for t in self.turns)
+
+    def drop_oldest(self, count: int) -> List[Dict[str, str]]:
+        """Remove and return the oldest turns (after they have been summarized)"""
+        dropped = self.turns[:count]
+        self.turns = self.turns[count:]
+        self._messages = [m for m in (to_langchain(t) for t in self.turns) if m is not None]
+        return dropped
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.id,
+            "summary": self.summary,
+            "turns": self.turns,
+            "updated_at": self.updated_at,
+            "history_tokens": self.history_tokens(),
+        }
+
+
+class SessionStore:
+    """Bounded in-memory session store with LRU eviction and idle TTL"""
+
+    def __init__(self, max_sessions: int = 1000, ttl: float = 86400):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def lock(self, session_id: str) -> asyncio.Lock:
+        """
+        Serializes this worker's updates of a session: hold it to reload, change and save one,
+        so concurrent turns (and summaries) don't overwrite each other
+        """
+        with self._lock:
+            lock = self._session_locks.get(session_id)
+            if lock is None:
+                lock = self._session_locks[session_id] = asyncio.Lock()
+            return lock
+
+    def create(self) -> ChatSession:
+        session = ChatSession(uuid.uuid4().hex)
+        self.save(session)
+        return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and time.time() - session.updated_at > self.ttl:
+                del self._sessions[session_id]
+                session = None
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+        if session is None:
+            session = self._load(session_id)
+            if session is not None:
+                self._remember(session)
+        return session
+
+    def save(self, session: ChatSession):
+        self._remember(session)
+        self._persist(session)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            found = self._sessions.pop(session_id, None) is not None
+        return self._remove(session_id) or found
+
+    def _remember(self, session: ChatSession):
+        with self._lock:
+            self._sessions[session.id] = session
+            self._sessions.move_to_end(session.id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    # Persistence hooks, no-ops for the in-memory store
+    def _load(self, session_id: str) -> Optional[ChatSession]:
+        return None
+
+    def _persist(self, session: ChatSession):
+        pass
+
+    def _remove(self, session_id: str) -> bool:
+        return False
+
+
+class SQLiteSessionStore(SessionStore):
+    """SessionStore that writes through to SQLite; memory acts as an LRU cache in front"""
+
+    def __init__(self, path: str, max_sessions: int = 1000, ttl: float = 86400):
+        super().__init__(max_sessions, ttl)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db_lock = threading.Lock()
+        with self._db_lock:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions "
+                "(id TEXT PRIMARY KEY, turns TEXT, summary TEXT, updated_at REAL)"
+            )
+            self._db.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - ttl,))
+            self._db.commit()
+
+    def _load(self, session_id: str) -> Optional[ChatSession]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT turns, summary, updated_at FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        if row is None or time.time() - row[2] > self.ttl:
+            return None
+        session = ChatSession(session_id, json.loads(row[0]), row[1])
+        session.updated_at = row[2]
+        return session
+
+    def _persist(self, session: ChatSession):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (id, turns, summary, updated_at) VALUES (?, ?, ?, ?)",
+                (session.id, json.dumps(session.turns), session.summary, session.updated_at),
+            )
+            self._db.commit()
+
+    def _remove(self, session_id: str) -> bool:
+        with self._db_lock:
+            deleted = self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount
+            self._db.commit()
+        return deleted > 0
+
+
+class SharedSessionStore(SessionStore):
+    """
+    SessionStore kept in a shared_state backend, so any worker can continue a session
+
+    Sessions are always read from the backend: the copy remembered by this worker is only
+    reused while no other worker has changed the session.
+    """
+
+    def __init__(self, backend: StateBackend, max_sessions: int = 1000, ttl: float = 86400):
+        super().__init__(max_sessions, ttl)
+        self.backend = backend
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        session = self._load(session_id)
+        with self._lock:
+            local = self._sessions.get(session_id)
+            if session is None:
+                self._sessions.pop(session_id, None)
+                return None
+        if local is not None and local.updated_at >= session.updated_at:
+            session = local
+        self._remember(session)
+        return session
+
+    def _load(self, session_id: str) -> Optional[ChatSession]:
+        data = self.backend.get_json(f"session:{session_id}")
+        if data is None:
+            return None
+        session = ChatSession(session_id, data["turns"], data["summary"])
+        session.updated_at = data["updated_at"]
+        return session
+
+    def _persist(self, session: ChatSession):
+        self.backend.set_json(
+            f"session:{session.id}",
+            {"turns": session.turns, "summary": session.summary, "updated_at": session.updated_at},
+            ttl=self.ttl,
+        )
+
+    def _remove(self, session_id: str) -> bool:
+        return self.backend.delete(f"session:{session_id}") > 0
+
+
+class SessionSummarizer:
+    """Folds the oldest turns of a session into its summary once it exceeds a token budget"""
+
+    def __init__(
+        self,
+        create_llm: Callable[[], Any],
+        store: SessionStore,
+        token_budget: int = 3000,
+        keep_recent: int = 6,
+        callbacks: Optional[Callable[[], List[Any]]] = None,
+    ):
+        """
+        Args:
+            create_llm: Builds the LangChain chat model used for summaries (a small, fast one);
+                called on the first summary so startup doesn't pay for it
+            store: Where updated sessions are saved
+            token_budget: Estimated history tokens above which older turns are summarized
+            keep_recent: Turns always kept verbatim
+            callbacks: LangChain callbacks for each summary call (e.g. telemetry, which charges its tokens)
+        """
+        self.create_llm = create_llm
+        self._llm = None
+        self.store = store
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.callbacks = callbacks
+        self._running: Set[str] = set()
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            self._llm = self.create_llm()
+        return self._llm
+
+    def needs_summary(self, session: ChatSession) -> bool:
+        return session.history_tokens() > self.token_budget and len(session.turns) > self.keep_recent
+
+    async def maybe_summarize(self, session: ChatSession):
+        """Summarize older turns if over budget; one summary per session runs at a time"""
+        if not self.needs_summary(session) or session.id in self._running:
+            return
+        self._running.add(session.id)
+        try:
+            count = len(session.turns) - self.keep_recent
+            summarized = session.turns[:count]
+            turns = "\n".join(f"{t['role']}: {t['content']}" for t in summarized)
+            config = {"callbacks": self.callbacks()} if self.callbacks else None
+            result = await self.llm.ainvoke(
+                SUMMARY_PROMPT.format(summary=session.summary or "(none yet)", turns=turns), config=config
+            )
+            # Turns may have been recorded meanwhile: apply the summary to the current session
+            async with self.store.lock(session.id):
+                current = await asyncio.to_thread(self.store.get, session.id)
+                if current is None or current.turns[:count] != summarized:
+                    return
+                current.summary = result.content.strip()
+                current.drop_oldest(count)
+                # The store may be SQLite or a shared backend: save off the event loop
+                await asyncio.to_thread(self.store.save, current)
+        finally:
+            self._running.discard(session.id)
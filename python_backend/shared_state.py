@@ -0,0 +1,695 @@
+"""
+State shared between workers and nodes: caches, sessions, transcripts and stream runs
+
+Everything else in the backend lives in its worker, so behind several uvicorn workers (or
+nodes behind a load balancer) a cached answer, a session or a streamed debate is only
+found by requests that reach the same worker. STATE_BACKEND picks where the shared part
+lives:
+
+- "memory": in the worker; nothing is shared (the default, and a reference for tests)
+- "sqlite": a SQLite file (STATE_SQLITE_PATH) for the workers of one node; pub/sub polls a
+  message table every STATE_SQLITE_POLL_SECONDS
+- "redis": a Redis server (STATE_REDIS_URL) for every node; the client speaks RESP itself,
+  so no extra package is needed and fake_backends.FakeRedisServer can stand in for Redis
+
+Backends store bytes under string keys, with optional expiry; lists (for stream frames)
+and publish/subscribe (to follow a stream run from another worker) complete the API. All
+backends are thread-safe.
+"""
+import contextlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import unquote, urlsplit
+
+# telemetry's logger; not imported from there since sessions (imported by telemetry) uses this module
+logger = logging.getLogger("meda")
+
+Callback = Callable[[bytes], None]
+
+
+class StateBackendError(Exception):
+    """The backend failed or answered with an error"""
+
+
+class Subscription:
+    """A callback registered on a channel; close() unsubscribes it"""
+
+    def __init__(self, backend: "StateBackend", channel: str, callback: Callback):
+        self.backend = backend
+        self.channel = channel
+        self.callback = callback
+        self.closed = False
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.backend._unsubscribe(self)
+
+
+class StateBackend:
+    """Interface of the shared state backends"""
+
+    name = "base"
+    # Whether other processes see the state (False for the in-memory backend)
+    distributed = True
+
+    def __init__(self):
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        self._sub_lock = threading.Lock()
+        self._counts: Dict[str, int] = {"reads": 0, "writes": 0, "published": 0, "delivered": 0, "errors": 0}
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        """Store value under key, expiring after ttl seconds (never when None)"""
+        raise NotImplementedError
+
+    def delete(self, *keys: str) -> int:
+        """Delete keys (values or lists); returns how many existed"""
+        raise NotImplementedError
+
+    def keys(self, prefix: str) -> List[str]:
+        """Live keys starting with prefix"""
+        raise NotImplementedError
+
+    def append(self, key: str, values: List[bytes], max_len: Optional[int] = None, ttl: Optional[float] = None):
+        """
+        Append values to the list at key
+
+        Args:
+            max_len: Keep only the newest max_len items
+            ttl: Expire the whole list this many seconds from now
+        """
+        raise NotImplementedError
+
+    def range(self, key: str) -> List[bytes]:
+        """All items of the list at key (empty if there is none)"""
+        raise NotImplementedError
+
+    def expire(self, key: str, ttl: float):
+        """Expire key (a value or a list) ttl seconds from now"""
+        raise NotImplementedError
+
+    def publish(self, channel: str, message: bytes):
+        """Deliver message to the channel's current subscribers, in any process"""
+        raise NotImplementedError
+
+    def subscribe(self, channel: str, callback: Callback) -> Subscription:
+        """
+        Call callback(message) for each message published on channel from now on
+
+        Callbacks run on a backend thread (or the publisher's, in memory) and must not block.
+        """
+        subscription = Subscription(self, channel, callback)
+        with self._sub_lock:
+            first = channel not in self._subscriptions
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        if first:
+            self._channel_added(channel)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription):
+        with self._sub_lock:
+            subscribers = self._subscriptions.get(subscription.channel)
+            if subscribers is None:
+                return
+            subscribers.discard(subscription)
+            last = not subscribers
+            if last:
+                del self._subscriptions[subscription.channel]
+        if last:
+            self._channel_removed(subscription.channel)
+
+    def _channel_added(self, channel: str):
+        pass
+
+    def _channel_removed(self, channel: str):
+        pass
+
+    def _deliver(self, channel: str, message: bytes):
+        with self._sub_lock:
+            subscribers = list(self._subscriptions.get(channel, ()))
+        for subscription in subscribers:
+            self._counts["delivered"] += 1
+            try:
+                subscription.callback(message)
+            except Exception:
+                logger.exception("State subscriber failed", extra={"channel": channel})
+
+    def get_json(self, key: str) -> Optional[Any]:
+        value = self.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set_json(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.set(key, json.dumps(value, separators=(",", ":")).encode(), ttl)
+
+    def close(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._sub_lock:
+            channels = len(self._subscriptions)
+        return {"backend": self.name, "distributed": self.distributed, **self._counts, "channels": channels}
+
+
+class MemoryBackend(StateBackend):
+    """State in the worker's memory; pub/sub calls the subscribers directly"""
+
+    name = "memory"
+    distributed = False
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        # key -> (value or deque of items, expires_at or None)
+        self._data: Dict[str, Tuple[Any, Optional[float]]] = {}
+
+    def _live(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            self._counts["reads"] += 1
+            entry = self._live(key)
+            return entry[0] if entry is not None and isinstance(entry[0], bytes) else None
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        with self._lock:
+            self._counts["writes"] += 1
+            self._data[key] = (bytes(value), time.time() + ttl if ttl else None)
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            self._counts["writes"] += 1
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def keys(self, prefix: str) -> List[str]:
+        with self._lock:
+            self._counts["reads"] += 1
+            return [key for key in list(self._data) if key.startswith(prefix) and self._live(key) is not None]
+
+    def append(self, key: str, values: List[bytes], max_len: Optional[int] = None, ttl: Optional[float] = None):
+        with self._lock:
+            self._counts["writes"] += 1
+            entry = self._live(key)
+            items = entry[0] if entry is not None and isinstance(entry[0], deque) else deque()
+            items.extend(values)
+            while max_len is not None and len(items) > max_len:
+                items.popleft()
+            expires_at = time.time() + ttl if ttl else (entry[1] if entry is not None else None)
+            self._data[key] = (items, expires_at)
+
+    def range(self, key: str) -> List[bytes]:
+        with self._lock:
+            self._counts["reads"] += 1
+            entry = self._live(key)
+            return list(entry[0]) if entry is not None and isinstance(entry[0], deque) else []
+
+    def expire(self, key: str, ttl: float):
+        with self._lock:
+            entry = self._live(key)
+            if entry is not None:
+                self._data[key] = (entry[0], time.time() + ttl)
+
+    def publish(self, channel: str, message: bytes):
+        self._counts["published"] += 1
+        self._deliver(channel, message)
+
+
+class SQLiteBackend(StateBackend):
+    """
+    State in a SQLite file shared by the workers of one node
+
+    WAL mode lets the workers read while one writes. Published messages go into a table
+    that a thread polls while there are subscribers; messages are kept for a minute.
+    """
+
+    name = "sqlite"
+    MESSAGE_RETENTION = 60.0
+
+    def __init__(self, path: str, poll_seconds: float = 0.02):
+        """
+        Args:
+            path: SQLite file; every worker of the node must use the same one
+            poll_seconds: How often subscribed workers look for new messages
+        """
+        super().__init__()
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._last_message = 0
+        self._poller: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._writes_since_purge = 0
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS lists (key TEXT PRIMARY KEY, expires_at REAL)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT, value BLOB)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS items_key ON items (key, id)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS messages "
+                "(id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT, payload BLOB, created_at REAL)"
+            )
+            self._purge()
+
+    def _purge(self):
+        """Drop expired values, lists and old messages; called with the lock held"""
+        now = time.time()
+        self._db.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        expired = [row[0] for row in self._db.execute(
+            "SELECT key FROM lists WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+        )]
+        for key in expired:
+            self._db.execute("DELETE FROM items WHERE key = ?", (key,))
+            self._db.execute("DELETE FROM lists WHERE key = ?", (key,))
+        self._db.execute("DELETE FROM messages WHERE created_at < ?", (now - self.MESSAGE_RETENTION,))
+        self._writes_since_purge = 0
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """BEGIN IMMEDIATE ... COMMIT, rolled back on any error; called with the lock held"""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException as e:
+            # Left open, the transaction would make every later BEGIN fail
+            self._db.execute("ROLLBACK")
+            if isinstance(e, sqlite3.Error):
+                raise StateBackendError(str(e)) from e
+            raise
+        self._db.execute("COMMIT")
+
+    def _wrote(self):
+        self._counts["writes"] += 1
+        self._writes_since_purge += 1
+        if self._writes_since_purge >= 1000:
+            self._purge()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            self._counts["reads"] += 1
+            row = self._db.execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return bytes(row[0])
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, bytes(value), time.time() + ttl if ttl else None),
+            )
+            self._wrote()
+
+    def delete(self, *keys: str) -> int:
+        deleted = 0
+        with self._lock:
+            with self._transaction():
+                for key in keys:
+                    deleted += self._db.execute("DELETE FROM kv WHERE key = ?", (key,)).rowcount
+                    deleted += self._db.execute("DELETE FROM lists WHERE key = ?", (key,)).rowcount
+                    self._db.execute("DELETE FROM items WHERE key = ?", (key,))
+            self._wrote()
+        return deleted
+
+    def keys(self, prefix: str) -> List[str]:
+        now = time.time()
+        pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        with self._lock:
+            self._counts["reads"] += 1
+            rows = self._db.execute(
+                "SELECT key FROM kv WHERE key LIKE ? ESCAPE '\\' AND (expires_at IS NULL OR expires_at > ?) "
+                "UNION SELECT key FROM lists WHERE key LIKE ? ESCAPE '\\' AND (expires_at IS NULL OR expires_at > ?)",
+                (pattern, now, pattern, now),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def append(self, key: str, values: List[bytes], max_len: Optional[int] = None, ttl: Optional[float] = None):
+        with self._lock:
+            with self._transaction():
+                self._db.executemany("INSERT INTO items (key, value) VALUES (?, ?)", [(key, bytes(v)) for v in values])
+                if ttl:
+                    self._db.execute("INSERT OR REPLACE INTO lists (key, expires_at) VALUES (?, ?)", (key, time.time() + ttl))
+                else:
+                    self._db.execute("INSERT OR IGNORE INTO lists (key, expires_at) VALUES (?, NULL)", (key,))
+                if max_len is not None:
+                    self._db.execute(
+                        "DELETE FROM items WHERE key = ? AND id <= "
+                        "(SELECT id FROM items WHERE key = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                        (key, key, max_len),
+                    )
+            self._wrote()
+
+    def range(self, key: str) -> List[bytes]:
+        with self._lock:
+            self._counts["reads"] += 1
+            row = self._db.execute("SELECT expires_at FROM lists WHERE key = ?", (key,)).fetchone()
+            if row is None or (row[0] is not None and row[0] <= time.time()):
+                return []
+            return [bytes(r[0]) for r in self._db.execute("SELECT value FROM items WHERE key = ? ORDER BY id", (key,))]
+
+    def expire(self, key: str, ttl: float):
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._db.execute("UPDATE kv SET expires_at = ? WHERE key = ?", (expires_at, key))
+            self._db.execute("UPDATE lists SET expires_at = ? WHERE key = ?", (expires_at, key))
+            self._wrote()
+
+    def publish(self, channel: str, message: bytes):
+        with self._lock:
+            self._counts["published"] += 1
+            self._db.execute(
+                "INSERT INTO messages (channel, payload, created_at) VALUES (?, ?, ?)",
+                (channel, bytes(message), time.time()),
+            )
+            self._wrote()
+
+    def _channel_added(self, channel: str):
+        with self._lock:
+            if self._poller is None:
+                # Only messages published from now on
+                self._last_message = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+                self._poller = threading.Thread(target=self._poll, name="sqlite-state-poller", daemon=True)
+                self._poller.start()
+
+    def _poll(self):
+        while not self._stop.wait(self.poll_seconds):
+            with self._sub_lock:
+                channels = list(self._subscriptions)
+            if not channels:
+                continue
+            try:
+                with self._lock:
+                    rows = self._db.execute(
+                        f"SELECT id, channel, payload FROM messages WHERE id > ? "
+                        f"AND channel IN ({','.join('?' * len(channels))}) ORDER BY id",
+                        (self._last_message, *channels),
+                    ).fetchall()
+                    if rows:
+                        self._last_message = rows[-1][0]
+            except sqlite3.Error as e:
+                self._counts["errors"] += 1
+                logger.warning("State message poll failed", extra={"error": str(e)})
+                continue
+            for _, channel, payload in rows:
+                self._deliver(channel, bytes(payload))
+
+    def close(self):
+        self._stop.set()
+        if self._poller is not None:
+            self._poller.join()
+        with self._lock:
+            self._db.close()
+
+
+class RedisError(StateBackendError):
+    """An error reply from the Redis server"""
+
+
+_INCOMPLETE = object()
+
+
+def encode_command(*args: Any) -> bytes:
+    """A RESP command: an array of bulk strings"""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+def parse_resp(buf: bytearray, pos: int = 0) -> Tuple[Any, int]:
+    """
+    Parse one RESP2 value from buf at pos
+
+    Returns:
+        (value, position after it), or (_INCOMPLETE, pos) if buf doesn't hold all of it yet.
+        Error replies are returned as RedisError instances, null bulk strings as None.
+    """
+    end = buf.find(b"\r\n", pos)
+    if end < 0:
+        return _INCOMPLETE, pos
+    kind, line, after = buf[pos:pos + 1], bytes(buf[pos + 1:end]), end + 2
+    if kind == b"+":
+        return line.decode(), after
+    if kind == b"-":
+        return RedisError(line.decode()), after
+    if kind == b":":
+        return int(line), after
+    if kind == b"$":
+        length = int(line)
+        if length < 0:
+            return None, after
+        if len(buf) < after + length + 2:
+            return _INCOMPLETE, pos
+        return bytes(buf[after:after + length]), after + length + 2
+    if kind == b"*":
+        count = int(line)
+        if count < 0:
+            return None, after
+        items = []
+        for _ in range(count):
+            item, after = parse_resp(buf, after)
+            if item is _INCOMPLETE:
+                return _INCOMPLETE, pos
+            items.append(item)
+        return items, after
+    raise StateBackendError(f"Unexpected RESP type {kind!r}")
+
+
+class _RedisConnection:
+    """One RESP connection; not thread-safe"""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buf = bytearray()
+
+    def send(self, *commands: Tuple[Any, ...]):
+        self.sock.sendall(b"".join(encode_command(*command) for command in commands))
+
+    def read(self) -> Any:
+        """Next reply (blocking up to the socket timeout)"""
+        while True:
+            value, pos = parse_resp(self.buf)
+            if value is not _INCOMPLETE:
+                del self.buf[:pos]
+                return value
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("Redis connection closed")
+            self.buf += chunk
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisBackend(StateBackend):
+    """
+    State in Redis (or anything speaking its protocol), shared by every node
+
+    Commands go over a small pool of connections, with a compound operation's commands
+    pipelined in one round trip. Subscriptions share one connection, read by a thread.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = "redis://127.0.0.1:6379/0", timeout: float = 5.0, pool_size: int = 8):
+        """
+        Args:
+            url: redis://[:password@]host[:port][/db]
+            timeout: Socket timeout of commands (s)
+            pool_size: Idle connections kept for reuse
+        """
+        super().__init__()
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.strip("/") or 0)
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._pool: List[_RedisConnection] = []
+        self._pool_lock = threading.Lock()
+        self._pubsub: Optional[_RedisConnection] = None
+        self._pubsub_lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+        self._closed = False
+
+    def _connect(self, timeout: Optional[float]) -> _RedisConnection:
+        connection = _RedisConnection(self.host, self.port, self.timeout)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            connection.send(*setup)
+            for _ in setup:
+                reply = connection.read()
+                if isinstance(reply, RedisError):
+                    connection.close()
+                    raise reply
+        connection.sock.settimeout(timeout)
+        return connection
+
+    def _execute(self, *commands: Tuple[Any, ...]) -> List[Any]:
+        """Send commands in one round trip; returns their replies (raises on the first error reply)"""
+        with self._pool_lock:
+            connection = self._pool.pop() if self._pool else None
+        try:
+            if connection is None:
+                connection = self._connect(self.timeout)
+            connection.send(*commands)
+            replies = [connection.read() for _ in commands]
+        except (OSError, ConnectionError) as e:
+            if connection is not None:
+                connection.close()
+            self._counts["errors"] += 1
+            raise StateBackendError(f"Redis at {self.host}:{self.port} failed: {e}") from e
+        with self._pool_lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append(connection)
+            else:
+                connection.close()
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                self._counts["errors"] += 1
+                raise reply
+        return replies
+
+    def get(self, key: str) -> Optional[bytes]:
+        self._counts["reads"] += 1
+        return self._execute(("GET", key))[0]
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        self._counts["writes"] += 1
+        command = ("SET", key, value) + (("PX", max(1, int(ttl * 1000))) if ttl else ())
+        self._execute(command)
+
+    def delete(self, *keys: str) -> int:
+        if not keys:
+            return 0
+        self._counts["writes"] += 1
+        return self._execute(("DEL", *keys))[0]
+
+    def keys(self, prefix: str) -> List[str]:
+        self._counts["reads"] += 1
+        pattern = "".join("\\" + c if c in "*?[]\\" else c for c in prefix) + "*"
+        found, cursor = [], b"0"
+        while True:
+            cursor, batch = self._execute(("SCAN", cursor, "MATCH", pattern, "COUNT", 1000))[0]
+            found.extend(key.decode() for key in batch)
+            if cursor in (b"0", "0"):
+                return found
+
+    def append(self, key: str, values: List[bytes], max_len: Optional[int] = None, ttl: Optional[float] = None):
+        self._counts["writes"] += 1
+        commands = [("RPUSH", key, *values)]
+        if max_len is not None:
+            commands.append(("LTRIM", key, -max_len, -1))
+        if ttl:
+            commands.append(("PEXPIRE", key, max(1, int(ttl * 1000))))
+        self._execute(*commands)
+
+    def range(self, key: str) -> List[bytes]:
+        self._counts["reads"] += 1
+        return self._execute(("LRANGE", key, 0, -1))[0]
+
+    def expire(self, key: str, ttl: float):
+        self._counts["writes"] += 1
+        self._execute(("PEXPIRE", key, max(1, int(ttl * 1000))))
+
+    def publish(self, channel: str, message: bytes):
+        self._counts["published"] += 1
+        self._execute(("PUBLISH", channel, message))
+
+    def _channel_added(self, channel: str):
+        with self._pubsub_lock:
+            if self._pubsub is None:
+                # Blocks in the listener thread until a message arrives
+                self._pubsub = self._connect(None)
+                self._listener = threading.Thread(target=self._listen, args=(self._pubsub,), name="redis-state-listener", daemon=True)
+                self._listener.start()
+            self._pubsub.send(("SUBSCRIBE", channel))
+
+    def _channel_removed(self, channel: str):
+        with self._pubsub_lock:
+            if self._pubsub is not None:
+                self._pubsub.send(("UNSUBSCRIBE", channel))
+
+    def _listen(self, connection: _RedisConnection):
+        while True:
+            try:
+                reply = connection.read()
+            except (OSError, ConnectionError) as e:
+                if not self._closed:
+                    self._counts["errors"] += 1
+                    logger.warning("Redis subscription connection lost", extra={"error": str(e)})
+                    self._resubscribe()
+                return
+            if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                self._deliver(reply[1].decode(), reply[2])
+
+    def _resubscribe(self):
+        """Open a new subscription connection for the channels that still have subscribers"""
+        with self._pubsub_lock:
+            self._pubsub = None
+        with self._sub_lock:
+            channels = list(self._subscriptions)
+        for channel in channels:
+            try:
+                self._channel_added(channel)
+            except (OSError, StateBackendError) as e:
+                logger.warning("Redis resubscribe failed", extra={"channel": channel, "error": str(e)})
+                return
+
+    def close(self):
+        self._closed = True
+        with self._pubsub_lock:
+            if self._pubsub is not None:
+                try:
+                    self._pubsub.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                self._pubsub.close()
+                self._pubsub = None
+        with self._pool_lock:
+            for connection in self._pool:
+                connection.close()
+            self._pool.clear()
+
+
+def create_backend(kind: str, sqlite_path: str = "meda_state.db", redis_url: str = "redis://127.0.0.1:6379/0",
+                   sqlite_poll_seconds: float = 0.02) -> StateBackend:
+    """The backend named by STATE_BACKEND ("memory", "sqlite" or "redis")"""
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "sqlite":
+        directory = os.path.dirname(sqlite_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return SQLiteBackend(sqlite_path, poll_seconds=sqlite_poll_seconds)
+    if kind == "redis":
+        return RedisBackend(redis_url)
+    raise ValueError(f"Unknown STATE_BACKEND {kind!r} (expected memory, sqlite or redis)")
@@ -0,0 +1,209 @@
+"""
+Server-Sent Events framing shared by the streaming endpoints
+
+SSEWriter turns an async stream of events into SSE frames:
+- consecutive Delta items (token text with the same metadata) are coalesced into one frame
+  over a small time/byte window; the first one is sent right away so time to first token
+  doesn't suffer, empty ones are dropped
+- every frame carries an event ID (`id:` line)
+- idle connections get a heartbeat comment so proxies don't time them out
+
+Frames are serialized with orjson when it is installed, json otherwise.
+"""
+import asyncio
+import json
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Union
+
+try:
+    import orjson
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+DONE = "[DONE]"
+HEARTBEAT = b": ping\n\n"
+
+
+class Delta:
+    """Streamed text; consecutive deltas with equal metadata are merged into one frame"""
+
+    __slots__ = ("content", "meta")
+
+    def __init__(self, content: str, **meta: Any):
+        self.content = content
+        self.meta = meta
+
+    def payload(self, content: str) -> Dict[str, Any]:
+        return {**self.meta, "content": content}
+
+
+# What a stream passed to SSEWriter may yield: a Delta, a dict (sent as one frame) or raw data (DONE)
+Event = Union[Delta, Dict[str, Any], str]
+
+_END = object()
+_TIMEOUT = object()
+
+
+class _Channel:
+    """
+    Bounded single-producer, single-consumer hand-off between the event source and the writer.
+
+    Cheaper than asyncio.Queue with wait_for: a wait with a timeout is one future and one
+    call_later handle instead of a new task per event.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_pending: int):
+        self._loop = loop
+        self._items: Deque[Any] = deque()
+        self._max_pending = max_pending
+        self._getter: Optional[asyncio.Future] = None
+        self._putter: Optional[asyncio.Future] = None
+
+    @staticmethod
+    def _wake(waiter: Optional[asyncio.Future]):
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def put(self, item: Any):
+        while len(self._items) >= self._max_pending:
+            self._putter = self._loop.create_future()
+            await self._putter
+        self._items.append(item)
+        self._wake(self._getter)
+
+    async def get(self, timeout: Optional[float]) -> Any:
+        """The next item, or _TIMEOUT once timeout seconds pass without one"""
+        if not self._items:
+            if timeout is not None and timeout <= 0:
+                return _TIMEOUT
+            self._getter = self._loop.create_future()
+            handle = self._loop.call_later(timeout, self._wake, self._getter) if timeout is not None else None
+            try:
+                await self._getter
+            finally:
+                if handle is not None:
+                    handle.cancel()
+            if not self._items:
+                return _TIMEOUT
+        item = self._items.popleft()
+        self._wake(self._putter)
+        return item
+
+
+class SSEWriter:
+    """Frames one stream; create one per response"""
+
+    def __init__(
+        self,
+        coalesce_seconds: float = 0.02,
+        coalesce_bytes: int = 1024,
+        heartbeat_seconds: Optional[float] = 15.0,
+        first_id: int = 0,
+    ):
+        """
+        Args:
+            coalesce_seconds: Longest a delta waits for more text before its frame is sent
+            coalesce_bytes: Send a coalesced frame once its text reaches this size
+            heartbeat_seconds: Idle time after which a heartbeat comment is sent (None: never)
+            first_id: Event ID of the first frame
+        """
+        self.coalesce_seconds = coalesce_seconds
+        self.coalesce_bytes = coalesce_bytes
+        self.heartbeat_seconds = heartbeat_seconds
+        self.next_id = first_id
+        self.frames = 0
+        self.deltas = 0
+
+    def frame(self, data: Union[Dict[str, Any], str]) -> bytes:
+        """One SSE frame with the next event ID"""
+        body = data.encode() if isinstance(data, str) else dumps(data)
+        event_id = self.next_id
+        self.next_id += 1
+        self.frames += 1
+        return b"id: %d\ndata: %s\n\n" % (event_id, body)
+
+    async def stream(self, events: AsyncIterator[Event], max_pending: int = 64) -> AsyncIterator[bytes]:
+        """
+        SSE frames for events; stopping this generator also stops the events stream
+
+        Args:
+            events: Deltas, dict payloads and raw data (DONE)
+            max_pending: Events read ahead of the client; a slow client holds back the source
+        """
+        loop = asyncio.get_running_loop()
+        channel = _Channel(loop, max_pending)
+
+        async def pump():
+            try:
+                async for event in events:
+                    await channel.put(event)
+                await channel.put(_END)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await channel.put(e)
+
+        task = asyncio.ensure_future(pump())
+        pending: Optional[Delta] = None
+        parts = []
+        size = 0
+        deadline = 0.0
+        # Metadata of the delta run in progress; its first delta was already sent on its own
+        run_meta: Optional[Dict[str, Any]] = None
+
+        def flush() -> bytes:
+            nonlocal pending, parts, size
+            frame = self.frame(pending.payload("".join(parts)))
+            pending, parts, size = None, [], 0
+            return frame
+
+        try:
+            while True:
+                timeout = deadline - loop.time() if pending is not None else self.heartbeat_seconds
+                event = await channel.get(timeout)
+                if event is _TIMEOUT:
+                    yield flush() if pending is not None else HEARTBEAT
+                    continue
+
+                if isinstance(event, Delta):
+                    if not event.content:
+                        continue
+                    self.deltas += 1
+                    if pending is not None and event.meta == pending.meta:
+                        parts.append(event.content)
+                        size += len(event.content)
+                        if size >= self.coalesce_bytes:
+                            yield flush()
+                        continue
+                    if pending is not None:
+                        yield flush()
+                    if event.meta != run_meta or self.coalesce_seconds <= 0:
+                        # A new run's first token goes out at once, so time to first token is unchanged
+                        run_meta = event.meta
+                        yield self.frame(event.payload(event.content))
+                        continue
+                    pending, parts, size = event, [event.content], len(event.content)
+                    deadline = loop.time() + self.coalesce_seconds
+                    continue
+
+                if pending is not None:
+                    yield flush()
+                run_meta = None
+                if event is _END:
+                    return
+                if isinstance(event, Exception):
+                    raise event
+                yield self.frame(event)
+        finally:
+            if not task.done():
+                task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,420 @@
+"""
+Resumable SSE streams for /chat and /arena/debate-stream
+
+A streamed run is produced by its own task, independent of the HTTP connection: its frames
+(with sequential event IDs, see sse.SSEWriter) go into a bounded per-run buffer that
+connections read from. When the client drops, generation goes on; a reconnect to
+GET /streams/{run_id} with Last-Event-ID replays the frames it missed and then follows the
+run live, so no LLM call is repeated. A run nobody is connected to is cancelled after the
+grace period; a finished run is kept that long too, so a late reconnect still gets the end.
+
+A run is produced by the worker that started it. With a distributed shared_state backend
+its frames are also mirrored there (a list per run, plus a pub/sub channel for new ones),
+so a reconnect that reaches another worker or node follows the run from the backend
+(RemoteRun); without one, reconnects must reach the same worker.
+"""
+import asyncio
+import itertools
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set, Tuple, Union
+
+from shared_state import StateBackend, StateBackendError
+from sse import HEARTBEAT, SSEWriter
+from telemetry import logger
+
+
+_TIMEOUT = object()
+# Mirror queue markers
+_STARTED = object()
+_FINISHED = object()
+_STOP = object()
+
+
+def _resolve(waiter: asyncio.Future, value: Any):
+    if not waiter.done():
+        waiter.set_result(value)
+
+
+def _frame_id(frame: bytes) -> int:
+    """Event ID of an SSE frame written by SSEWriter (its first line is "id: N")"""
+    return int(frame[4:frame.index(b"\n")])
+
+
+def _split_frames(data: bytes) -> List[bytes]:
+    # Frames end with a blank line, which can't occur inside one (JSON data has no raw newlines)
+    return [frame + b"\n\n" for frame in data.split(b"\n\n") if frame]
+
+
+def _keys(run_id: str) -> Tuple[str, str, str]:
+    """Shared backend keys of a run: its frames, its state ("running"/"done") and its remote readers"""
+    return f"stream:{run_id}:frames", f"stream:{run_id}:state", f"stream:{run_id}:readers"
+
+
+class ResumeGap(Exception):
+    """The frames after the client's Last-Event-ID are no longer buffered"""
+
+    status_code = 410
+
+
+class StreamRun:
+    """One streamed run: its buffered frames and the task producing them"""
+
+    def __init__(self, run_id: str, max_events: int):
+        self.id = run_id
+        self.frames: Deque[bytes] = deque(maxlen=max_events)
+        self.next_id = 0
+        self.done = False
+        self.subscribers = 0
+        self.created = time.time()
+        self.task: Optional[asyncio.Future] = None
+        self.expiry: Optional[asyncio.TimerHandle] = None
+        self._waiters: List[asyncio.Future] = []
+
+    @property
+    def first_id(self) -> int:
+        """ID of the oldest buffered frame"""
+        return self.next_id - len(self.frames)
+
+    def _wake(self):
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            _resolve(waiter, None)
+
+    def append(self, frame: bytes):
+        self.frames.append(frame)
+        self.next_id += 1
+        self._wake()
+
+    def finish(self):
+        self.done = True
+        self._wake()
+
+    def check_resumable(self, last_id: Optional[int]):
+        """Raise ResumeGap if frames after last_id have already been dropped from the buffer"""
+        if last_id is not None and last_id + 1 < self.first_id:
+            raise ResumeGap(f"Events {last_id + 1}-{self.first_id - 1} of run {self.id} are no longer buffered")
+
+    async def frames_after(self, last_id: Optional[int], heartbeat_seconds: Optional[float]) -> AsyncIterator[bytes]:
+        """Buffered frames after last_id, then new ones as they are produced, until the run ends"""
+        loop = asyncio.get_running_loop()
+        cursor = -1 if last_id is None else last_id
+        while True:
+            start = cursor + 1 - self.first_id
+            if start < 0:
+                # Fell more than the buffer behind the run; the client can't resume either
+                return
+            if start < len(self.frames):
+                batch = list(itertools.islice(self.frames, start, None))
+                cursor += len(batch)
+                yield b"".join(batch)
+                continue
+            if self.done:
+                return
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            handle = loop.call_later(heartbeat_seconds, _resolve, waiter, _TIMEOUT) if heartbeat_seconds else None
+            try:
+                timed_out = await waiter is _TIMEOUT
+            finally:
+                if handle is not None:
+                    handle.cancel()
+            if timed_out:
+                self._waiters.remove(waiter)
+                yield HEARTBEAT
+
+
+class RemoteRun:
+    """A run produced by another worker, as found in the shared backend"""
+
+    def __init__(self, run_id: str, frames: List[bytes]):
+        self.id = run_id
+        self.first_id = _frame_id(frames[0]) if frames else 0
+
+    def check_resumable(self, last_id: Optional[int]):
+        """Raise ResumeGap if frames after last_id have already been dropped from the shared list"""
+        if last_id is not None and last_id + 1 < self.first_id:
+            raise ResumeGap(f"Events {last_id + 1}-{self.first_id - 1} of run {self.id} are no longer buffered")
+
+
+class StreamRuns:
+    """The worker's resumable runs"""
+
+    def __init__(
+        self,
+        grace_seconds: float = 60,
+        max_events: int = 5000,
+        heartbeat_seconds: Optional[float] = 15,
+        shared: Optional[StateBackend] = None,
+    ):
+        """
+        Args:
+            grace_seconds: How long a run without connections (running or finished) is kept
+            max_events: Frames buffered per run; older ones can't be replayed
+            heartbeat_seconds: Idle time after which a connection gets a heartbeat comment
+            shared: Distributed backend to mirror runs into, so other workers can follow them
+        """
+        self.grace_seconds = grace_seconds
+        self.max_events = max_events
+        self.heartbeat_seconds = heartbeat_seconds
+        self.shared = shared
+        self._runs: Dict[str, StreamRun] = {}
+        self._expiring: Set[asyncio.Task] = set()
+        self._counts: Dict[str, int] = {
+            "started": 0, "completed": 0, "abandoned": 0, "resumed": 0, "replayed_events": 0,
+            "remote_followers": 0, "mirrored_frames": 0, "mirror_errors": 0,
+        }
+        self._outbox: "queue.Queue" = queue.Queue()
+        self._mirror: Optional[threading.Thread] = None
+        if shared is not None:
+            self._mirror = threading.Thread(target=self._mirror_loop, name="stream-run-mirror", daemon=True)
+            self._mirror.start()
+
+    def get(self, run_id: str) -> Optional[StreamRun]:
+        return self._runs.get(run_id)
+
+    async def get_remote(self, run_id: str) -> Optional[RemoteRun]:
+        """A run another worker is producing (or produced recently), or None"""
+        if self.shared is None:
+            return None
+        return await asyncio.to_thread(self._get_remote, run_id)
+
+    def _get_remote(self, run_id: str) -> Optional[RemoteRun]:
+        frames_key, state_key, _ = _keys(run_id)
+        try:
+            if self.shared.get(state_key) is None:
+                return None
+            return RemoteRun(run_id, self.shared.range(frames_key))
+        except StateBackendError as e:
+            logger.warning("Shared stream lookup failed", extra={"run_id": run_id, "error": str(e)})
+            return None
+
+    def start(self, events, writer: SSEWriter) -> StreamRun:
+        """
+        Produce events into a new run; must be called from a running event loop
+
+        Args:
+            events: The stream's events (see sse.SSEWriter.stream)
+            writer: Frames them; its heartbeats are turned off (connections send their own)
+        """
+        run = StreamRun(uuid.uuid4().hex, self.max_events)
+        writer.heartbeat_seconds = None
+        self._runs[run.id] = run
+        self._counts["started"] += 1
+        if self.shared is not None:
+            self._outbox.put((run.id, _STARTED))
+        run.task = asyncio.ensure_future(self._produce(run, writer, events))
+        # Expires unless the first connection subscribes
+        self._schedule_expiry(run)
+        return run
+
+    async def _produce(self, run: StreamRun, writer: SSEWriter, events):
+        try:
+            async for frame in writer.stream(events):
+                run.append(frame)
+                if self.shared is not None:
+                    self._outbox.put((run.id, frame))
+            self._counts["completed"] += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.exception("Stream run failed", extra={"run_id": run.id})
+        finally:
+            run.finish()
+            if self.shared is not None:
+                self._outbox.put((run.id, _FINISHED))
+
+    def _schedule_expiry(self, run: StreamRun):
+        if run.expiry is not None:
+            run.expiry.cancel()
+        run.expiry = asyncio.get_running_loop().call_later(self.grace_seconds, self._expire, run)
+
+    def _has_remote_readers(self, run: StreamRun) -> bool:
+        try:
+            return self.shared.get(_keys(run.id)[2]) is not None
+        except StateBackendError:
+            return False
+
+    def _expire(self, run: StreamRun):
+        run.expiry = None
+        if run.subscribers:
+            return
+        if self.shared is not None:
+            # The readers key is looked up off the event loop
+            task = asyncio.ensure_future(self._expire_shared(run))
+            self._expiring.add(task)
+            task.add_done_callback(self._expiring.discard)
+            return
+        self._drop(run)
+
+    async def _expire_shared(self, run: StreamRun):
+        readers = await asyncio.to_thread(self._has_remote_readers, run)
+        if run.subscribers or run.expiry is not None or run.id not in self._runs:
+            # Reconnected (or rescheduled) while we looked
+            return
+        if readers:
+            # Followed from another worker (which keeps the readers key fresh)
+            self._schedule_expiry(run)
+            return
+        self._drop(run)
+
+    def _drop(self, run: StreamRun):
+        if not run.done:
+            # Nobody came back within the grace period: stop generating
+            self._counts["abandoned"] += 1
+            run.task.cancel()
+        self._runs.pop(run.id, None)
+
+    async def subscribe(self, run: Union[StreamRun, RemoteRun], last_id: Optional[int] = None) -> AsyncIterator[bytes]:
+        """
+        Frames of run after last_id, then live ones; the run keeps going when this is closed
+
+        Call run.check_resumable(last_id) first to answer with an error status instead of an empty stream.
+        """
+        if isinstance(run, RemoteRun):
+            async for chunk in self._follow(run, last_id):
+                yield chunk
+            return
+        run.subscribers += 1
+        if run.expiry is not None:
+            run.expiry.cancel()
+            run.expiry = None
+        if last_id is not None:
+            self._counts["resumed"] += 1
+            self._counts["replayed_events"] += max(0, run.next_id - last_id - 1)
+        try:
+            async for chunk in run.frames_after(last_id, self.heartbeat_seconds):
+                yield chunk
+        finally:
+            run.subscribers -= 1
+            if not run.subscribers and run.id in self._runs:
+                self._schedule_expiry(run)
+
+    async def _follow(self, run: RemoteRun, last_id: Optional[int]) -> AsyncIterator[bytes]:
+        """Frames of a run produced by another worker, from the shared list and then its channel"""
+        frames_key, state_key, readers_key = _keys(run.id)
+        loop = asyncio.get_running_loop()
+        messages: asyncio.Queue = asyncio.Queue()
+        # Shared backend calls block (network or SQLite), so they run off the event loop
+        call = asyncio.to_thread
+        # Subscribe before reading the list so no frame falls in between (duplicates are skipped)
+        subscription = await call(
+            self.shared.subscribe, f"stream:{run.id}", lambda m: loop.call_soon_threadsafe(messages.put_nowait, m)
+        )
+        self._counts["remote_followers"] += 1
+        if last_id is not None:
+            self._counts["resumed"] += 1
+        # Keeps the producing worker from expiring the run while this connection is open
+        keepalive = min(self.heartbeat_seconds or self.grace_seconds, self.grace_seconds / 3)
+        cursor = -1 if last_id is None else last_id
+        try:
+            await call(self.shared.set, readers_key, b"1", ttl=self.grace_seconds)
+            refreshed = time.monotonic()
+            frames = await call(self.shared.range, frames_key)
+            done = await call(self.shared.get, state_key) == b"done"
+            while True:
+                batch = [frame for frame in frames if _frame_id(frame) > cursor]
+                if batch:
+                    cursor = _frame_id(batch[-1])
+                    yield b"".join(batch)
+                if done:
+                    return
+                if time.monotonic() - refreshed >= keepalive:
+                    await call(self.shared.set, readers_key, b"1", ttl=self.grace_seconds)
+                    refreshed = time.monotonic()
+                try:
+                    message = await asyncio.wait_for(messages.get(), keepalive)
+                except asyncio.TimeoutError:
+                    if await call(self.shared.get, state_key) is None:
+                        # The producing worker is gone
+                        return
+                    frames = []
+                    if self.heartbeat_seconds:
+                        yield HEARTBEAT
+                    continue
+                # An empty message marks the end of the run
+                done = not message
+                frames = _split_frames(message)
+        except StateBackendError as e:
+            logger.warning("Following a shared stream failed", extra={"run_id": run.id, "error": str(e)})
+        finally:
+            subscription.close()
+
+    def _mirror_loop(self):
+        """Writes runs' frames to the shared backend in batches, off the event loop"""
+        running: Set[str] = set()
+        refresh_seconds = self.grace_seconds / 3
+        while True:
+            try:
+                items = [self._outbox.get(timeout=refresh_seconds)]
+            except queue.Empty:
+                items = []
+            while len(items) < 512:
+                try:
+                    items.append(self._outbox.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(item is _STOP for item in items)
+            batches: Dict[str, List[Any]] = {}
+            for item in items:
+                if item is not _STOP:
+                    batches.setdefault(item[0], []).append(item[1])
+            for run_id, entries in batches.items():
+                frames = [entry for entry in entries if isinstance(entry, bytes)]
+                self._mirror_run(run_id, entries, frames)
+                if _STARTED in entries:
+                    running.add(run_id)
+                if _FINISHED in entries:
+                    running.discard(run_id)
+            # Runs without new frames (a queued debate, a long LLM call) stay findable
+            for run_id in running - batches.keys():
+                self._mirror_run(run_id, [], [])
+            if stop:
+                return
+
+    def _mirror_run(self, run_id: str, entries: List[Any], frames: List[bytes]):
+        frames_key, state_key, _ = _keys(run_id)
+        # The shared copy outlives the local one a little, so late followers still get the end
+        ttl = self.grace_seconds * 2
+        try:
+            if _STARTED in entries:
+                self.shared.set(state_key, b"running", ttl=ttl)
+            if frames:
+                self.shared.append(frames_key, frames, max_len=self.max_events, ttl=ttl)
+                self.shared.publish(f"stream:{run_id}", b"".join(frames))
+                self._counts["mirrored_frames"] += len(frames)
+            if _FINISHED in entries:
+                self.shared.set(state_key, b"done", ttl=ttl)
+                self.shared.publish(f"stream:{run_id}", b"")
+            elif _STARTED not in entries:
+                self.shared.expire(state_key, ttl)
+                if not frames:
+                    self.shared.expire(frames_key, ttl)
+        except StateBackendError as e:
+            self._counts["mirror_errors"] += 1
+            logger.warning("Mirroring a stream run failed", extra={"run_id": run_id, "error": str(e)})
+
+    def shutdown(self):
+        for run in self._runs.values():
+            if run.expiry is not None:
+                run.expiry.cancel()
+            if run.task is not None and not run.done:
+                run.task.cancel()
+        self._runs.clear()
+        if self._mirror is not None:
+            self._outbox.put(_STOP)
+            self._mirror.join(timeout=5)
+
+    def stats(self) -> Dict[str, Any]:
+        runs = list(self._runs.values())
+        return {
+            **self._counts,
+            "runs": len(runs),
+            "running": sum(not run.done for run in runs),
+            "subscribers": sum(run.subscribers for run in runs),
+            "buffered_events": sum(len(run.frames) for run in runs),
+            "buffered_bytes": sum(len(frame) for run in runs for frame in run.frames),
+        }
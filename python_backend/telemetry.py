@@ -0,0 +1,371 @@
+"""
+Request-scoped instrumentation: timing spans, Prometheus metrics and structured logs.
+
+Every HTTP request gets a RequestContext (request ID, endpoint, model) held in a
+context variable, so spans recorded anywhere below it - LangChain callbacks, the
+debate worker threads (which run with a copy of the context), tool calls - are
+labeled and, when tracing is requested, collected into a JSON trace.
+"""
+import contextvars
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+import token_budget
+
+logger = logging.getLogger("meda")
+
+_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128)
+
+REQUEST_SECONDS = Histogram(
+    "meda_request_seconds", "HTTP request duration, including streamed bodies",
+    ["endpoint", "model"], buckets=_LATENCY_BUCKETS,
+)
+LLM_CALL_SECONDS = Histogram(
+    "meda_llm_call_seconds", "Duration of a single LLM completion",
+    ["endpoint", "model"], buckets=_LATENCY_BUCKETS,
+)
+TOOL_CALL_SECONDS = Histogram(
+    "meda_tool_call_seconds", "Duration of a single agent tool call",
+    ["endpoint", "model", "tool"], buckets=_LATENCY_BUCKETS,
+)
+AGENT_ITERATION_SECONDS = Histogram(
+    "meda_agent_iteration_seconds", "Duration of one AgentExecutor iteration (LLM call plus tools)",
+    ["endpoint", "model"], buckets=_LATENCY_BUCKETS,
+)
+DEBATE_TURN_SECONDS = Histogram(
+    "meda_debate_turn_seconds", "Duration of one debate speaker turn",
+    ["endpoint", "model", "speaker"], buckets=_LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "meda_llm_tokens_total", "Tokens reported by the LLM provider",
+    ["endpoint", "model", "kind"],
+)
+ROUTE_DECISIONS = Counter(
+    "meda_route_decisions_total", "Routing decisions for /chat requests with model \"auto\"",
+    ["route", "reason"],
+)
+ROUTE_SECONDS = Histogram(
+    "meda_route_request_seconds", "End-to-end /chat latency per route",
+    ["route", "model"], buckets=_LATENCY_BUCKETS,
+)
+LLM_RETRIES = Counter(
+    "meda_llm_retries_total", "LLM calls retried after a 429, 5xx or connection error",
+    ["endpoint", "model", "reason"],
+)
+LLM_FALLBACKS = Counter(
+    "meda_llm_fallbacks_total", "LLM calls moved to a sibling model",
+    ["endpoint", "model", "fallback"],
+)
+
+SEARCH_PREFETCHES = Counter(
+    "meda_search_prefetch_total", "Speculative Tavily searches for /chat, by outcome (used, wasted, failed)",
+    ["outcome"],
+)
+SEARCH_PREFETCH_SAVED_SECONDS = Counter(
+    "meda_search_prefetch_saved_seconds_total", "Search latency taken off the critical path by prefetching",
+)
+BUDGET_STOPS = Counter(
+    "meda_budget_stops_total", "Requests finished early by a token budget, by reason",
+    ["endpoint", "reason"],
+)
+MODERATION_CHECKS = Counter(
+    "meda_moderation_checks_total", "Llama Guard checks of questions and streamed output, by verdict (safe, unsafe, error)",
+    ["stage", "verdict"],
+)
+MODERATION_SECONDS = Histogram(
+    "meda_moderation_check_seconds", "Time to a moderation verdict, cache hits included",
+    ["stage"], buckets=_LATENCY_BUCKETS,
+)
+
+
+class RequestContext:
+    """Mutable per-request state shared by everything running on behalf of the request"""
+
+    def __init__(self, request_id: str, endpoint: str, trace: bool = False):
+        self.request_id = request_id
+        self.endpoint = endpoint
+        self.model = ""
+        self.started = time.perf_counter()
+        self.spans: Optional[List[Dict[str, Any]]] = [] if trace else None
+
+
+_current: contextvars.ContextVar[Optional[RequestContext]] = contextvars.ContextVar("meda_request", default=None)
+
+# Most recent traces by request ID, served from /traces/{request_id}
+_traces: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_MAX_TRACES = 200
+
+
+def current() -> Optional[RequestContext]:
+    return _current.get()
+
+
+def set_model(model: str):
+    """Label the current request's metrics with the model it uses"""
+    ctx = _current.get()
+    if ctx is not None:
+        ctx.model = model
+
+
+def _labels(model: Optional[str] = None) -> Dict[str, str]:
+    ctx = _current.get()
+    return {
+        "endpoint": ctx.endpoint if ctx else "none",
+        "model": model or (ctx.model if ctx else "") or "unknown",
+    }
+
+
+def record_span(kind: str, name: str, seconds: float, **attrs: Any):
+    """Add a finished span to the current request's trace (if tracing) and the debug log"""
+    ctx = _current.get()
+    span = {"kind": kind, "name": name, "ms": round(seconds * 1000, 2), **attrs}
+    if ctx is not None and ctx.spans is not None:
+        span["offset_ms"] = round((time.perf_counter() - ctx.started - seconds) * 1000, 2)
+        ctx.spans.append(span)
+    logger.debug("span", extra={"span": span})
+
+
+def record_llm_call(seconds: float, model: Optional[str] = None, prompt_tokens: int = 0, completion_tokens: int = 0):
+    labels = _labels(model)
+    LLM_CALL_SECONDS.labels(**labels).observe(seconds)
+    record_tokens(prompt_tokens, completion_tokens, labels["model"])
+    record_span("llm", labels["model"], seconds, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+def record_tokens(prompt_tokens: int, completion_tokens: int, model: Optional[str] = None):
+    labels = _labels(model)
+    if prompt_tokens:
+        LLM_TOKENS.labels(kind="prompt", **labels).inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(kind="completion", **labels).inc(completion_tokens)
+    token_budget.charge(labels["model"], prompt_tokens, completion_tokens)
+
+
+def record_llm_retry(model: str, reason: str):
+    LLM_RETRIES.labels(reason=reason, **_labels(model)).inc()
+    record_span("llm_retry", model, 0.0, reason=reason)
+
+
+def record_llm_fallback(model: str, fallback: str):
+    LLM_FALLBACKS.labels(fallback=fallback, **_labels(model)).inc()
+    record_span("llm_fallback", model, 0.0, fallback=fallback)
+
+
+def record_route_decision(route: str, reason: str, classifier_seconds: float = 0.0):
+    ROUTE_DECISIONS.labels(route=route, reason=reason).inc()
+    record_span("route", route, classifier_seconds, reason=reason)
+
+
+def record_route_latency(route: str, model: str, seconds: float):
+    ROUTE_SECONDS.labels(route=route, model=model).observe(seconds)
+
+
+def record_search_prefetch(outcome: str, saved_seconds: float = 0.0):
+    SEARCH_PREFETCHES.labels(outcome=outcome).inc()
+    if saved_seconds:
+        SEARCH_PREFETCH_SAVED_SECONDS.inc(saved_seconds)
+    record_span("search_prefetch", outcome, saved_seconds)
+
+
+def record_budget_stop(reason: str):
+    BUDGET_STOPS.labels(endpoint=_labels()["endpoint"], reason=reason).inc()
+    record_span("budget_stop", reason, 0.0)
+
+
+def record_moderation(stage: str, verdict: str, seconds: float):
+    MODERATION_CHECKS.labels(stage=stage, verdict=verdict).inc()
+    MODERATION_SECONDS.labels(stage=stage).observe(seconds)
+    record_span("moderation", stage, seconds, verdict=verdict)
+
+
+def record_debate_turn(speaker: str, seconds: float, round_number: int, model: Optional[str] = None):
+    DEBATE_TURN_SECONDS.labels(speaker=speaker, **_labels(model)).observe(seconds)
+    record_span("debate_turn", speaker, seconds, round=round_number)
+
+
+@contextmanager
+def span(kind: str, name: str, **attrs: Any):
+    """Time a block of work as a span of the current request"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(kind, name, time.perf_counter() - started, **attrs)
+
+
+def get_trace(request_id: str) -> Optional[Dict[str, Any]]:
+    return _traces.get(request_id)
+
+
+def metrics_response() -> tuple:
+    """(body, content type) for the /metrics endpoint"""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class TelemetryCallbackHandler(AsyncCallbackHandler):
+    """
+    LangChain callbacks that time LLM calls, tool calls and agent iterations.
+
+    Create one per request; an AgentExecutor iteration is the span from the start of
+    the run (or the previous agent action) to the next action or the final answer.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self._starts: Dict[UUID, float] = {}
+        self._tools: Dict[UUID, str] = {}
+        self._iteration_started: Optional[float] = None
+        self._iterations = 0
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+        if self._iteration_started is None:
+            self._iteration_started = self._starts[run_id]
+
+    async def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        started = self._starts.pop(run_id, None)
+        if started is None:
+            return
+        prompt_tokens, completion_tokens = _token_usage(response)
+        record_llm_call(time.perf_counter() - started, self.model, prompt_tokens, completion_tokens)
+
+    async def on_llm_error(self, error, *, run_id: UUID, **kwargs):
+        self._starts.pop(run_id, None)
+
+    async def on_tool_start(self, serialized, input_str, *, run_id: UUID, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+        self._tools[run_id] = (serialized or {}).get("name", "tool")
+
+    async def on_tool_end(self, output, *, run_id: UUID, **kwargs):
+        self._finish_tool(run_id, "ok")
+
+    async def on_tool_error(self, error, *, run_id: UUID, **kwargs):
+        self._finish_tool(run_id, "error")
+
+    def _finish_tool(self, run_id: UUID, status: str):
+        started = self._starts.pop(run_id, None)
+        tool = self._tools.pop(run_id, "tool")
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        TOOL_CALL_SECONDS.labels(tool=tool, **_labels(self.model)).observe(seconds)
+        record_span("tool", tool, seconds, status=status)
+
+    async def on_agent_action(self, action, *, run_id: UUID, **kwargs):
+        self._end_iteration()
+
+    async def on_agent_finish(self, finish, *, run_id: UUID, **kwargs):
+        self._end_iteration()
+
+    def _end_iteration(self):
+        if self._iteration_started is None:
+            return
+        now = time.perf_counter()
+        self._iterations += 1
+        seconds = now - self._iteration_started
+        AGENT_ITERATION_SECONDS.labels(**_labels(self.model)).observe(seconds)
+        record_span("agent_iteration", str(self._iterations), seconds)
+        self._iteration_started = now
+
+
+def _token_usage(response) -> tuple:
+    """(prompt, completion) tokens from an LLMResult, whichever way the provider reported them"""
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                return metadata.get("input_tokens", 0), metadata.get("output_tokens", 0)
+    return 0, 0
+
+
+class RequestContextMiddleware:
+    """
+    Pure ASGI middleware: assigns a request ID (or keeps X-Request-ID), times the
+    request until its body has been fully sent - streamed bodies included - and
+    collects a trace when the client sends X-Trace: 1.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode().lower(): v.decode() for k, v in scope.get("headers", [])}
+        request_id = headers.get("x-request-id") or uuid.uuid4().hex
+        ctx = RequestContext(request_id, scope.get("path", ""), trace=headers.get("x-trace") == "1")
+        token = _current.set(ctx)
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message.setdefault("headers", []).append((b"x-request-id", request_id.encode()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            route = scope.get("route")
+            ctx.endpoint = getattr(route, "path", ctx.endpoint)
+            seconds = time.perf_counter() - ctx.started
+            REQUEST_SECONDS.labels(endpoint=ctx.endpoint, model=ctx.model or "none").observe(seconds)
+            logger.info(
+                "request finished",
+                extra={"endpoint": ctx.endpoint, "model": ctx.model, "status": status, "ms": round(seconds * 1000, 2)},
+            )
+            if ctx.spans is not None:
+                _traces[request_id] = {
+                    "request_id": request_id,
+                    "endpoint": ctx.endpoint,
+                    "model": ctx.model,
+                    "ms": round(seconds * 1000, 2),
+                    "spans": ctx.spans,
+                }
+                while len(_traces) > _MAX_TRACES:
+                    _traces.popitem(last=False)
+            _current.reset(token)
+
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line, carrying the request ID of the current request"""
+
+    _RESERVED = set(vars(logging.makeLogRecord({})))
+
+    def format(self, record: logging.LogRecord) -> str:
+        ctx = _current.get()
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": ctx.request_id if ctx else None,
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in self._RESERVED and k != "message"})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = "INFO"):
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonLogFormatter())
+    root = logging.getLogger("meda")
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    root.propagate = False
@@ -0,0 +1,69 @@
+"""
+Admission and slot release of the debate scheduler
+
+    cd python_backend
+    python -m pytest tests
+"""
+import asyncio
+import threading
+
+from debate_scheduler import DebateScheduler
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_slot_held_until_worker_returns():
+    async def scenario():
+        scheduler = DebateScheduler(workers=1, max_queue=4)
+        ticket = scheduler.reserve("m")
+        await ticket.wait_admitted()
+        finish = threading.Event()
+        # The debate's coroutine gives up while its worker thread is still mid-round
+        work = asyncio.ensure_future(asyncio.get_running_loop().run_in_executor(ticket, finish.wait))
+        await asyncio.sleep(0.05)
+        work.cancel()
+        ticket.release()
+        follower = scheduler.reserve("m")
+        assert scheduler.stats()["debates_running"] == 1 and follower.position == 1
+
+        finish.set()
+        await asyncio.wait_for(follower.wait_admitted(), 1.0)
+        assert scheduler.completed == 1
+        follower.release()
+        assert scheduler.stats()["debates_running"] == 0
+        scheduler.shutdown()
+
+    run(scenario())
+
+
+def test_release_without_work_frees_at_once():
+    async def scenario():
+        scheduler = DebateScheduler(workers=1, max_queue=4)
+        ticket = scheduler.reserve("m")
+        await ticket.wait_admitted()
+        assert await asyncio.get_running_loop().run_in_executor(ticket, sum, [1, 2]) == 3
+        ticket.release()
+        ticket.release()
+        assert scheduler.stats()["debates_running"] == 0 and scheduler.completed == 1
+        scheduler.shutdown()
+
+    run(scenario())
+
+
+def test_model_cap_does_not_block_other_models():
+    async def scenario():
+        scheduler = DebateScheduler(workers=3, max_queue=4, model_limits={"big": 1})
+        first = scheduler.reserve("big")
+        second = scheduler.reserve("big")
+        other = scheduler.reserve("small", {"Patient": "big"})
+        plain = scheduler.reserve("small")
+        assert first.admitted.is_set() and plain.admitted.is_set()
+        assert second.position == 1 and other.position == 2
+        first.release()
+        await asyncio.sleep(0)
+        assert second.admitted.is_set() and scheduler.stats()["running"] == {"big": 1, "small": 1}
+        scheduler.shutdown()
+
+    run(scenario())
@@ -0,0 +1,181 @@
+"""
+Retry, fallback, fail-fast and pacing policy of the rate-limited Groq transports
+
+    cd python_backend
+    python -m pytest tests
+"""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import rate_limits
+from rate_limits import AsyncRateLimitedTransport, GroqRateLimiter, RateLimitedTransport, parse_duration
+
+MODEL = "llama-3.3-70b-versatile"
+SIBLING = "openai/gpt-oss-120b"
+URL = "https://api.groq.com/openai/v1/chat/completions"
+MESSAGES = [{"role": "user", "content": "Fever, neck stiffness and confusion for one day"}]
+
+
+class FakeGroq:
+    """MockTransport handler answering chat completions, with scripted failures"""
+
+    def __init__(self, statuses=(), unavailable=()):
+        # Status of each successive call (200 once they run out)
+        self.statuses = list(statuses)
+        # Models that always answer 429 with a long Retry-After
+        self.unavailable = set(unavailable)
+        self.calls_by_model = {}
+
+    @property
+    def calls(self) -> int:
+        return sum(self.calls_by_model.values())
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        model = json.loads(request.content)["model"]
+        self.calls_by_model[model] = self.calls_by_model.get(model, 0) + 1
+        if model in self.unavailable:
+            return httpx.Response(429, headers={"retry-after": "60"}, json={"error": "rate limited"})
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status != 200:
+            return httpx.Response(status, json={"error": "unavailable"})
+        return httpx.Response(200, json={"model": model, "choices": [{"message": {"content": "ok"}}]})
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Seconds the transports would have slept, without sleeping them"""
+    slept = []
+    monkeypatch.setattr(rate_limits.time, "sleep", slept.append)
+
+    async def record(seconds):
+        slept.append(seconds)
+
+    monkeypatch.setattr(rate_limits.asyncio, "sleep", record)
+    return slept
+
+
+def client(limiter: GroqRateLimiter, server: FakeGroq) -> httpx.Client:
+    return httpx.Client(transport=RateLimitedTransport(limiter, httpx.MockTransport(server)))
+
+
+def completion(http_client: httpx.Client, model: str = MODEL) -> httpx.Response:
+    return http_client.post(URL, json={"model": model, "messages": MESSAGES, "max_tokens": 64})
+
+
+def test_parse_duration():
+    assert parse_duration("7.66s") == pytest.approx(7.66)
+    assert parse_duration("2m59.56s") == pytest.approx(179.56)
+    assert parse_duration("120ms") == pytest.approx(0.12)
+    assert parse_duration("3") == 3.0
+    assert parse_duration("") is None
+    assert parse_duration("soon") is None
+
+
+def test_retries_5xx_until_success(sleeps):
+    server = FakeGroq(statuses=[503, 502, 500])
+    limiter = GroqRateLimiter(max_retries=3, backoff_base=0.01)
+    with client(limiter, server) as http_client:
+        response = completion(http_client)
+    assert response.status_code == 200
+    assert server.calls == 4 and limiter.retries == 3
+    assert len(sleeps) == 3
+
+
+def test_gives_up_after_max_retries(sleeps):
+    server = FakeGroq(statuses=[503] * 10)
+    limiter = GroqRateLimiter(max_retries=2, backoff_base=0.01)
+    with client(limiter, server) as http_client:
+        response = completion(http_client)
+    assert response.status_code == 503
+    assert server.calls == 3 and limiter.retries == 2
+
+
+def test_retries_connection_errors(sleeps):
+    failures = [httpx.ConnectError("refused")]
+    server = FakeGroq()
+
+    def handler(request):
+        if failures:
+            raise failures.pop()
+        return server(request)
+
+    limiter = GroqRateLimiter(max_retries=2, backoff_base=0.01)
+    with httpx.Client(transport=RateLimitedTransport(limiter, httpx.MockTransport(handler))) as http_client:
+        response = completion(http_client)
+    assert response.status_code == 200 and limiter.retries == 1
+
+
+def test_unavailable_model_fails_over_without_waiting(sleeps):
+    server = FakeGroq(unavailable=[MODEL])
+    limiter = GroqRateLimiter(fallbacks={MODEL: SIBLING}, max_wait=2.0)
+    with client(limiter, server) as http_client:
+        response = completion(http_client)
+    assert response.status_code == 200 and response.json()["model"] == SIBLING
+    assert limiter.fallback_count == 1
+    assert server.calls_by_model == {MODEL: 1, SIBLING: 1}
+    assert sum(sleeps) == 0
+
+
+def test_long_retry_after_without_fallback_fails_fast(sleeps):
+    server = FakeGroq(unavailable=[MODEL])
+    limiter = GroqRateLimiter(max_retries=3, max_wait=2.0)
+    with client(limiter, server) as http_client:
+        response = completion(http_client)
+    assert response.status_code == 429 and server.calls == 1
+    assert sum(sleeps) == 0
+
+
+def test_backoff_capped_at_max_wait():
+    limiter = GroqRateLimiter(backoff_base=0.5, backoff_max=20.0, max_wait=2.0)
+    assert limiter.backoff(10, retry_after=60.0) == 2.0
+    assert limiter.backoff(0, retry_after=1.5) == 1.5
+    assert 0 <= limiter.backoff(0, retry_after=None) <= 0.5
+
+
+def test_reserve_paces_from_headers():
+    limiter = GroqRateLimiter(fallbacks={MODEL: SIBLING}, max_wait=0.5)
+    headers = {"x-ratelimit-limit-tokens": "1000", "x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "2s"}
+    limiter.observe(MODEL, httpx.Response(200, headers=headers))
+    # Refills at 1000 tokens / 2 s: 500 tokens are 1 s away, capped at max_wait
+    assert limiter.reserve(MODEL, 500, has_fallback=False) == pytest.approx(0.5)
+    # With a fallback the caller fails over instead of waiting
+    assert limiter.reserve(MODEL, 500, has_fallback=True) is None
+    assert limiter.reserve(SIBLING, 500, has_fallback=False) == 0.0
+
+
+def test_transport_sleeps_for_token_budget(sleeps):
+    limiter = GroqRateLimiter(max_wait=5.0)
+    headers = {"x-ratelimit-limit-tokens": "100", "x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "1s"}
+    limiter.observe(MODEL, httpx.Response(200, headers=headers))
+    with client(limiter, FakeGroq()) as http_client:
+        response = completion(http_client)
+    # 100 tokens / s, and the request is about 76 tokens
+    assert response.status_code == 200
+    assert len(sleeps) == 1 and 0.6 < sleeps[0] < 1.0
+
+
+def test_other_requests_pass_through(sleeps):
+    server = FakeGroq(unavailable=[MODEL])
+    limiter = GroqRateLimiter(fallbacks={MODEL: SIBLING})
+    models = httpx.MockTransport(lambda request: httpx.Response(200, json={"data": []}))
+    with httpx.Client(transport=RateLimitedTransport(limiter, models)) as http_client:
+        assert http_client.get("https://api.groq.com/openai/v1/models").status_code == 200
+    assert server.calls == 0 and limiter.retries == 0
+
+
+def test_async_transport_retries_and_fails_over(sleeps):
+    server = FakeGroq(statuses=[503], unavailable=[MODEL])
+    limiter = GroqRateLimiter(fallbacks={MODEL: SIBLING}, backoff_base=0.01, max_wait=2.0)
+
+    async def run():
+        transport = AsyncRateLimitedTransport(limiter, httpx.MockTransport(server))
+        async with httpx.AsyncClient(transport=transport) as http_client:
+            return await http_client.post(URL, json={"model": MODEL, "messages": MESSAGES, "max_tokens": 64})
+
+    response = asyncio.run(run())
+    assert response.status_code == 200 and response.json()["model"] == SIBLING
+    assert server.calls_by_model == {MODEL: 1, SIBLING: 2}
+    assert limiter.fallback_count == 1 and limiter.retries == 1
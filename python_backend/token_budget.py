@@ -0,0 +1,296 @@
+"""
+Token and cost accounting per request and per tenant, with budgets
+
+Every LLM call a request makes (agent iterations, debate turns, routing, moderation,
+summaries) reports its usage through telemetry.record_tokens, which charges the request's
+RequestBudget (found through a context variable, so debate threads started by the request
+charge it too) and the tenant's TenantLedger.
+
+A request whose prompt or completion tokens reach its budget finishes early instead of
+failing: an agent stops before an LLM call that would go over the prompt budget and a
+streamed answer is cut off at the completion budget; a debate stops between rounds like
+at its deadline, and its last turn's max_tokens is clamped to what is left. Usage is
+reported in X-Usage-* headers or a {"type": "usage"} event before [DONE].
+
+A tenant (X-Tenant-ID) over its token quota for the current window gets 429 until the
+window rolls over.
+"""
+import contextvars
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+from sessions import estimate_tokens
+
+BUDGET_STOPPED_REPLY = (
+    "I couldn't finish this answer within the token budget for a single request. "
+    "Please try a narrower question."
+)
+
+
+class BudgetExceeded(Exception):
+    """Raised before (or during) an LLM call that would go over the request's budget"""
+
+    def __init__(self, reason: str, partial: str = ""):
+        super().__init__(reason)
+        self.reason = reason
+        # What a streamed completion had produced when it was cut off
+        self.partial = partial
+
+
+class TenantQuotaExceeded(Exception):
+    """The tenant has used its token quota for the current window"""
+
+    status_code = 429
+
+    def __init__(self, tenant: str, retry_after: int):
+        super().__init__(f"Token quota of tenant {tenant} used up; retry in {retry_after} s")
+        self.detail = str(self)
+        self.retry_after = retry_after
+
+
+def llm_cost(model: str, prompt_tokens: int, completion_tokens: int, prices: Dict[str, List[float]]) -> float:
+    """USD cost of a call, from per-million-token [prompt, completion] prices (0 for unknown models)"""
+    prompt_price, completion_price = prices.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+class TenantLedger:
+    """Token usage per tenant in fixed windows, with optional quotas; thread-safe"""
+
+    def __init__(self, window_seconds: float = 86400, limits: Optional[Dict[str, int]] = None, default_limit: Optional[int] = None):
+        """
+        Args:
+            window_seconds: Length of a quota window (usage resets when the next one starts)
+            limits: Total tokens per window by tenant
+            default_limit: Quota of tenants not in limits (None: unlimited)
+        """
+        self.window_seconds = window_seconds
+        self.limits = limits or {}
+        self.default_limit = default_limit
+        self._lock = threading.Lock()
+        self._usage: Dict[str, Dict[str, Any]] = {}
+
+    def _entry(self, tenant: str) -> Dict[str, Any]:
+        window = int(time.time() // self.window_seconds)
+        entry = self._usage.get(tenant)
+        if entry is None or entry["window"] != window:
+            entry = self._usage[tenant] = {
+                "window": window, "requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0,
+            }
+        return entry
+
+    def limit(self, tenant: str) -> Optional[int]:
+        return self.limits.get(tenant, self.default_limit)
+
+    def remaining(self, tenant: str) -> Optional[int]:
+        """Tokens left in the tenant's current window, or None if unlimited"""
+        limit = self.limit(tenant)
+        if limit is None:
+            return None
+        with self._lock:
+            entry = self._entry(tenant)
+            return max(0, limit - entry["prompt_tokens"] - entry["completion_tokens"])
+
+    def admit(self, tenant: str):
+        """Count a new request; raise TenantQuotaExceeded if the tenant's quota is used up"""
+        if self.remaining(tenant) == 0:
+            retry_after = self.window_seconds - time.time() % self.window_seconds
+            raise TenantQuotaExceeded(tenant, int(retry_after) + 1)
+        with self._lock:
+            self._entry(tenant)["requests"] += 1
+
+    def charge(self, tenant: str, prompt_tokens: int, completion_tokens: int, cost: float):
+        with self._lock:
+            entry = self._entry(tenant)
+            entry["prompt_tokens"] += prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+            entry["cost_usd"] += cost
+
+    def usage(self, tenant: str) -> Dict[str, Any]:
+        with self._lock:
+            entry = dict(self._entry(tenant))
+        entry.pop("window")
+        entry["cost_usd"] = round(entry["cost_usd"], 6)
+        entry["limit"] = self.limit(tenant)
+        entry["remaining"] = self.remaining(tenant)
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tenants = list(self._usage)
+        return {"window_seconds": self.window_seconds, "tenants": {tenant: self.usage(tenant) for tenant in tenants}}
+
+
+class RequestBudget:
+    """Usage and limits of one request; thread-safe (debate turns charge it from worker threads)"""
+
+    def __init__(
+        self,
+        max_prompt_tokens: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        tenant: str = "anonymous",
+        ledger: Optional[TenantLedger] = None,
+        prices: Optional[Dict[str, List[float]]] = None,
+    ):
+        """
+        Args:
+            max_prompt_tokens: Prompt tokens over all of the request's LLM calls (None: unlimited)
+            max_completion_tokens: Completion tokens over all of its calls (None: unlimited)
+            tenant: Who the usage is charged to
+            ledger: Tenant usage and quotas; the tenant's remaining quota also caps this request
+            prices: USD per million [prompt, completion] tokens by model
+        """
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_completion_tokens = max_completion_tokens
+        self.tenant = tenant
+        self.ledger = ledger
+        self.prices = prices or {}
+        self.tenant_remaining = ledger.remaining(tenant) if ledger is not None else None
+        self._lock = threading.Lock()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.calls = 0
+        self.cost = 0.0
+        self.stopped: Optional[str] = None
+
+    def charge(self, model: str, prompt_tokens: int, completion_tokens: int):
+        cost = llm_cost(model, prompt_tokens, completion_tokens, self.prices)
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.calls += 1
+            self.cost += cost
+        if self.ledger is not None:
+            self.ledger.charge(self.tenant, prompt_tokens, completion_tokens, cost)
+
+    def exceeded(self) -> Optional[str]:
+        """Why the request can't make another LLM call, or None"""
+        if self.max_prompt_tokens is not None and self.prompt_tokens >= self.max_prompt_tokens:
+            return "prompt token budget"
+        if self.max_completion_tokens is not None and self.completion_tokens >= self.max_completion_tokens:
+            return "completion token budget"
+        if self.tenant_remaining is not None and self.prompt_tokens + self.completion_tokens >= self.tenant_remaining:
+            return "tenant token quota"
+        return None
+
+    def check_call(self, prompt_estimate: int):
+        """Raise BudgetExceeded if a call with about prompt_estimate prompt tokens would go over"""
+        reason = self.exceeded()
+        if reason is None and self.max_prompt_tokens is not None and self.prompt_tokens + prompt_estimate > self.max_prompt_tokens:
+            reason = "prompt token budget"
+        if reason is not None:
+            self.stop(reason)
+            raise BudgetExceeded(reason)
+
+    def completion_allowance(self, requested: Optional[int] = None) -> Optional[int]:
+        """max_tokens for the next call: requested, lowered to what the budgets have left"""
+        left = [requested] if requested is not None else []
+        if self.max_completion_tokens is not None:
+            left.append(self.max_completion_tokens - self.completion_tokens)
+        if self.tenant_remaining is not None:
+            left.append(self.tenant_remaining - self.prompt_tokens - self.completion_tokens)
+        return max(1, min(left)) if left else None
+
+    def stop(self, reason: str):
+        """Record why the request finished early (the first reason wins)"""
+        if self.stopped is None:
+            self.stopped = reason
+            # Deferred: telemetry imports this module
+            import telemetry
+
+            telemetry.record_budget_stop(reason)
+
+    def usage(self) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+            "llm_calls": self.calls,
+            "cost_usd": round(self.cost, 6),
+            "budget": {"prompt_tokens": self.max_prompt_tokens, "completion_tokens": self.max_completion_tokens},
+            "tenant": self.tenant,
+            "stopped": self.stopped,
+        }
+
+    def event(self) -> Dict[str, Any]:
+        """SSE trailer sent before [DONE]"""
+        return {"type": "usage", **self.usage()}
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "X-Usage-Prompt-Tokens": str(self.prompt_tokens),
+            "X-Usage-Completion-Tokens": str(self.completion_tokens),
+            "X-Usage-LLM-Calls": str(self.calls),
+            "X-Usage-Cost-USD": f"{self.cost:.6f}",
+        }
+        if self.stopped:
+            headers["X-Budget-Stopped"] = self.stopped
+        return headers
+
+
+_current: contextvars.ContextVar[Optional[RequestBudget]] = contextvars.ContextVar("meda_token_budget", default=None)
+
+
+def current() -> Optional[RequestBudget]:
+    return _current.get()
+
+
+def use(budget: RequestBudget):
+    """Make budget the current request's; tasks and debate threads started afterwards inherit it"""
+    _current.set(budget)
+
+
+def charge(model: str, prompt_tokens: int, completion_tokens: int):
+    """Charge a finished LLM call to the current request's budget, if there is one"""
+    budget = _current.get()
+    if budget is not None and (prompt_tokens or completion_tokens):
+        budget.charge(model, prompt_tokens, completion_tokens)
+
+
+class BudgetCallbackHandler(AsyncCallbackHandler):
+    """
+    LangChain callbacks enforcing a RequestBudget: each LLM call is checked before it starts,
+    and a streamed completion is cut off (BudgetExceeded) once it would go over.
+    """
+
+    raise_error = True
+
+    def __init__(self, budget: RequestBudget, model: str):
+        self.budget = budget
+        self.model = model
+        self._prompts: Dict[UUID, int] = {}
+        self._streamed: Dict[UUID, List[str]] = {}
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs):
+        estimate = sum(estimate_tokens(str(m.content)) for batch in messages for m in batch)
+        self._prompts[run_id] = estimate
+        self.budget.check_call(estimate)
+
+    async def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs):
+        if not token:
+            return
+        streamed = self._streamed.setdefault(run_id, [])
+        streamed.append(token)
+        allowance = self.budget.completion_allowance()
+        # Streamed chunks are about a token each
+        if allowance is not None and len(streamed) >= allowance:
+            # The provider never reports usage for a call cut short: charge the estimate
+            import telemetry
+
+            del self._streamed[run_id]
+            telemetry.record_tokens(self._prompts.pop(run_id, 0), len(streamed), self.model)
+            reason = self.budget.exceeded() or "completion token budget"
+            self.budget.stop(reason)
+            raise BudgetExceeded(reason, "".join(streamed))
+
+    async def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        self._prompts.pop(run_id, None)
+        self._streamed.pop(run_id, None)
+
+    async def on_llm_error(self, error, *, run_id: UUID, **kwargs):
+        self._prompts.pop(run_id, None)
+        self._streamed.pop(run_id, None)
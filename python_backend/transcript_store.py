@@ -0,0 +1,206 @@
+"""
+Persistent store of finished debate transcripts for deterministic replay
+
+A debate requested with a seed is stored under a key built from the normalized symptoms,
+model, per-role models, max_rounds and seed; the same request is then served from the
+store instead of running the multi-round conversation again. Total size is bounded, least recently used
+transcripts are evicted first.
+
+With a distributed STATE_BACKEND, SharedTranscriptStore keeps them in the shared backend
+instead, so a transcript stored by one worker is replayed by all of them.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from response_cache import normalize_text
+from shared_state import StateBackend
+
+
+def transcript_key(
+    symptoms: str, model: str, max_rounds: int, seed: int, role_models: Optional[Dict[str, str]] = None
+) -> str:
+    parts = [normalize_text(symptoms), model, max_rounds, seed]
+    if role_models:
+        parts.append(sorted(role_models.items()))
+    payload = json.dumps(parts, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class TranscriptStore:
+    """SQLite-backed transcript store with a total size limit; thread-safe"""
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024):
+        """
+        Args:
+            path: SQLite file (":memory:" for a store that doesn't survive restarts)
+            max_bytes: Total size of stored transcripts before the least recently used are evicted
+        """
+        self.max_bytes = max_bytes
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        with self._lock:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS transcripts ("
+                "key TEXT PRIMARY KEY, symptoms TEXT, model TEXT, max_rounds INTEGER, seed INTEGER, "
+                "data TEXT, size INTEGER, created_at REAL, last_used REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS transcripts_last_used ON transcripts (last_used)")
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """The stored transcript ({"messages", "turn_seconds"}) or None"""
+        with self._lock:
+            row = self._db.execute("SELECT data FROM transcripts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE transcripts SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+        return json.loads(row[0])
+
+    def put(
+        self,
+        key: str,
+        symptoms: str,
+        model: str,
+        max_rounds: int,
+        seed: int,
+        messages: List[Dict[str, Any]],
+        turn_seconds: List[float],
+    ):
+        """
+        Store a finished debate
+
+        Args:
+            messages: Debate messages as returned by MedicalDebateSystem.run_debate
+            turn_seconds: Seconds each message took to generate, used for paced replay
+        """
+        data = json.dumps(
+            {"messages": messages, "turn_seconds": [round(s, 3) for s in turn_seconds]},
+            separators=(",", ":"),
+        )
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO transcripts "
+                "(key, symptoms, model, max_rounds, seed, data, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, symptoms, model, max_rounds, seed, data, len(data), now, now),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+        while total > self.max_bytes:
+            row = self._db.execute("SELECT key, size FROM transcripts ORDER BY last_used LIMIT 1").fetchone()
+            if row is None:
+                break
+            self._db.execute("DELETE FROM transcripts WHERE key = ?", (row[0],))
+            total -= row[1]
+            self.evictions += 1
+
+    def purge(self, key: Optional[str] = None, model: Optional[str] = None) -> int:
+        """Delete one transcript, all for a model, or everything; returns how many"""
+        query, params = "DELETE FROM transcripts", []
+        if key is not None:
+            query, params = query + " WHERE key = ?", [key]
+        elif model is not None:
+            query, params = query + " WHERE model = ?", [model]
+        with self._lock:
+            deleted = self._db.execute(query, params).rowcount
+            self._db.commit()
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transcripts").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "entries": count,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+class SharedTranscriptStore:
+    """
+    TranscriptStore with the same interface over a shared_state backend
+
+    Transcripts expire ttl seconds after they were last stored or replayed (the backend,
+    e.g. Redis' maxmemory policy, bounds the total size). Purging by model scans every transcript.
+    """
+
+    def __init__(self, backend: StateBackend, ttl: float = 7 * 86400):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        record = self.backend.get_json(f"transcript:{key}")
+        with self._lock:
+            if record is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        # Replayed transcripts stay
+        self.backend.expire(f"transcript:{key}", self.ttl)
+        return {"messages": record["messages"], "turn_seconds": record["turn_seconds"]}
+
+    def put(
+        self,
+        key: str,
+        symptoms: str,
+        model: str,
+        max_rounds: int,
+        seed: int,
+        messages: List[Dict[str, Any]],
+        turn_seconds: List[float],
+    ):
+        """Store a finished debate (see TranscriptStore.put)"""
+        record = {
+            "symptoms": symptoms,
+            "model": model,
+            "max_rounds": max_rounds,
+            "seed": seed,
+            "messages": messages,
+            "turn_seconds": [round(s, 3) for s in turn_seconds],
+            "created_at": time.time(),
+        }
+        self.backend.set_json(f"transcript:{key}", record, ttl=self.ttl)
+
+    def purge(self, key: Optional[str] = None, model: Optional[str] = None) -> int:
+        """Delete one transcript, all for a model, or everything; returns how many"""
+        if key is not None:
+            return self.backend.delete(f"transcript:{key}")
+        keys = self.backend.keys("transcript:")
+        if model is not None:
+            keys = [k for k in keys if (self.backend.get_json(k) or {}).get("model") == model]
+        return self.backend.delete(*keys) if keys else 0
+
+    def stats(self) -> Dict[str, Any]:
+        entries = len(self.backend.keys("transcript:"))
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "backend": self.backend.name,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }